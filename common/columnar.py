@@ -0,0 +1,324 @@
+import io
+import struct
+from typing import Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Binary COPY layout of the fixed-width types, by type OID: (big-endian dtype, width, native dtype)
+FIXED_WIDTH_TYPES = {
+    16: ("?", 1, "bool"),                   # bool
+    21: (">i2", 2, "int16"),                # int2
+    23: (">i4", 4, "int32"),                # int4
+    20: (">i8", 8, "int64"),                # int8
+    700: (">f4", 4, "float32"),             # float4
+    701: (">f8", 8, "float64"),             # float8
+    1082: (">i4", 4, "datetime64[D]"),      # date, days since 2000-01-01
+    1114: (">i8", 8, "datetime64[us]"),     # timestamp, microseconds since 2000-01-01
+}
+# PostgreSQL counts dates and timestamps from 2000-01-01, NumPy from 1970-01-01
+EPOCH_OFFSET = {"datetime64[D]": 10957, "datetime64[us]": 946684800000000}
+
+# Arrow types of the variable-width types by type OID, the other types are inferred from the values
+TEXT_TYPES = (18, 19, 25, 1042, 1043)           # char, name, text, bpchar, varchar
+TEXT_ARRAY_TYPES = (1002, 1009, 1014, 1015)     # their arrays
+
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+# Signature, flags field and header extension length
+COPY_HEADER_SIZE = len(COPY_SIGNATURE) + 8
+
+
+def _native(values, native: str):
+    # Convert big-endian COPY values to native NumPy values
+    if native in EPOCH_OFFSET:
+        return (values.astype("int64") + EPOCH_OFFSET[native]).astype(native)
+    return values.astype(native)
+
+
+class BinaryCopyReader(io.RawIOBase):
+    """
+    This class is a file-like target for cursor.copy_expert() that parses binary COPY output into NumPy arrays.
+
+    Rows of fixed-width columns have a fixed size, so every complete run of rows is parsed with a single
+    np.frombuffer() call and no Python object is created per row. Rows with NULL values are parsed one by one
+    into masked arrays, so a column keeps its type whether or not its chunk holds a NULL.
+    """
+
+    def __init__(self, names: List[str], type_codes: List[int], chunk_size: int, on_chunk: Callable[[Dict[str, "np.ndarray"]], None]):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        names (list): The names of the columns.
+        type_codes (list): The type OIDs of the columns, all of them must be in FIXED_WIDTH_TYPES.
+        chunk_size (int): The number of rows passed to on_chunk at once.
+        on_chunk (callable): The function called with a dictionary of column arrays for every chunk.
+        """
+        super().__init__()
+        self.names = names
+        self.types = [FIXED_WIDTH_TYPES[type_code] for type_code in type_codes]
+        fields = [("fields", ">i2")]
+        for i, (fmt, _, _) in enumerate(self.types):
+            fields += [(f"length{i}", ">i4"), (f"value{i}", fmt)]
+        self.dtype = np.dtype(fields)
+        self.chunk_bytes = max(1, chunk_size) * self.dtype.itemsize
+        self.on_chunk = on_chunk
+        self.buffer = bytearray()
+        self.header_done = False
+        self.rows = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if not self.header_done:
+            if len(self.buffer) < COPY_HEADER_SIZE:
+                return len(data)
+            if bytes(self.buffer[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+                raise ValueError("Invalid binary COPY signature")
+            extension = struct.unpack_from(">i", self.buffer, len(COPY_SIGNATURE) + 4)[0]
+            if len(self.buffer) < COPY_HEADER_SIZE + extension:
+                return len(data)
+            del self.buffer[:COPY_HEADER_SIZE + extension]
+            self.header_done = True
+
+        while len(self.buffer) >= self.chunk_bytes:
+            self._parse(self.chunk_bytes // self.dtype.itemsize)
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        # Parse what is left before the two-byte trailer
+        if self.header_done and len(self.buffer) > 2:
+            count, rest = divmod(len(self.buffer) - 2, self.dtype.itemsize)
+            if rest == 0:
+                self._parse(count)
+            else:
+                self._parse_rows()
+        super().close()
+
+    def _parse(self, count: int):
+        size = count * self.dtype.itemsize
+        records = np.frombuffer(bytes(self.buffer[:size]), dtype=self.dtype)
+        valid = (records["fields"] == len(self.types)).all() and all(
+            (records[f"length{i}"] == width).all() for i, (_, width, _) in enumerate(self.types)
+        )
+        if not valid:
+            self._parse_rows()
+            return
+
+        del self.buffer[:size]
+        self.rows += count
+        self.on_chunk({name: _native(records[f"value{i}"], native) for i, (name, (_, _, native)) in enumerate(zip(self.names, self.types))})
+
+    def _parse_rows(self):
+        # NULLs change the row size, so the rows up to the end of the buffer are read one by one
+        columns = [[] for _ in self.types]
+        offset = 0
+        while offset + 2 <= len(self.buffer):
+            fields = struct.unpack_from(">h", self.buffer, offset)[0]
+            if fields == -1:
+                break
+            end = offset + 2
+            row = []
+            for fmt, width, native in self.types:
+                if end + 4 > len(self.buffer):
+                    break
+                length = struct.unpack_from(">i", self.buffer, end)[0]
+                end += 4
+                if length == -1:
+                    row.append(None)
+                    continue
+                if end + length > len(self.buffer):
+                    break
+                row.append(_native(np.frombuffer(bytes(self.buffer[end:end + length]), dtype=fmt), native)[0])
+                end += length
+            if len(row) != len(self.types):
+                break
+            for column, value in zip(columns, row):
+                column.append(value)
+            offset = end
+
+        del self.buffer[:offset]
+        self.rows += len(columns[0])
+        chunk = {}
+        for name, column, (_, _, native) in zip(self.names, columns, self.types):
+            # The masked entries hold zero, NumPy ignores them
+            mask = np.array([value is None for value in column], dtype=bool)
+            values = np.zeros(len(column), dtype=native)
+            values[~mask] = [value for value in column if value is not None]
+            chunk[name] = np.ma.MaskedArray(values, mask=mask) if mask.any() else values
+        self.on_chunk(chunk)
+
+
+def _object_array(values) -> "np.ndarray":
+    # np.array() would turn lists of the same length, e.g. text[] values, into a second dimension
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def fetch_columns(conn, query: str, params, chunk_size: int, on_chunk: Callable[[Dict[str, "np.ndarray"]], None],
+                  on_columns: Optional[Callable[[List[str], List[int]], None]] = None) -> int:
+    """
+    This function is used to stream the result of a query column by column, chunk by chunk.
+
+    If every result column has a fixed-width type the rows are read with binary COPY and parsed straight into
+    NumPy arrays, NULLs are masked. Otherwise the rows are read through a server-side cursor, chunk_size rows
+    at a time, into arrays of Python objects with None for NULL.
+
+    Parameters:
+    conn (psycopg2.extensions.connection): The connection to run the query on.
+    query (str): The SELECT query to read.
+    params (list, tuple or dict): The values to bind to the placeholders of the query.
+    chunk_size (int): The number of rows passed to on_chunk at once.
+    on_chunk (callable): The function called with a dictionary of column arrays for every chunk.
+    on_columns (callable, optional): The function called with the names and the type OIDs of the result columns
+        before the first chunk, e.g. to build arrow_types(). Defaults to None.
+
+    Returns:
+    rows (int): The number of rows read.
+    """
+    query = query.rstrip().rstrip(";")
+    with conn.cursor() as cur:
+        query = cur.mogrify(query, params).decode()
+        # The result types decide between binary COPY and the cursor
+        cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+        names = [column.name for column in cur.description]
+        type_codes = [column.type_code for column in cur.description]
+        if on_columns is not None:
+            on_columns(names, type_codes)
+
+        if all(type_code in FIXED_WIDTH_TYPES for type_code in type_codes):
+            reader = BinaryCopyReader(names, type_codes, chunk_size, on_chunk)
+            cur.copy_expert(f"COPY ({query}) TO STDOUT (FORMAT binary)", reader)
+            reader.close()
+            return reader.rows
+
+    rows = 0
+    with conn.cursor(name="columnar") as cur:
+        cur.itersize = chunk_size
+        cur.execute(query)
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            rows += len(chunk)
+            on_chunk({name: _object_array(column) for name, column in zip(names, zip(*chunk))})
+    return rows
+
+
+def concat_chunks(chunks: List[Dict[str, "np.ndarray"]], names: Optional[List[str]] = None, type_codes: Optional[List[int]] = None) -> Dict[str, "np.ndarray"]:
+    """
+    This function is used to join column chunks into one array per column.
+
+    Parameters:
+    chunks (list): The chunks passed to on_chunk by fetch_columns().
+    names (list, optional): The names of the columns, used when there are no chunks. Defaults to None.
+    type_codes (list, optional): The type OIDs of the columns, e.g. passed to on_columns by fetch_columns(). Used when
+        there are no chunks, so an empty column has the dtype fetch_columns() gives its values. Defaults to None, which means object.
+
+    Returns:
+    columns (dict): A dictionary of one NumPy array per column, masked if any of its chunks holds a NULL.
+    """
+    if len(chunks) == 0:
+        type_codes = type_codes or [None] * len(names or [])
+        # The columns that are not read with binary COPY are arrays of Python objects
+        return {name: np.array([], dtype=FIXED_WIDTH_TYPES[type_code][2] if type_code in FIXED_WIDTH_TYPES else object)
+                for name, type_code in zip(names or [], type_codes)}
+    columns = {}
+    for name in chunks[0]:
+        parts = [chunk[name] for chunk in chunks]
+        masked = any(isinstance(part, np.ma.MaskedArray) for part in parts)
+        columns[name] = np.ma.concatenate(parts) if masked else np.concatenate(parts)
+    return columns
+
+
+def arrow_types(type_codes: List[int]) -> list:
+    """
+    This function is used to get the Arrow types of result columns from their type OIDs.
+
+    Parameters:
+    type_codes (list): The type OIDs of the columns, e.g. passed to on_columns by fetch_columns().
+
+    Returns:
+    types (list): The Arrow type of every column, None for the types that are inferred from the values.
+    """
+    types = []
+    for type_code in type_codes:
+        if type_code in FIXED_WIDTH_TYPES:
+            types.append(pa.from_numpy_dtype(np.dtype(FIXED_WIDTH_TYPES[type_code][2])))
+        elif type_code in TEXT_TYPES:
+            types.append(pa.string())
+        elif type_code in TEXT_ARRAY_TYPES:
+            types.append(pa.list_(pa.string()))
+        else:
+            types.append(None)
+    return types
+
+
+def chunk_table(chunk: Dict[str, "np.ndarray"], names: Optional[List[str]] = None, types: Optional[list] = None):
+    """
+    This function is used to convert one column chunk into an Arrow table.
+
+    Parameters:
+    chunk (dict): The chunk passed to on_chunk by fetch_columns().
+    names (list, optional): The names of the columns, in order. Defaults to None, which means the keys of the chunk.
+    types (list, optional): The Arrow types of the columns, see arrow_types(). Defaults to None, which means inferred.
+
+    Returns:
+    table (pyarrow.Table): The table, masked values are null.
+    """
+    names = list(chunk) if names is None else names
+    types = types or [None] * len(names)
+    arrays = []
+    for name, arrow_type in zip(names, types):
+        values = chunk[name]
+        if isinstance(values, np.ma.MaskedArray):
+            arrays.append(pa.array(values.data, mask=np.ma.getmaskarray(values), type=arrow_type))
+        else:
+            arrays.append(pa.array(values, type=arrow_type))
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def empty_table(names: List[str], types: Optional[list] = None):
+    """
+    This function is used to build an Arrow table without rows, e.g. for an empty result.
+
+    Parameters:
+    names (list): The names of the columns.
+    types (list, optional): The Arrow types of the columns, see arrow_types(). Defaults to None, which means null columns.
+
+    Returns:
+    table (pyarrow.Table): The table with the schema of the columns.
+    """
+    types = types or [None] * len(names)
+    return pa.schema([(name, arrow_type or pa.null()) for name, arrow_type in zip(names, types)]).empty_table()
+
+
+def to_arrow(chunks: List[Dict[str, "np.ndarray"]], names: Optional[List[str]] = None, types: Optional[list] = None):
+    """
+    This function is used to build an Arrow table from column chunks without joining the chunks.
+
+    Parameters:
+    chunks (list): The chunks passed to on_chunk by fetch_columns().
+    names (list, optional): The names of the columns, used when there are no chunks. Defaults to None.
+    types (list, optional): The Arrow types of the columns, see arrow_types(). Defaults to None, which means inferred.
+
+    Returns:
+    table (pyarrow.Table): The table with one record batch per chunk.
+    """
+    if len(chunks) == 0:
+        return empty_table(names or [], types)
+    names = list(chunks[0]) if names is None else names
+    # Inferred types can differ between chunks, e.g. null for a chunk of NULLs
+    return pa.concat_tables([chunk_table(chunk, names, types) for chunk in chunks], promote_options="permissive")
@@ -0,0 +1,137 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+from .columnar import arrow_types, chunk_table, empty_table, fetch_columns
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+def export_query(conn, query: str, params, path: str, fmt: str = "csv", chunk_size: int = 65536) -> int:
+    """
+    This function is used to write the result of a query to a file with constant memory.
+
+    CSV files are written by the server through COPY (...) TO STDOUT and streamed to the file as they arrive.
+    Parquet files are written chunk by chunk, one row group per chunk. The column types come from the result
+    columns, so a chunk with NULLs has the types of the others and an empty result keeps the columns.
+
+    Parameters:
+    conn (psycopg2.extensions.connection): The connection to run the query on.
+    query (str): The SELECT query to export.
+    params (list, tuple or dict): The values to bind to the placeholders of the query.
+    path (str): The path of the file to write.
+    fmt (str, optional): The file format, csv or parquet. Defaults to "csv".
+    chunk_size (int, optional): The number of rows per Parquet row group. Defaults to 65536.
+
+    Returns:
+    rows (int): The number of rows written.
+    """
+    if fmt == "csv":
+        with conn.cursor() as cur, open(path, "w", encoding="utf-8", newline="") as file:
+            query = cur.mogrify(query.rstrip().rstrip(";"), params).decode()
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", file)
+            return cur.rowcount
+
+    if pq is None:
+        raise ImportError("pyarrow is required for Parquet export")
+
+    writer = None
+    names, types = [], []
+
+    def read_columns(column_names, type_codes):
+        names.extend(column_names)
+        types.extend(arrow_types(type_codes))
+
+    def write_chunk(chunk):
+        nonlocal writer
+        table = chunk_table(chunk, names, types)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+
+    try:
+        rows = fetch_columns(conn, query, params, chunk_size, write_chunk, read_columns)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        pq.write_table(empty_table(names, types), path)
+    return rows
+
+
+def key_ranges(conn, table: str, key: str, parts: int) -> List[Tuple[int, int]]:
+    """
+    This function is used to split the integer primary key of a table into ranges of the same width.
+
+    Parameters:
+    conn (psycopg2.extensions.connection): The connection to run the query on.
+    table (str): The name of the table.
+    key (str): The name of the integer primary key column.
+    parts (int): The number of ranges.
+
+    Returns:
+    ranges (list): A list of (first, last) tuples, both bounds included. It is empty if the table is empty.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT min({key}), max({key}) FROM {table}")
+        first, last = cur.fetchone()
+    if first is None:
+        return []
+
+    width = max(1, -(-(last - first + 1) // parts))
+    return [(start, min(start + width - 1, last)) for start in range(first, last + 1, width)]
+
+
+def part_path(path: str, part: int) -> str:
+    """
+    This function is used to get the file name of one part of a parallel export, e.g. orders.part0.csv.
+
+    Parameters:
+    path (str): The path of the whole export.
+    part (int): The number of the part.
+
+    Returns:
+    path (str): The path of the part.
+    """
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.part{part}{suffix}"
+
+
+def export_parallel(connect: Callable, ranges: List[Tuple[int, int]], build_query: Callable, path: str, fmt: str, chunk_size: int) -> List[Tuple[str, int]]:
+    """
+    This function is used to export primary key ranges of a table on several connections at once, one file per range.
+
+    Parameters:
+    connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+    ranges (list): The (first, last) key ranges, one per worker.
+    build_query (callable): The function returning the (query, params) pair for a (first, last) range.
+    path (str): The path of the whole export, the parts are named by part_path().
+    fmt (str): The file format, csv or parquet.
+    chunk_size (int): The number of rows per Parquet row group.
+
+    Returns:
+    files (list): A list of (path, rows) tuples, one per range.
+    """
+    if len(ranges) == 0:
+        return []
+
+    def export_range(part: int) -> Tuple[str, int]:
+        conn, cur = connect()
+        if conn is None or cur is None:
+            raise ConnectionError("Unable to connect to the database")
+        cur.close()
+        try:
+            query, params = build_query(*ranges[part])
+            rows = export_query(conn, query, params, part_path(path, part), fmt, chunk_size)
+            conn.commit()
+            return part_path(path, part), rows
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        return list(executor.map(export_range, range(len(ranges))))
@@ -0,0 +1,340 @@
+import re
+from abc import ABC, abstractmethod
+from typing import Any, List, Set, Tuple
+
+IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$")
+COMPARISON_OPERATORS = ("=", "!=", "<>", "<", "<=", ">", ">=")
+
+
+def check_identifier(name: str) -> str:
+    """
+    This function is used to validate a table or column name before it is put into a query.
+
+    Parameters:
+    name (str): The identifier to validate. A single "table.column" qualification is allowed.
+
+    Returns:
+    name (str): The same identifier if it is valid.
+
+    Raises:
+    ValueError: If the identifier contains anything other than letters, digits and underscores.
+    """
+    if not isinstance(name, str) or not IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid identifier '{name}'")
+    return name
+
+
+class Filter(ABC):
+    """
+    This is the base class of the structured filter conditions.
+
+    A filter is compiled into a parameterized SQL fragment for psycopg2 with compile(),
+    or into a SQLAlchemy expression with to_sqlalchemy(). Filters can be combined with & and |.
+    to_dict() and from_dict() convert a filter to plain data and back, e.g. for JSON.
+    A subclass must implement compile(), columns(), to_sqlalchemy() and to_dict().
+    """
+
+    @abstractmethod
+    def compile(self) -> Tuple[str, List[Any]]:
+        """
+        This method is used to compile the filter into SQL with %s placeholders.
+
+        Returns:
+        sql (str): The SQL condition with a %s placeholder for every value.
+        params (list): The values to bind to the placeholders, in order.
+        """
+
+    def shape(self) -> str:
+        """
+        This method is used to get the shape of the filter, which is its SQL without the values.
+        Filters with the same shape differ only in their values, so they can run the same prepared statement.
+
+        Returns:
+        shape (str): The SQL condition with placeholders.
+        """
+        return self.compile()[0]
+
+    @abstractmethod
+    def columns(self) -> Set[str]:
+        """
+        This method is used to get the names of the columns the filter is applied to.
+
+        Returns:
+        columns (set): The set of column names used by the filter.
+        """
+
+    @abstractmethod
+    def to_sqlalchemy(self, table_class):
+        """
+        This method is used to convert the filter into a SQLAlchemy expression.
+
+        Parameters:
+        table_class: The mapped class whose attributes are the filtered columns.
+
+        Returns:
+        The SQLAlchemy boolean expression.
+        """
+
+    @abstractmethod
+    def to_dict(self) -> dict:
+        """
+        This method is used to convert the filter into plain data.
+
+        Returns:
+        data (dict): The name of the filter class under "type" and the arguments of its constructor.
+        """
+
+    def __repr__(self) -> str:
+        # Built from the values, so equal filters have equal reprs, e.g. in the keys of the admission
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    def __and__(self, other: "Filter") -> "Filter":
+        return And(self, other)
+
+    def __or__(self, other: "Filter") -> "Filter":
+        return Or(self, other)
+
+
+def _attribute(table_class, column: str):
+    # "tbl_order.sum" and "sum" both map to Order.sum
+    return getattr(table_class, column.split(".")[-1])
+
+
+class Raw(Filter):
+    def __init__(self, condition: str):
+        """
+        This is the constructor method for the class. It wraps a raw SQL condition so it can be combined with other filters.
+
+        Parameters:
+        condition (str): The condition in postgres SQL.
+        """
+        self.condition = condition
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        return self.condition.replace("%", "%%"), []
+
+    def columns(self) -> Set[str]:
+        # The columns of a raw condition are unknown
+        return set()
+
+    def to_sqlalchemy(self, table_class):
+        from sqlalchemy import text
+        return text(self.condition)
+
+    def to_dict(self) -> dict:
+        return {"type": "Raw", "condition": self.condition}
+
+
+class Comparison(Filter):
+    def __init__(self, column: str, operator: str, value: Any):
+        """
+        This is the constructor method for the class. A None value with "=" or "!=" is compiled to IS NULL or IS NOT NULL.
+
+        Parameters:
+        column (str): The name of the column to compare.
+        operator (str): One of =, !=, <>, <, <=, >, >=.
+        value: The value to compare the column with.
+        """
+        if operator not in COMPARISON_OPERATORS:
+            raise ValueError(f"Unsupported operator '{operator}'")
+        self.column = check_identifier(column)
+        self.operator = operator
+        self.value = value
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        if self.value is None:
+            if self.operator == "=":
+                return f"{self.column} IS NULL", []
+            if self.operator in ("!=", "<>"):
+                return f"{self.column} IS NOT NULL", []
+        return f"{self.column} {self.operator} %s", [self.value]
+
+    def columns(self) -> Set[str]:
+        return {self.column}
+
+    def to_sqlalchemy(self, table_class):
+        attribute = _attribute(table_class, self.column)
+        return {
+            "=": attribute.__eq__,
+            "!=": attribute.__ne__,
+            "<>": attribute.__ne__,
+            "<": attribute.__lt__,
+            "<=": attribute.__le__,
+            ">": attribute.__gt__,
+            ">=": attribute.__ge__,
+        }[self.operator](self.value)
+
+    def to_dict(self) -> dict:
+        return {"type": "Comparison", "column": self.column, "operator": self.operator, "value": self.value}
+
+
+class Range(Filter):
+    def __init__(self, column: str, left: Any, right: Any):
+        """
+        This is the constructor method for the class. The range includes both bounds, like BETWEEN.
+
+        Parameters:
+        column (str): The name of the column to check.
+        left: The left bound of the range.
+        right: The right bound of the range.
+        """
+        self.column = check_identifier(column)
+        self.left = left
+        self.right = right
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        return f"{self.column} BETWEEN %s AND %s", [self.left, self.right]
+
+    def columns(self) -> Set[str]:
+        return {self.column}
+
+    def to_sqlalchemy(self, table_class):
+        return _attribute(table_class, self.column).between(self.left, self.right)
+
+    def to_dict(self) -> dict:
+        return {"type": "Range", "column": self.column, "left": self.left, "right": self.right}
+
+
+class In(Filter):
+    def __init__(self, column: str, values: list):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        column (str): The name of the column to check.
+        values (list): The values the column can be equal to.
+        """
+        self.column = check_identifier(column)
+        self.values = list(values)
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        # = ANY(array) keeps the same shape for any number of values
+        return f"{self.column} = ANY(%s)", [self.values]
+
+    def columns(self) -> Set[str]:
+        return {self.column}
+
+    def to_sqlalchemy(self, table_class):
+        return _attribute(table_class, self.column).in_(self.values)
+
+    def to_dict(self) -> dict:
+        return {"type": "In", "column": self.column, "values": self.values}
+
+
+class Like(Filter):
+    def __init__(self, column: str, pattern: str, case_sensitive: bool = True):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        column (str): The name of the column to check.
+        pattern (str): The LIKE pattern, e.g. '%abc%'.
+        case_sensitive (bool, optional): Use ILIKE if False. Defaults to True.
+        """
+        self.column = check_identifier(column)
+        self.pattern = pattern
+        self.case_sensitive = case_sensitive
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        operator = "LIKE" if self.case_sensitive else "ILIKE"
+        return f"{self.column} {operator} %s", [self.pattern]
+
+    def columns(self) -> Set[str]:
+        return {self.column}
+
+    def to_sqlalchemy(self, table_class):
+        attribute = _attribute(table_class, self.column)
+        if self.case_sensitive:
+            return attribute.like(self.pattern)
+        return attribute.ilike(self.pattern)
+
+    def to_dict(self) -> dict:
+        return {"type": "Like", "column": self.column, "pattern": self.pattern, "case_sensitive": self.case_sensitive}
+
+
+class _Group(Filter):
+    operator = ""
+
+    def __init__(self, *filters: Filter):
+        if not filters:
+            raise ValueError(f"{self.operator} needs at least one filter")
+        self.filters = filters
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        parts, params = [], []
+        for item in self.filters:
+            sql, item_params = item.compile()
+            parts.append(f"({sql})")
+            params.extend(item_params)
+        return f" {self.operator} ".join(parts), params
+
+    def columns(self) -> Set[str]:
+        columns = set()
+        for item in self.filters:
+            columns |= item.columns()
+        return columns
+
+    def to_dict(self) -> dict:
+        return {"type": type(self).__name__, "filters": [item.to_dict() for item in self.filters]}
+
+
+class And(_Group):
+    operator = "AND"
+
+    def to_sqlalchemy(self, table_class):
+        from sqlalchemy import and_
+        return and_(*(item.to_sqlalchemy(table_class) for item in self.filters))
+
+
+class Or(_Group):
+    operator = "OR"
+
+    def to_sqlalchemy(self, table_class):
+        from sqlalchemy import or_
+        return or_(*(item.to_sqlalchemy(table_class) for item in self.filters))
+
+
+class Not(Filter):
+    def __init__(self, item: Filter):
+        self.item = item
+
+    def compile(self) -> Tuple[str, List[Any]]:
+        sql, params = self.item.compile()
+        return f"NOT ({sql})", params
+
+    def columns(self) -> Set[str]:
+        return self.item.columns()
+
+    def to_sqlalchemy(self, table_class):
+        from sqlalchemy import not_
+        return not_(self.item.to_sqlalchemy(table_class))
+
+    def to_dict(self) -> dict:
+        return {"type": "Not", "item": self.item.to_dict()}
+
+
+def from_dict(data: dict) -> Filter:
+    """
+    This function is used to build a filter from the plain data made by Filter.to_dict().
+
+    Parameters:
+    data (dict): The name of the filter class under "type" and the arguments of its constructor.
+
+    Returns:
+    filter (Filter): The filter.
+
+    Raises:
+    ValueError: If the type is not a filter class.
+    """
+    arguments = dict(data)
+    kind = arguments.pop("type", None)
+    if kind in ("And", "Or"):
+        return FILTER_TYPES[kind](*(from_dict(item) for item in arguments["filters"]))
+    if kind == "Not":
+        return Not(from_dict(arguments["item"]))
+    if kind not in FILTER_TYPES:
+        raise ValueError(f"Unknown filter type '{kind}'")
+    return FILTER_TYPES[kind](**arguments)
+
+
+FILTER_TYPES = {item.__name__: item for item in (Raw, Comparison, Range, In, Like, And, Or, Not)}
@@ -0,0 +1,140 @@
+import enum
+import io
+import itertools
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .filters import check_identifier
+
+# Written for None values, unquoted so COPY reads it as NULL
+NULL_MARKER = "\\N"
+
+
+def _text(value) -> str:
+    # The text PostgreSQL reads for the value: enums are stored by name, like SQLAlchemy's Enum type does
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (list, tuple)):
+        return _array_literal(value)
+    return str(value)
+
+
+def _array_literal(values) -> str:
+    # Elements are double-quoted with " and \ escaped, so commas, braces and spaces stay in the element
+    items = []
+    for value in values:
+        if value is None:
+            items.append("NULL")
+        elif isinstance(value, (list, tuple)):
+            items.append(_array_literal(value))
+        else:
+            items.append('"' + _text(value).replace("\\", "\\\\").replace('"', '\\"') + '"')
+    return "{" + ",".join(items) + "}"
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return NULL_MARKER
+    # Every value is quoted, so a quoted \N stays a string. Tabs, newlines and backslashes are plain
+    # characters inside a quoted CSV field, only the quote is doubled.
+    return '"' + _text(value).replace('"', '""') + '"'
+
+
+class RowsReader(io.TextIOBase):
+    """
+    This class is a file-like source for cursor.copy_expert() that formats rows as CSV while COPY reads them.
+
+    Only the rows of one read() call are held in memory, so any number of rows can be loaded.
+    """
+
+    def __init__(self, rows: Iterator[tuple]):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        rows (iterator): The rows to format, every row is a tuple of values.
+        """
+        super().__init__()
+        self.rows = rows
+        self.buffer = ""
+        self.count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.count += 1
+            self.buffer += ",".join(_csv_value(value) for value in row) + "\n"
+
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+
+def bulk_upsert(conn, table: str, key_columns: List[str], rows: Iterable, columns: Optional[List[str]] = None) -> Tuple[int, int]:
+    """
+    This function is used to insert new rows and update existing rows of a table in one statement.
+
+    The rows are copied into a temporary staging table and merged with
+    INSERT ... SELECT ... ON CONFLICT (key_columns) DO UPDATE. If a key occurs more than once in rows
+    the last row wins. The key columns must have a unique index or constraint.
+
+    Parameters:
+    conn (psycopg2.extensions.connection): The connection to run the statements on, the caller commits.
+    table (str): The name of the table.
+    key_columns (list): The names of the columns that identify a row.
+    rows (iterable): The rows, either dictionaries or tuples in the order of columns.
+    columns (list, optional): The names of the columns of the rows. Defaults to None, which takes the keys of the first dictionary.
+
+    Returns:
+    counts (tuple): The number of inserted rows and the number of updated rows.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0, 0
+    if columns is None:
+        columns = list(first)
+    rows = itertools.chain([first], rows)
+    if isinstance(first, dict):
+        rows = (tuple(row[column] for column in columns) for row in rows)
+
+    check_identifier(table)
+    columns = [check_identifier(column) for column in columns]
+    key_columns = [check_identifier(column) for column in key_columns]
+    columns_str = ", ".join(columns)
+    keys_str = ", ".join(key_columns)
+    updates = [f"{column} = EXCLUDED.{column}" for column in columns if column not in key_columns]
+    action = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TEMP TABLE upsert_stage ON COMMIT DROP AS SELECT {columns_str} FROM {table} WITH NO DATA")
+        # The row number keeps the input order, so the last row of a repeated key wins
+        cur.execute("ALTER TABLE upsert_stage ADD COLUMN upsert_row bigserial")
+        cur.copy_expert(f"COPY upsert_stage ({columns_str}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')", RowsReader(rows))
+        cur.execute("ANALYZE upsert_stage")
+        cur.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table} ({columns_str})
+                SELECT DISTINCT ON ({keys_str}) {columns_str}
+                FROM upsert_stage
+                ORDER BY {keys_str}, upsert_row DESC
+                ON CONFLICT ({keys_str}) {action}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE inserted),
+                COUNT(*) FILTER (WHERE NOT inserted)
+            FROM merged
+        """)
+        inserted, updated = cur.fetchone()
+        cur.execute("DROP TABLE upsert_stage")
+
+    return inserted, updated
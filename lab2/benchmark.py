@@ -0,0 +1,120 @@
+import os
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+# The modules shared by the apps are in the common package at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from common.filters import Range
+from main import DB_NAME, HOST, PASSWORD, USER
+from model import BACKENDS, Base, Model
+
+# Rows written by the parity check, removed again at the end
+PARITY_NAME = "benchmark-parity"
+
+
+def _rows(data) -> list:
+    # The raw backend returns tuples and the orm backend Row objects, the order of the rows is not fixed
+    return sorted((tuple(row) for row in data), key=repr)
+
+
+def check_parity(model: Model) -> List[str]:
+    """
+    This function is used to check that the raw and the orm backends read and write the same data.
+
+    Every table is read whole and filtered by both backends. Then a pay system is inserted, updated and
+    deleted by every backend and read back by the other one after every step.
+
+    Parameters:
+    model (Model): The model to check.
+
+    Returns:
+    failures (list): The descriptions of the checks that failed, empty if both backends agree.
+    """
+    failures = []
+
+    for table, table_object in Base.metadata.tables.items():
+        columns = [column.name for column in table_object.columns]
+        key = table_object.primary_key.columns[0].name
+        conditions = {"no condition": None, "Range filter": Range(key, 1, 10), "raw condition": f"{key} % 2 = 0"}
+        for label, condition in conditions.items():
+            results = [model.get_data(table, columns, condition, backend=backend) for backend in BACKENDS]
+            if None in results or _rows(results[0]) != _rows(results[1]):
+                failures.append(f"get_data {table} with {label}")
+
+    for writer in BACKENDS:
+        reader = "orm" if writer == "raw" else "raw"
+        condition = f"name = '{PARITY_NAME}'"
+        steps = [
+            ("insert_data", lambda: model.insert_data("tbl_pay_system", ["name", "website"], [PARITY_NAME, "before"], backend=writer), [("before",)]),
+            ("update_data", lambda: model.update_data("tbl_pay_system", {"website": "after"}, condition, backend=writer), [("after",)]),
+            ("delete_data", lambda: model.delete_data("tbl_pay_system", condition, backend=writer), []),
+            ("delete_data of no row", lambda: not model.delete_data("tbl_pay_system", condition, backend=writer), []),
+        ]
+        for name, step, expected in steps:
+            if not step() or _rows(model.get_data("tbl_pay_system", ["website"], condition, backend=reader)) != expected:
+                failures.append(f"{name} with {writer}")
+
+    # Rows left by a failed step
+    model.delete_data("tbl_pay_system", f"name = '{PARITY_NAME}'", backend="raw")
+    return failures
+
+
+def measure(function: Callable, repeat: int) -> float:
+    """
+    This function is used to measure the median time of a call.
+
+    Parameters:
+    function (callable): The call.
+    repeat (int): The number of timed calls, after one call to warm up.
+
+    Returns:
+    milliseconds (float): The median time of the calls.
+    """
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2)
+
+
+def benchmark(repeat: int = 10) -> List[tuple]:
+    """
+    This function is used to compare the backends on the hot operations.
+
+    Parameters:
+    repeat (int, optional): The number of timed calls of every operation. Defaults to 10.
+
+    Returns:
+    results (list): A list of (operation, configuration, median milliseconds) tuples.
+    """
+    pooled = Model(DB_NAME, USER, PASSWORD, HOST)
+    unpooled = Model(DB_NAME, USER, PASSWORD, HOST, pooled=False)
+    columns = [column.name for column in Base.metadata.tables["tbl_order"].columns]
+
+    results = []
+    for backend in BACKENDS:
+        results.append(("get_data tbl_order", backend, measure(lambda: pooled.get_data("tbl_order", columns, backend=backend), repeat)))
+        results.append(("get_data tbl_order by id", backend, measure(lambda: pooled.get_data("tbl_order", columns, Range("id", 1, 100), backend=backend), repeat * 10)))
+        results.append(("pay_systems_total_income", backend, measure(lambda: pooled.pay_systems_total_income(0, 1000, backend=backend), repeat * 10)))
+    for name, model in (("pooled", pooled), ("unpooled", unpooled)):
+        results.append(("pay_systems_total_income", name, measure(lambda: model.pay_systems_total_income(0, 1000), repeat * 10)))
+    return results
+
+
+if __name__ == "__main__":
+    failures = check_parity(Model(DB_NAME, USER, PASSWORD, HOST))
+    for failure in failures:
+        print("Parity failed:", failure)
+    if failures:
+        sys.exit(1)
+    print("Both backends returned the same data")
+
+    for operation, configuration, milliseconds in benchmark():
+        print(f"{operation:<28} {configuration:<10} {milliseconds:>10} ms")
@@ -37,6 +37,10 @@ class Controller:
                     self.top_5_orders_total_price()
                 elif a == "0":
                     continue
+            elif choice == "10":
+                self.export_data()
+            elif choice == "11":
+                self.view_related_data()
             elif choice == "0":
                 break
             else:
@@ -58,6 +62,8 @@ class Controller:
         self.view.show_message("7. Generate Random Data")
         self.view.show_message("8. Find Data")
         self.view.show_message("9. Algorithms")
+        self.view.show_message("10. Export Data")
+        self.view.show_message("11. Related Data")
         self.view.show_message("0. Quit")
         return input("Enter your choice: ")
     
@@ -150,3 +156,26 @@ class Controller:
             self.view.show_data(data, ["order_id", "total_price"])
         else:
             self.view.show_message("Data retrieval failed!")
+
+    def export_data(self):
+        table, columns, condition, path, fmt, parallel = self.view.get_export_input()
+        files = self.model.export_data(table, path, columns, condition, fmt, parallel)
+        if files is not None:
+            self.view.show_data(files, ["file", "rows"])
+        else:
+            self.view.show_message("Data export failed!")
+
+    def view_related_data(self):
+        kind, loading, argument = self.view.get_related_input()
+        with self.model.count_queries() as counter:
+            if kind == "clients":
+                data = self.model.get_company_clients(argument, loading)
+                columns = ["id", "company", "clients"]
+            else:
+                data = self.model.get_orders(loading=loading, limit=argument)
+                columns = ["id", "date", "sum", "client", "company", "pay_system"]
+        if data is not None:
+            self.view.show_data(data, columns)
+            self.view.show_message(f"{counter.count} statements sent with {loading} loading")
+        else:
+            self.view.show_message("Data retrieval failed!")
@@ -1,3 +1,11 @@
+import os
+import sys
+
+# The modules shared by the apps are in the common package at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
 from controller import Controller
 
 DB_NAME = "CustomerCompaniesManagementSystem"
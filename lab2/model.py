@@ -1,15 +1,47 @@
 import enum
-from typing import Optional, List, Tuple, Union
+import itertools
+import re
+from collections import Counter
+from typing import Dict, Optional, List, Tuple, Union
 
 import psycopg2
-from sqlalchemy import create_engine, Column, Integer, String, Date, Float, ForeignKey, text, ARRAY
+from sqlalchemy import create_engine, exc, func, literal_column, Column, Integer, String, Date, Float, ForeignKey, text, ARRAY
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.types import Enum
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, joinedload, lazyload, selectinload
+
+from common.columnar import arrow_types, concat_chunks, fetch_columns, pa, to_arrow
+from common.export import EXPORT_FORMATS, export_parallel, export_query, key_ranges
+from common.filters import Filter, Range, Raw, check_identifier
+from common.upsert import bulk_upsert
+from querycount import QueryCounter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 Base = declarative_base()
 
+
+# The most statements prepared on one pooled connection, the least recently used one is deallocated first
+PREPARED_STATEMENTS = 256
+PLACEHOLDER_RE = re.compile(r"%([%s])")
+
+
+def select_statement(table: str, columns: Tuple[str, ...], where: str) -> str:
+    # The values of the condition are bound by psycopg2, the statement only holds placeholders
+    return f"SELECT {', '.join(columns)} FROM {table}{where}"
+
+
+def numbered_statement(query: str) -> str:
+    # PREPARE takes $1, $2, ... instead of the %s placeholders of psycopg2, %% is a plain %
+    numbers = itertools.count(1)
+    return PLACEHOLDER_RE.sub(lambda match: "%" if match.group(1) == "%" else f"${next(numbers)}", query)
+
+
 # Custom Enum Type for Gender
 class Gender(enum.Enum):
     Male = "Male"
@@ -30,6 +62,8 @@ class Company(Base):
     name = Column(String(64), nullable=False)
     owner = Column(String(64))
     country = Column(String(64), nullable=False)
+    # Read only, the links are written through CompanyClient
+    clients = relationship("Client", secondary="tbl_company_client", viewonly=True, order_by="Client.id")
 
 class CompanyClient(Base):
     __tablename__ = 'tbl_company_client'
@@ -60,8 +94,35 @@ class PaySystem(Base):
     website = Column(String(64))
 
 
+# Loader options of the relationship-aware reads: lazy loads every related row on first access (N+1 statements),
+# joined loads them in the same statement, selectin loads them in one more statement per relationship
+LOADING_STRATEGIES = {
+    "lazy": lazyload,
+    "joined": joinedload,
+    "selectin": selectinload,
+}
+
+# The backend of every method that can run on both: "raw" runs the statement on a pooled psycopg2 connection
+# and returns the driver rows, "orm" goes through a Session and the mapped classes
+BACKENDS = ("raw", "orm")
+DEFAULT_BACKENDS = {
+    # The hot paths, bulk reads, bulk writes and the reports, take the raw driver
+    "get_data": "raw",
+    "bulk_upsert": "raw",
+    "pay_systems_total_income": "raw",
+    "company_orders_thru_period": "raw",
+    "top_5_orders_total_price": "raw",
+    # The entity-level operations go through the mapped classes
+    "insert_data": "orm",
+    "update_data": "orm",
+    "delete_data": "orm",
+}
+# The number of rows the orm backend of bulk_upsert sends in one statement
+UPSERT_BATCH_SIZE = 1000
+
+
 class Model:
-    def __init__(self, db_name: str, user: str, password: str, host: str):
+    def __init__(self, db_name: str, user: str, password: str, host: str, backends: Optional[Dict[str, str]] = None, pooled: bool = True):
         self.engine = create_engine(f'postgresql+psycopg2://{user}:{password}@{host}/{db_name}')
         self.Session = sessionmaker(bind=self.engine)
         
@@ -69,6 +130,16 @@ class Model:
         self.user = user
         self.password = password
         self.host = host
+        # The backend of every method when the call does not choose one, see DEFAULT_BACKENDS
+        self.backends = dict(DEFAULT_BACKENDS, **(backends or {}))
+        for backend in self.backends.values():
+            self._backend_name(backend)
+        # connect() takes the connections from the pool of the engine instead of opening a new one every call
+        self.pooled = pooled
+        # How many times each column was used in a structured filter, per table
+        self.filter_usage: Dict[str, Counter] = {}
+        # Names of the prepared statements, unique for the connections of the pool
+        self.statement_numbers = itertools.count(1)
 
     def connect(self) -> Tuple[Optional[psycopg2.extensions.connection], Optional[psycopg2.extensions.cursor]]:
         """
@@ -76,20 +147,89 @@ class Model:
 
         It uses the psycopg2 library to create a connection and a cursor object.
         The connection details are taken from the instance variables of the class.
+        With pooled the connection comes from the pool of the engine, close() gives it back rolled back.
 
         Returns:
         conn (psycopg2.extensions.connection, optional): The connection object to the database, or None if the connection was not successful.
         cur (psycopg2.extensions.cursor, optional): The cursor object to execute PostgreSQL commands through Python, or None if the connection was not successful.
         """
         try:
-            conn = psycopg2.connect(f"dbname='{self.db_name}' user='{self.user}' host='{self.host}' password='{self.password}'")
+            if self.pooled:
+                conn = self.engine.raw_connection()
+            else:
+                conn = psycopg2.connect(f"dbname='{self.db_name}' user='{self.user}' host='{self.host}' password='{self.password}'")
             cur = conn.cursor()
-        except psycopg2.OperationalError as e:
+        except (psycopg2.OperationalError, exc.OperationalError) as e:
             print("Unable to connect to the database\n", e)
             return None, None
 
         return conn, cur
 
+    @staticmethod
+    def _backend_name(backend: str) -> str:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        return backend
+
+    def _backend(self, method: str, backend: Optional[str]) -> str:
+        """
+        This method is used to choose the backend of a call.
+
+        Parameters:
+        method (str): The name of the method, one of the keys of DEFAULT_BACKENDS.
+        backend (str or None): The backend chosen by the call, None for the configured one.
+
+        Returns:
+        backend (str): "raw" or "orm".
+        """
+        return self._backend_name(self.backends[method] if backend is None else backend)
+
+    def _where(self, table: str, condition) -> Tuple[str, list]:
+        """
+        This method is used to build the WHERE clause of a query from a condition.
+
+        Parameters:
+        table (str): The name of the table the condition is applied to.
+        condition (str, Filter or None): A raw SQL condition, a structured filter, or None.
+
+        Returns:
+        where (str): The WHERE clause with %s placeholders, or an empty string if there is no condition.
+        params (list): The values to bind to the placeholders.
+        """
+        if condition is None:
+            return "", []
+
+        if isinstance(condition, Filter):
+            usage = self.filter_usage.setdefault(table, Counter())
+            for column in condition.columns():
+                usage[column.split('.')[-1]] += 1
+            sql, params = condition.compile()
+            return f" WHERE {sql}", params
+
+        # Raw conditions are kept as they are, only % is escaped for the parameter binding
+        return f" WHERE {condition.replace('%', '%%')}", []
+
+    def _criterion(self, table: str, table_class, condition):
+        """
+        This method is used to convert a condition into a criterion for Query.filter().
+
+        Parameters:
+        table (str): The name of the table the condition is applied to.
+        table_class: The mapped class of the table.
+        condition (str or Filter): A raw SQL condition or a structured filter.
+
+        Returns:
+        The SQLAlchemy expression for the condition.
+        """
+        if isinstance(condition, Filter):
+            usage = self.filter_usage.setdefault(table, Counter())
+            for column in condition.columns():
+                usage[column.split('.')[-1]] += 1
+            # Bound parameters let SQLAlchemy reuse the compiled statement for the same filter shape
+            return condition.to_sqlalchemy(table_class)
+
+        return text(condition)
+
     def get_tables(self) -> Union[list, None]:
         """
         This method is used to retrieve the names of all the tables in the database.
@@ -104,7 +244,7 @@ class Model:
         
         return tables
     
-    def insert_data(self, table: str, columns: list, data: dict) -> bool:
+    def insert_data(self, table: str, columns: list, data: dict, backend: Optional[str] = None) -> bool:
         """
         This method is used to insert data into a specific table in the database.
         
@@ -112,10 +252,13 @@ class Model:
         table (str): The name of the table where the data will be inserted.
         columns (list): The names of the columns where the data will be inserted.
         data (dict): A dictionary where the key is the column name and the value is the data to be inserted.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
         
         Returns:
         bool: True if the data was successfully inserted, False otherwise.
         """
+        if self._backend("insert_data", backend) == "raw":
+            return self._write_raw(table, self._insert_statement, columns, data)
         
         session = self.Session()
         
@@ -137,19 +280,24 @@ class Model:
         finally:
             session.close()
 
-    def get_data(self, table: str, columns: list, condition=None) -> Union[list, None]:
+    def get_data(self, table: str, columns: list, condition=None, backend: Optional[str] = None) -> Union[list, None]:
         """
         This method is used to retrieve data from a specific table in the database.
 
+        The raw backend returns tuples, the orm backend returns Row objects, both hold the same values.
+
         Parameters:
         table (str): The name of the table from which the data will be retrieved.
         columns (list): The names of the columns to be retrieved.
-        condition (str, optional): The condition for the data retrieval. Defaults to None.
+        condition (str or Filter, optional): The condition for the data retrieval. Defaults to None.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
 
         Returns:
         data (list or None): A list of tuples representing the rows of data retrieved from the database.
         None: If there is an error in connection or execution, or if the table is empty
         """
+        if self._backend("get_data", backend) == "raw":
+            return self._get_data_raw(table, columns, condition)
         
         session = self.Session()
         
@@ -162,7 +310,7 @@ class Model:
             # Create an instance of the table class with the provided values
             query = session.query(table_class).with_entities(*(getattr(table_class, column) for column in columns))
             if condition is not None:
-                query = query.filter(text(condition))
+                query = query.filter(self._criterion(table, table_class, condition))
             data = query.all()
             return data
         except Exception as e:
@@ -171,18 +319,214 @@ class Model:
         finally:
             session.close()
 
-    def update_data(self, table: str, data: dict, condition=None) -> bool:
+    def count_queries(self) -> QueryCounter:
+        """
+        This method is used to count the statements the Model sends through its engine.
+
+        Returns:
+        counter (QueryCounter): The context manager counting the statements of its block.
+        """
+        return QueryCounter(self.engine)
+
+    def _loader(self, loading: str):
+        if loading not in LOADING_STRATEGIES:
+            raise ValueError(f"Unknown loading strategy {loading!r}, expected one of {', '.join(LOADING_STRATEGIES)}")
+        return LOADING_STRATEGIES[loading]
+
+    def get_orders(self, condition=None, loading: str = "joined", limit: Optional[int] = None) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve orders together with the names of their client, company and pay system.
+
+        The related rows are loaded with the given strategy. "joined" reads everything in one statement,
+        "selectin" in one statement for the orders and one per relationship, "lazy" in one statement per
+        related row that is not in the session yet.
+
+        Parameters:
+        condition (str or Filter, optional): The condition on tbl_order. Defaults to None.
+        loading (str, optional): The loading strategy, one of LOADING_STRATEGIES. Defaults to "joined".
+        limit (int, optional): The largest number of orders, the lowest ids first. Defaults to None.
+
+        Returns:
+        data (list or None): A list of (id, date, sum, client name, company name, pay system name) tuples.
+        If there is an error in connection or execution, it returns None.
+        """
+        session = self.Session()
+
+        try:
+            loader = self._loader(loading)
+            query = session.query(Order).options(
+                loader(Order.client),
+                loader(Order.company),
+                loader(Order.pay_system),
+            )
+            if condition is not None:
+                query = query.filter(self._criterion("tbl_order", Order, condition))
+            query = query.order_by(Order.id)
+            if limit is not None:
+                query = query.limit(limit)
+            data = [
+                (order.id, order.date, order.sum, order.client.name, order.company.name, order.pay_system.name)
+                for order in query.all()
+            ]
+            return data
+        except Exception as e:
+            print(e)
+            return None
+        finally:
+            session.close()
+
+    def get_company_clients(self, company: Optional[str] = None, loading: str = "selectin") -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve companies together with the names of their clients.
+
+        Parameters:
+        company (str, optional): The name of the company, all companies if None. Defaults to None.
+        loading (str, optional): The loading strategy of the clients, one of LOADING_STRATEGIES. Defaults to "selectin".
+
+        Returns:
+        data (list or None): A list of (id, name, list of client names) tuples.
+        If there is an error in connection or execution, it returns None.
+        """
+        session = self.Session()
+
+        try:
+            query = session.query(Company).options(self._loader(loading)(Company.clients))
+            if company is not None:
+                query = query.filter(Company.name == company)
+            # A client linked to a company twice comes twice with selectin, the other strategies keep it once
+            data = [
+                (item.id, item.name, [client.name for client in dict.fromkeys(item.clients)])
+                for item in query.order_by(Company.id).all()
+            ]
+            return data
+        except Exception as e:
+            print(e)
+            return None
+        finally:
+            session.close()
+
+    def get_columns(self, table: str, columns: list, condition=None, chunk_size: int = 65536, arrow: bool = False) -> Union[dict, "pa.Table", None]:
+        """
+        This method is used to retrieve data from a specific table in the database as columns instead of rows.
+
+        The rows are read chunk by chunk with binary COPY when every column has a fixed-width type
+        (int, float, bool, date, timestamp), so no Python object is created per value. Other columns
+        are read through a server-side cursor.
+
+        Parameters:
+        table (str): The name of the table from which the data will be retrieved.
+        columns (list): The names of the columns to be retrieved.
+        condition (str or Filter, optional): The condition for the data retrieval. Defaults to None.
+        chunk_size (int, optional): The number of rows read at once. Defaults to 65536.
+        arrow (bool, optional): Return a pyarrow.Table instead of a dictionary of NumPy arrays. Defaults to False.
+
+        Returns:
+        data (dict, pyarrow.Table or None): A dictionary of one NumPy array per column, masked where the values are NULL, or an Arrow table.
+        None: If there is an error in connection or execution, or if NumPy (or pyarrow) is not installed.
+        """
+        if np is None or (arrow and pa is None):
+            print("Error: Invalid columns get\n", "NumPy and pyarrow are required for columnar results")
+            return None
+
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        chunks, type_codes = [], []
+        try:
+            where, params = self._where(table, condition)
+            query = select_statement(table, tuple(columns), where)
+            fetch_columns(conn, query, params, chunk_size, chunks.append, lambda names, codes: type_codes.extend(codes))
+        except Exception as e:
+            print("Error: Invalid columns get\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        if arrow:
+            return to_arrow(chunks, columns, arrow_types(type_codes))
+        return concat_chunks(chunks, columns, type_codes)
+
+    def export_data(self, table: str, path: str, columns: Optional[list] = None, condition=None, fmt: str = "csv", parallel: int = 1, key: str = "id", chunk_size: int = 65536) -> Union[List[Tuple[str, int]], None]:
+        """
+        This method is used to export a table, or the filtered rows of it, to a CSV or Parquet file.
+
+        The rows are streamed to the file, so the memory use does not depend on the size of the table.
+        With parallel > 1 the table is split into ranges of the integer primary key, every range is
+        exported on its own connection and written to its own file (e.g. orders.part0.csv).
+
+        Parameters:
+        table (str): The name of the table to export.
+        path (str): The path of the file to write.
+        columns (list, optional): The names of the columns to export. Defaults to None, which means all columns.
+        condition (str or Filter, optional): The condition for the exported rows. Defaults to None.
+        fmt (str, optional): The file format, csv or parquet. Defaults to "csv".
+        parallel (int, optional): The number of connections and files for a parallel export. Defaults to 1.
+        key (str, optional): The integer primary key used to split a parallel export. Defaults to "id".
+        chunk_size (int, optional): The number of rows per Parquet row group. Defaults to 65536.
+
+        Returns:
+        files (list or None): A list of (path, rows) tuples, one per written file.
+        If there is an error in connection or execution, it returns None.
+        """
+        if fmt not in EXPORT_FORMATS:
+            print("Error: Invalid data export\n", f"Unsupported format '{fmt}'")
+            return None
+
+        columns = tuple(columns or ["*"])
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        try:
+            if parallel <= 1:
+                where, params = self._where(table, condition)
+                query = select_statement(table, columns, where)
+                files = [(path, export_query(conn, query, params, path, fmt, chunk_size))]
+            else:
+                ranges = key_ranges(conn, table, check_identifier(key), parallel)
+                if condition is not None and not isinstance(condition, Filter):
+                    condition = Raw(condition)
+
+                def build_query(first: int, last: int) -> Tuple[str, list]:
+                    key_range = Range(key, first, last)
+                    where, params = self._where(table, key_range if condition is None else condition & key_range)
+                    return select_statement(table, columns, where), params
+
+                files = export_parallel(self.connect, ranges, build_query, path, fmt, chunk_size)
+        except Exception as e:
+            print("Error: Invalid data export\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        return files
+
+    def update_data(self, table: str, data: dict, condition=None, backend: Optional[str] = None) -> bool:
         """
         This method is used to update data in a specific table in the database.
 
+        Every row matching the condition is updated.
+
         Parameters:
         table (str): The name of the table where the data will be updated.
         data (dict): A dictionary where the key is the column name and the value is the new data to be updated.
-        condition (str, optional): The condition for the data update. Defaults to None.
+        condition (str or Filter, optional): The condition for the data update. Defaults to None.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
 
         Returns:
-        bool: True if the data was successfully updated, False otherwise.
+        bool: True if at least one row was updated, False otherwise.
         """
+        if self._backend("update_data", backend) == "raw":
+            return self._write_raw(table, self._update_statement, data, condition)
         
         session = self.Session()
         
@@ -192,15 +536,10 @@ class Model:
         try:
             # Dynamically get the table class from the table name
             table_class = globals()[table_name]
-            # Query for the record to update
-            record = session.query(table_class).filter(text(condition)).first()
-            if record:
-                for key, value in data.items():
-                    setattr(record, key, value)
-                session.commit()
-                return True
-            else:
-                return False
+            # Update the matching records in one statement, like the raw backend
+            count = session.query(table_class).filter(self._criterion(table, table_class, condition)).update(data, synchronize_session=False)
+            session.commit()
+            return count > 0
         except Exception as e:
             print(e)
             session.rollback()
@@ -208,17 +547,102 @@ class Model:
         finally:
             session.close()
 
-    def delete_data(self, table: str, condition: str) -> bool:
+    def bulk_upsert(self, table: str, key_columns: list, rows, columns: Optional[list] = None, backend: Optional[str] = None) -> Union[Tuple[int, int], None]:
+        """
+        This method is used to insert new rows and update existing rows of a table in one transaction.
+
+        The raw backend streams the rows with COPY into a temporary staging table and merges them with one
+        INSERT ... ON CONFLICT (key_columns) DO UPDATE, so millions of rows can be synced in one call.
+        The orm backend sends the rows as INSERT ... ON CONFLICT statements of UPSERT_BATCH_SIZE rows each.
+        If a key occurs more than once in rows the last row wins on both.
+
+        Parameters:
+        table (str): The name of the table.
+        key_columns (list): The names of the columns that identify a row, they must have a unique index or constraint.
+        rows (iterable): The rows, either dictionaries or tuples in the order of columns.
+        columns (list, optional): The names of the columns of the rows. Defaults to None, which takes the keys of the first dictionary.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
+
+        Returns:
+        counts (tuple or None): The number of inserted rows and the number of updated rows.
+        If there is an error in connection or execution, it returns None.
+        """
+        if self._backend("bulk_upsert", backend) == "orm":
+            return self._bulk_upsert_orm(table, key_columns, rows, columns)
+
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        try:
+            counts = bulk_upsert(conn, table, key_columns, rows, columns)
+        except Exception as e:
+            print("Error: Invalid data upsert\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        return counts
+
+    def _bulk_upsert_orm(self, table: str, key_columns: list, rows, columns: Optional[list]) -> Union[Tuple[int, int], None]:
+        session = self.Session()
+
+        try:
+            table_object = Base.metadata.tables[table]
+            rows = iter(rows)
+            first = next(rows, None)
+            if first is None:
+                return 0, 0
+            if columns is None:
+                columns = list(first)
+            # One row per key, the last one, like DISTINCT ON of the raw backend
+            merged = {}
+            for row in itertools.chain([first], rows):
+                values = dict(zip(columns, (row[column] for column in columns) if isinstance(row, dict) else row))
+                merged[tuple(values[column] for column in key_columns)] = values
+            merged = list(merged.values())
+
+            inserted = updated = 0
+            for start in range(0, len(merged), UPSERT_BATCH_SIZE):
+                statement = insert(table_object).values(merged[start:start + UPSERT_BATCH_SIZE])
+                updates = {column: statement.excluded[column] for column in columns if column not in key_columns}
+                if updates:
+                    statement = statement.on_conflict_do_update(index_elements=key_columns, set_=updates)
+                else:
+                    statement = statement.on_conflict_do_nothing(index_elements=key_columns)
+                # xmax is 0 for a new row version that is not the update of an existing row
+                flags = session.execute(statement.returning(literal_column("xmax = 0"))).scalars().all()
+                inserted += sum(flags)
+                updated += len(flags) - sum(flags)
+            session.commit()
+            return inserted, updated
+        except Exception as e:
+            print("Error: Invalid data upsert\n", e)
+            session.rollback()
+            return None
+        finally:
+            session.close()
+
+    def delete_data(self, table: str, condition: Union[str, Filter], backend: Optional[str] = None) -> bool:
         """
         This method is used to delete data from a specific table in the database.
 
+        Every row matching the condition is deleted.
+
         Parameters:
         table (str): The name of the table where the data will be deleted.
-        condition (str): The condition for the data deletion.
+        condition (str or Filter): The condition for the data deletion.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
 
         Returns:
-        bool: True if the data was successfully deleted, False otherwise.
+        bool: True if at least one row was deleted, False otherwise.
         """
+        if self._backend("delete_data", backend) == "raw":
+            return self._write_raw(table, self._delete_statement, condition)
         
         session = self.Session()
         
@@ -228,14 +652,10 @@ class Model:
         try:
             # Dynamically get the table class from the table name
             table_class = globals()[table_name]
-            # Query for the record to delete
-            record = session.query(table_class).filter(text(condition)).first()
-            if record:
-                session.delete(record)
-                session.commit()
-                return True
-            else:
-                return False
+            # Delete the matching records in one statement, like the raw backend
+            count = session.query(table_class).filter(self._criterion(table, table_class, condition)).delete(synchronize_session=False)
+            session.commit()
+            return count > 0
         except Exception as e:
             print(e)
             session.rollback()
@@ -243,6 +663,138 @@ class Model:
         finally:
             session.close()
 
+    def _get_data_raw(self, table: str, columns: list, condition=None) -> Union[list, None]:
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            # Enum columns come from the driver as the names of their members, the orm backend returns the members
+            table_columns = Base.metadata.tables[table].columns
+            enums = [
+                (index, table_columns[column.split('.')[-1]].type.enum_class)
+                for index, column in enumerate(columns)
+                if getattr(table_columns[column.split('.')[-1]].type, "enum_class", None) is not None
+            ]
+            where, params = self._where(table, condition)
+            query = select_statement(table, tuple(check_identifier(column) for column in columns), where)
+            # A raw condition has no shape, every text would be prepared on its own
+            if self.pooled and (condition is None or isinstance(condition, Filter)):
+                self._execute_prepared(conn, cur, query, params)
+            else:
+                cur.execute(query, params)
+            data = cur.fetchall()
+        except Exception as e:
+            print(e)
+            conn.close()
+            return None
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if enums:
+            data = [list(row) for row in data]
+            for row in data:
+                for index, enum_class in enums:
+                    if row[index] is not None:
+                        row[index] = enum_class[row[index]]
+            data = [tuple(row) for row in data]
+        return data
+
+    def _execute_prepared(self, conn, cur, query: str, params: list):
+        """
+        This method is used to run a read as a prepared statement of the pooled connection.
+
+        The statement is made from the shape of its filter, see Filter.shape(), so filters that differ only in
+        their values run the same statement. It is prepared with PREPARE the first time the connection runs it
+        and with EXECUTE afterwards, so the server parses and plans it once per connection. A statement whose
+        plan no longer fits the table, e.g. after the table was dropped and created again, is prepared again.
+
+        Parameters:
+        conn (sqlalchemy.pool.PoolProxiedConnection): The pooled connection, its info keeps the prepared statements.
+        cur (psycopg2.extensions.cursor): The cursor of the connection.
+        query (str): The statement with %s placeholders.
+        params (list): The values to bind to the placeholders.
+        """
+        prepared = conn.info.setdefault("prepared", {})
+        arguments = f" ({', '.join(['%s'] * len(params))})" if params else ""
+        # Moved to the end on every use, so the first one is the least recently used
+        name = prepared.pop(query, None)
+        if name is not None:
+            try:
+                cur.execute(f"EXECUTE {name}{arguments}", params)
+                prepared[query] = name
+                return
+            except psycopg2.Error:
+                # The statements of the connection are not known any more, they are all prepared again
+                conn.rollback()
+                cur.execute("DEALLOCATE ALL")
+                prepared.clear()
+
+        if len(prepared) >= PREPARED_STATEMENTS:
+            cur.execute(f"DEALLOCATE {prepared.pop(next(iter(prepared)))}")
+        name = f"model_{next(self.statement_numbers)}"
+        cur.execute(f"PREPARE {name} AS {numbered_statement(query)}")
+        prepared[query] = name
+        cur.execute(f"EXECUTE {name}{arguments}", params)
+
+    def _insert_statement(self, table: str, columns: list, data) -> Tuple[str, list]:
+        placeholders = ", ".join(["%s"] * len(columns))
+        columns = ", ".join(check_identifier(column) for column in columns)
+        return f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", list(data)
+
+    def _matching(self, table: str, condition) -> Tuple[str, list]:
+        # Like the orm backend, a write without a condition fails instead of changing the whole table
+        if condition is None:
+            raise ValueError("A condition is required")
+        return self._where(table, condition)
+
+    def _update_statement(self, table: str, data: dict, condition) -> Tuple[str, list]:
+        assignments = ", ".join(f"{check_identifier(column)} = %s" for column in data)
+        where, params = self._matching(table, condition)
+        return f"UPDATE {table} SET {assignments}{where}", list(data.values()) + params
+
+    def _delete_statement(self, table: str, condition) -> Tuple[str, list]:
+        where, params = self._matching(table, condition)
+        return f"DELETE FROM {table}{where}", params
+
+    def _write_raw(self, table: str, statement, *args) -> bool:
+        """
+        This method is used to run a write of the raw backend.
+
+        Parameters:
+        table (str): The name of the table.
+        statement (callable): The method building the statement and its values from the table and args.
+        args: The arguments of the statement.
+
+        Returns:
+        bool: True if a row was written, False otherwise.
+        """
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return False
+
+        try:
+            if table not in Base.metadata.tables:
+                raise ValueError(f"Unknown table '{table}'")
+            query, params = statement(table, *args)
+            cur.execute(query, [value.name if isinstance(value, enum.Enum) else value for value in params])
+            written = cur.rowcount > 0
+        except Exception as e:
+            print(e)
+            conn.rollback()
+            conn.close()
+            return False
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return written
+
     def create_table(self, table: str, columns: list, data_types: list) -> bool:
         """
         This method is used to create a table in the database.
@@ -452,44 +1004,18 @@ class Model:
 
         return True
 
-    def pay_systems_total_income(self, left: int, right: int) -> Union[List[Tuple], None]:
-        """
-        This method is used to retrieve the total income of each pay system in the database.
-        
-        Parameters:
-        left (int): The left bound of the sum of the orders.
-        right (int): The right bound of the sum of the orders.
-        
-        Returns:
-        data (list or None): A list of tuples representing the rows of data retrieved from the database.
-        If there is an error in connection or execution, it returns None.
-        """
-        
+    def _report_raw(self, report: str, query: str, params: list) -> Union[List[Tuple], None]:
         conn, cur = self.connect()
-        
+
         if conn is None or cur is None:
             return None
-        
+
         try:
-            query = f'''
-            SELECT
-                tbl_pay_system.id,
-                tbl_pay_system.name,
-                COUNT(*) AS Count,
-                SUM(tbl_order.sum) AS total
-            FROM
-                tbl_order
-                INNER JOIN tbl_pay_system ON tbl_order.pay_system_id = tbl_pay_system.id
-            WHERE
-                sum BETWEEN {left} AND {right}
-            GROUP BY
-                tbl_pay_system.id,
-                tbl_pay_system.name;
-            '''
-            cur.execute(query)
+            cur.execute(query, params)
             data = cur.fetchall()
         except Exception as e:
-            print("Error: Invalid random data generation\n", e)
+            print(f"Error: Invalid {report} report\n", e)
+            conn.close()
             return None
 
         conn.commit()
@@ -497,92 +1023,182 @@ class Model:
         conn.close()
 
         return data
+
+    def _report_orm(self, report: str, build) -> Union[List[Tuple], None]:
+        session = self.Session()
+
+        try:
+            return [tuple(row) for row in build(session).all()]
+        except Exception as e:
+            print(f"Error: Invalid {report} report\n", e)
+            return None
+        finally:
+            session.close()
+
+    def pay_systems_total_income(self, left: int, right: int, backend: Optional[str] = None) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the total income of each pay system in the database.
+        
+        Parameters:
+        left (int): The left bound of the sum of the orders.
+        right (int): The right bound of the sum of the orders.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
+        
+        Returns:
+        data (list or None): A list of (id, name, count, total) tuples.
+        If there is an error in connection or execution, it returns None.
+        """
+        if self._backend("pay_systems_total_income", backend) == "orm":
+            return self._report_orm("pay_systems_total_income", lambda session: (
+                session.query(PaySystem.id, PaySystem.name, func.count(), func.sum(Order.sum))
+                .join(Order, Order.pay_system_id == PaySystem.id)
+                .filter(Order.sum.between(left, right))
+                .group_by(PaySystem.id, PaySystem.name)
+            ))
+
+        query = '''
+        SELECT
+            tbl_pay_system.id,
+            tbl_pay_system.name,
+            COUNT(*) AS Count,
+            SUM(tbl_order.sum) AS total
+        FROM
+            tbl_order
+            INNER JOIN tbl_pay_system ON tbl_order.pay_system_id = tbl_pay_system.id
+        WHERE
+            sum BETWEEN %s AND %s
+        GROUP BY
+            tbl_pay_system.id,
+            tbl_pay_system.name;
+        '''
+        return self._report_raw("pay_systems_total_income", query, [left, right])
     
-    def company_orders_thru_period(self, left: str, right: str) -> Union[List[Tuple], None]:
+    def company_orders_thru_period(self, left: str, right: str, backend: Optional[str] = None) -> Union[List[Tuple], None]:
         """
         This method is used to retrieve the number of orders placed by each company in the database.
         
         Parameters:
         left (str): The left bound of the period.
         right (str): The right bound of the period.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
         
         Returns:
-        data (list or None): A list of tuples representing the rows of data retrieved from the database.
+        data (list or None): A list of (id, name, count) tuples.
         If there is an error in connection or execution, it returns None.
         """
-        
-        conn, cur = self.connect()
-        
-        if conn is None or cur is None:
-            return None
-        
-        try:
-            query = f'''
-            SELECT
-                tbl_company.id,
-                tbl_company.name,
-                COUNT(*) AS Count
-            FROM
-                tbl_order
-                INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
-            WHERE
-                tbl_order.date BETWEEN '{left}' AND '{right}'
-            GROUP BY
-                tbl_company.id,
-                tbl_company.name;
-            '''
-            cur.execute(query)
-            data = cur.fetchall()
-        except Exception as e:
-            print("Error: Invalid random data generation\n", e)
-            return None
+        if self._backend("company_orders_thru_period", backend) == "orm":
+            return self._report_orm("company_orders_thru_period", lambda session: (
+                session.query(Company.id, Company.name, func.count())
+                .join(Order, Order.company_id == Company.id)
+                .filter(Order.date.between(left, right))
+                .group_by(Company.id, Company.name)
+            ))
 
-        conn.commit()
-        cur.close()
-        conn.close()
-
-        return data
+        query = '''
+        SELECT
+            tbl_company.id,
+            tbl_company.name,
+            COUNT(*) AS Count
+        FROM
+            tbl_order
+            INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+        WHERE
+            tbl_order.date BETWEEN %s AND %s
+        GROUP BY
+            tbl_company.id,
+            tbl_company.name;
+        '''
+        return self._report_raw("company_orders_thru_period", query, [left, right])
     
-    def top_5_orders_total_price(self, company: str) -> Union[List[Tuple], None]:
+    def top_5_orders_total_price(self, company: str, backend: Optional[str] = None) -> Union[List[Tuple], None]:
         """
         This method is used to retrieve the top 5 orders with the highest total price for a specific company.
         
         Parameters:
         company (str): The name of the company.
+        backend (str, optional): "raw" or "orm", the configured backend if None. Defaults to None.
         
         Returns:
-        data (list or None): A list of tuples representing the rows of data retrieved from the database.
+        data (list or None): A list of (order_id, total_price) tuples, the highest total price first.
         If there is an error in connection or execution, it returns None.
         """
-        
+        if self._backend("top_5_orders_total_price", backend) == "orm":
+            return self._report_orm("top_5_orders_total_price", lambda session: (
+                session.query(Order.id, Order.sum)
+                .join(Company, Order.company_id == Company.id)
+                .filter(Company.name == company)
+                .order_by(Order.sum.desc())
+                .limit(5)
+            ))
+
+        query = '''
+        SELECT
+            tbl_order.id,
+            tbl_order.sum
+        FROM
+            tbl_order
+            INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+        WHERE
+            tbl_company.name = %s
+        ORDER BY
+            tbl_order.sum DESC
+        LIMIT
+            5;
+        '''
+        return self._report_raw("top_5_orders_total_price", query, [company])
+
+    def recommend_indexes(self, min_uses: int = 1) -> Union[List[str], None]:
+        """
+        This method is used to recommend indexes for the columns that are often used in structured filters.
+
+        A column is recommended if it was filtered at least min_uses times and it is not the leading column of any index.
+
+        Parameters:
+        min_uses (int, optional): The minimal number of filters on a column to recommend it. Defaults to 1.
+
+        Returns:
+        statements (list or None): A list of CREATE INDEX statements, the most used columns first.
+        If there is an error in connection or execution, it returns None.
+        """
+        candidates = [
+            (uses, table, column)
+            for table, usage in self.filter_usage.items()
+            for column, uses in usage.items()
+            if uses >= min_uses
+        ]
+        if len(candidates) == 0:
+            return []
+
         conn, cur = self.connect()
-        
+
         if conn is None or cur is None:
             return None
-        
+
         try:
-            query = f'''
+            query = '''
             SELECT
-                tbl_order.id,
-                tbl_order.sum
+                tbl.relname,
+                col.attname
             FROM
-                tbl_order
-                INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+                pg_index idx
+                INNER JOIN pg_class tbl ON tbl.oid = idx.indrelid
+                INNER JOIN pg_attribute col ON col.attrelid = tbl.oid AND col.attnum = idx.indkey[0]
             WHERE
-                tbl_company.name = '{company}'
-            ORDER BY
-                tbl_order.sum DESC
-            LIMIT
-                5;
+                tbl.relname = ANY(%s);
             '''
-            cur.execute(query)
-            data = cur.fetchall()
+            cur.execute(query, (list(self.filter_usage),))
+            indexed = set(cur.fetchall())
         except Exception as e:
-            print("Error: Invalid random data generation\n", e)
+            print("Error: Invalid index recommendation\n", e)
             return None
 
         conn.commit()
         cur.close()
         conn.close()
 
-        return data
+        statements = []
+        for uses, table, column in sorted(candidates, reverse=True):
+            if (table, column) not in indexed:
+                statements.append(f"CREATE INDEX ON {table} ({column});")
+
+        return statements
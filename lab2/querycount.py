@@ -0,0 +1,52 @@
+from typing import List
+
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """
+    This class is used to count the statements an engine sends to the database while a block of code runs.
+
+    It listens to the before_cursor_execute event of the engine from __enter__ to __exit__, so an N+1
+    traversal shows up as N+1 statements and an eager load as one or two.
+    """
+
+    def __init__(self, engine):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        engine (sqlalchemy.engine.Engine): The engine whose statements are counted.
+        """
+        self.engine = engine
+        self.statements: List[str] = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self) -> "QueryCounter":
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+        return False
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def assert_at_most(self, limit: int):
+        """
+        This method is used to check that the block sent no more than limit statements.
+
+        Parameters:
+        limit (int): The largest number of statements allowed.
+
+        Raises:
+        AssertionError: If more statements were sent, the message lists them.
+        """
+        if self.count > limit:
+            listing = "\n".join(f"{number}. {statement}" for number, statement in enumerate(self.statements, 1))
+            raise AssertionError(f"Expected at most {limit} statements, {self.count} were sent:\n{listing}")
@@ -0,0 +1,122 @@
+import pytest
+
+from common.filters import Comparison, Range
+from main import DB_NAME, HOST, PASSWORD, USER
+from model import BACKENDS, DEFAULT_BACKENDS, Base, Model, numbered_statement
+
+# Rows written by the tests, removed again after every test
+NAME = "test-backends"
+
+
+def _rows(data) -> list:
+    # The raw backend returns tuples and the orm backend Row objects, the order of the rows is not fixed
+    return sorted((tuple(row) for row in data or []), key=repr)
+
+
+@pytest.fixture(scope="module")
+def model():
+    model = Model(DB_NAME, USER, PASSWORD, HOST)
+    conn, cur = model.connect()
+    if conn is None:
+        pytest.skip("The database is not reachable")
+    conn.close()
+    return model
+
+
+@pytest.fixture
+def pay_systems(model):
+    model.delete_data("tbl_pay_system", Comparison("name", "=", NAME), backend="raw")
+    yield
+    model.delete_data("tbl_pay_system", Comparison("name", "=", NAME), backend="raw")
+
+
+def test_default_backends():
+    hot = ("get_data", "bulk_upsert", "pay_systems_total_income", "company_orders_thru_period", "top_5_orders_total_price")
+    assert {method: DEFAULT_BACKENDS[method] for method in hot} == dict.fromkeys(hot, "raw")
+    assert {method: DEFAULT_BACKENDS[method] for method in ("insert_data", "update_data", "delete_data")} == dict.fromkeys(("insert_data", "update_data", "delete_data"), "orm")
+
+
+@pytest.mark.parametrize("report, args", [
+    ("pay_systems_total_income", (0, 500)),
+    ("company_orders_thru_period", ("2000-01-01", "2100-01-01")),
+])
+def test_report_parity(model, report, args):
+    raw, orm = (getattr(model, report)(*args, backend=backend) for backend in BACKENDS)
+    assert raw is not None and orm is not None
+    assert _rows(raw) == _rows(orm)
+
+
+def test_top_5_parity(model):
+    company = model.get_data("tbl_company", ["name"])[0][0]
+    raw, orm = (model.top_5_orders_total_price(company, backend=backend) for backend in BACKENDS)
+    # Orders with the same sum may come in any order, the sums are the same
+    assert [row[1] for row in raw] == [row[1] for row in orm]
+
+
+def test_report_binds_values(model):
+    # A quote in the value is data, not SQL
+    assert model.top_5_orders_total_price("x' OR '1'='1") == []
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_bulk_upsert(model, pay_systems, backend):
+    rows = [{"name": NAME, "website": "first"}, {"name": NAME, "website": "second"}]
+    assert model.bulk_upsert("tbl_pay_system", ["id"], [dict(row, id=900001 + i) for i, row in enumerate(rows)], backend=backend) == (2, 0)
+    changed = [(900002, NAME, "changed"), (900003, NAME, "new"), (900003, NAME, "last")]
+    assert model.bulk_upsert("tbl_pay_system", ["id"], changed, ["id", "name", "website"], backend=backend) == (1, 1)
+    data = model.get_data("tbl_pay_system", ["id", "website"], Comparison("name", "=", NAME))
+    assert _rows(data) == [(900001, "first"), (900002, "changed"), (900003, "last")]
+
+
+@pytest.mark.parametrize("table", list(Base.metadata.tables))
+@pytest.mark.parametrize("condition", [None, "id_range", "raw"])
+def test_get_data_parity(model, table, condition):
+    table_object = Base.metadata.tables[table]
+    columns = [column.name for column in table_object.columns]
+    key = table_object.primary_key.columns[0].name
+    condition = {None: None, "id_range": Range(key, 1, 10), "raw": f"{key} % 2 = 0"}[condition]
+
+    raw, orm = (model.get_data(table, columns, condition, backend=backend) for backend in BACKENDS)
+    assert raw is not None and orm is not None
+    assert _rows(raw) == _rows(orm)
+
+
+def test_numbered_statement():
+    assert numbered_statement("SELECT a FROM t WHERE a BETWEEN %s AND %s AND b LIKE '%%x'") == "SELECT a FROM t WHERE a BETWEEN $1 AND $2 AND b LIKE '%x'"
+
+
+def test_same_shape_reads_share_a_prepared_statement(model):
+    reads = [model.get_data("tbl_order", ["id", "sum"], Range("id", left, left + 10), backend="raw") for left in (1, 5, 20)]
+    assert [_rows(read) for read in reads] == [_rows(model.get_data("tbl_order", ["id", "sum"], Range("id", left, left + 10), backend="orm")) for left in (1, 5, 20)]
+
+    conn, cur = model.connect()
+    try:
+        statements = [query for query in conn.info["prepared"] if query.startswith("SELECT id, sum FROM tbl_order")]
+        cur.execute("SELECT count(*) FROM pg_prepared_statements WHERE statement LIKE %s", ["%SELECT id, sum FROM tbl_order%"])
+        assert len(statements) == 1 and cur.fetchone()[0] == 1
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("writer", BACKENDS)
+def test_writes_change_every_matching_row(model, pay_systems, writer):
+    reader = "orm" if writer == "raw" else "raw"
+    condition = Comparison("name", "=", NAME)
+    for website in ("first", "second"):
+        assert model.insert_data("tbl_pay_system", ["name", "website"], [NAME, website], backend=writer)
+    assert _rows(model.get_data("tbl_pay_system", ["website"], condition, backend=reader)) == [("first",), ("second",)]
+
+    assert model.update_data("tbl_pay_system", {"website": "after"}, condition, backend=writer)
+    assert _rows(model.get_data("tbl_pay_system", ["website"], condition, backend=reader)) == [("after",), ("after",)]
+
+    assert model.delete_data("tbl_pay_system", condition, backend=writer)
+    assert _rows(model.get_data("tbl_pay_system", ["website"], condition, backend=reader)) == []
+    assert not model.delete_data("tbl_pay_system", condition, backend=writer)
+
+
+@pytest.mark.parametrize("writer", BACKENDS)
+def test_writes_without_condition_fail(model, pay_systems, writer):
+    assert model.insert_data("tbl_pay_system", ["name", "website"], [NAME, "kept"], backend=writer)
+    assert not model.update_data("tbl_pay_system", {"website": "changed"}, None, backend=writer)
+    assert not model.delete_data("tbl_pay_system", None, backend=writer)
+    assert _rows(model.get_data("tbl_pay_system", ["website"], Comparison("name", "=", NAME))) == [("kept",)]
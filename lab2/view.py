@@ -1,5 +1,7 @@
 from tabulate import tabulate
 
+from common.filters import Comparison, Like, Range, check_identifier
+
 class View:
     def show_message(self, message):
         print(message)
@@ -95,27 +97,32 @@ class View:
     def get_find_input(self):
         table = input("Enter table name: ")
         
+        # A bad column name would fail the filter, so it is asked again
         column = input("Enter column name: ")
-        
-        condition = ""
+        while True:
+            try:
+                check_identifier(column)
+                break
+            except ValueError as e:
+                column = input(f"{e}. Enter column name: ")
+        
+        condition = None
         t = input("Enter search type (number, string, boolean, date): ")
         if t == "number":
             left = input("Enter left bound: ")
             right = input("Enter right bound: ")
-            condition = f"{column} BETWEEN {left} AND {right}"
+            condition = Range(column, left, right)
         elif t == "string":
             string = input("Enter regex string: ")
-            condition = f"{column} LIKE '%{string}%'"
+            condition = Like(column, f"%{string}%")
         elif t == "boolean":
             boolean = input("Enter boolean value (True, False): ")
-            condition = f"{column} = {boolean}"
+            condition = Comparison(column, "=", boolean)
         elif t == "date":
             left = input("Enter left bound (YYYY-MM-DD): ")
             right = input("Enter right bound (YYYY-MM-DD): ")
-            condition = f"{column} BETWEEN '{left}' AND '{right}'"
+            condition = Range(column, left, right)
         
-        if condition == "":
-            condition = None
         return table, column, condition
     
     def get_pay_systems_total_income_input(self):
@@ -131,4 +138,37 @@ class View:
     def get_top_5_orders_total_price_input(self):
         company = input("Enter company name: ")
         return company
-    
\ No newline at end of file
+
+    def get_export_input(self):
+        table = input("Enter table name: ")
+        
+        columns = input("Enter columns separated by space. If all columns leave empty: ")
+        columns = columns.split() or None
+        
+        condition = input("Enter condition in postgres SQL (... WHERE [condition]). If not applicable leave empty: ")
+        if condition == "":
+            condition = None
+        
+        path = input("Enter file path: ")
+        
+        fmt = input("Enter file format (csv, parquet): ")
+        if fmt == "":
+            fmt = "csv"
+        
+        parallel = input("Enter number of parallel files (default 1): ")
+        parallel = int(parallel if parallel != "" else 1)
+        return table, columns, condition, path, fmt, parallel
+
+    def get_related_input(self):
+        kind = input("Enter data to view (orders, clients): ")
+
+        loading = input("Enter loading strategy (lazy, joined, selectin): ")
+        if loading == "":
+            loading = "joined"
+
+        if kind == "clients":
+            argument = input("Enter company name. If all companies leave empty: ") or None
+        else:
+            limit = input("Enter number of orders (default 100): ")
+            argument = int(limit if limit != "" else 100)
+        return kind, loading, argument
@@ -0,0 +1,211 @@
+import contextlib
+import functools
+import threading
+import time
+import weakref
+from typing import Callable, Optional
+
+import psycopg2
+from psycopg2 import errors
+
+# Names of the classes of statements, with the time in seconds a statement of the class may run, None for no limit
+STATEMENT_TIMEOUTS = {
+    "read": 30.0,
+    "write": 30.0,
+    "report": 120.0,
+    "bulk": None,
+}
+
+
+class Activity:
+    """
+    This class is used to follow the statements of one operation: its connections, the rows it processed and how it ended.
+
+    Only the connections opened by the threads that follow() the operation belong to it, or through a connect
+    function made by bind(). Connections of background threads, e.g. the write-behind queue or the order cache,
+    report their database time but are neither cancelled nor counted. cancel() sends a cancel request to the
+    server for every open connection of the operation, so the backend stops working instead of running on after
+    the client gave up.
+    """
+
+    def __init__(self):
+        """
+        This is the constructor method for the class.
+        """
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # The number of the running operation, the connections remember the operation they were opened for
+        self.operation = 0
+        # Time in seconds the statements and commits of all operations waited for the server, never reset
+        self.db_seconds = 0.0
+        self.reset()
+
+    def reset(self):
+        """
+        This method is used to start following a new operation.
+        """
+        with self.lock:
+            self.operation += 1
+            self.connections = weakref.WeakSet()
+            self.started = time.perf_counter()
+            self.rows = 0
+            self.error: Optional[Exception] = None
+            self.cancel_requested = False
+
+    @contextlib.contextmanager
+    def follow(self):
+        """
+        This method is used to make the connections the calling thread opens in the block part of the running operation.
+        """
+        previous = getattr(self.local, "operation", None)
+        self.local.operation = self.operation
+        try:
+            yield
+        finally:
+            self.local.operation = previous
+
+    def bind(self, connect: Callable) -> Callable:
+        """
+        This method is used to make a connect function that opens the connections for the operation of the calling thread.
+
+        Parameters:
+        connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+
+        Returns:
+        connect (callable): The same function, usable from the worker threads of the operation.
+        """
+        operation = getattr(self.local, "operation", None)
+
+        @functools.wraps(connect)
+        def bound(*args, **kwargs):
+            previous = getattr(self.local, "operation", None)
+            self.local.operation = operation
+            try:
+                return connect(*args, **kwargs)
+            finally:
+                self.local.operation = previous
+        return bound
+
+    def register(self, conn):
+        """
+        This method is used to follow a new connection.
+
+        Parameters:
+        conn (TrackedConnection): The connection, its cursors report to this activity.
+        """
+        conn.activity = self
+        with self.lock:
+            conn.operation = getattr(self.local, "operation", None)
+            if conn.operation == self.operation:
+                self.connections.add(conn)
+
+    def add_rows(self, rows: int, conn=None):
+        with self.lock:
+            if getattr(conn, "operation", None) == self.operation:
+                self.rows += max(rows, 0)
+
+    def add_db_time(self, seconds: float):
+        with self.lock:
+            self.db_seconds += seconds
+
+    def fail(self, error: Exception, conn=None):
+        # The last error of every thread is kept for the retries, see resilience.py
+        self.local.error = error
+        if isinstance(error, errors.QueryCanceled):
+            with self.lock:
+                if getattr(conn, "operation", None) == self.operation:
+                    self.error = error
+
+    def take_error(self) -> Optional[Exception]:
+        """
+        This method is used to get and clear the last statement error of the calling thread.
+
+        Returns:
+        error (Exception or None): The error, or None if no statement failed since the last call.
+        """
+        error, self.local.error = getattr(self.local, "error", None), None
+        return error
+
+    def cancel(self) -> int:
+        """
+        This method is used to cancel the statements running on the open connections.
+
+        Returns:
+        count (int): The number of connections a cancel request was sent to.
+        """
+        with self.lock:
+            self.cancel_requested = True
+            connections = [conn for conn in self.connections if not conn.closed]
+        count = 0
+        for conn in connections:
+            try:
+                conn.cancel()
+                count += 1
+            except psycopg2.Error:
+                pass
+        return count
+
+    def outcome(self) -> Optional[str]:
+        """
+        This method is used to get how the operation ended.
+
+        Returns:
+        outcome (str or None): "cancelled", "timed out", or None if no statement of the operation was stopped.
+        """
+        with self.lock:
+            error, cancel_requested = self.error, self.cancel_requested
+        if error is None:
+            return "cancelled" if cancel_requested else None
+        return "timed out" if "statement timeout" in str(error) else "cancelled"
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+class ActivityCursor(psycopg2.extensions.cursor):
+    """
+    This class is a psycopg2 cursor that reports the rows it processed, its cancelled statements and the time it
+    waited for the server to the activity of its connection.
+    """
+
+    def _report(self, method, *args):
+        activity = getattr(self.connection, "activity", None)
+        start = time.perf_counter()
+        try:
+            result = method(*args)
+        except Exception as e:
+            if activity is not None:
+                activity.fail(e, self.connection)
+            raise
+        finally:
+            if activity is not None:
+                activity.add_db_time(time.perf_counter() - start)
+        # Named cursors count their rows while fetching
+        if activity is not None and self.name is None:
+            activity.add_rows(self.rowcount, self.connection)
+        return result
+
+    def execute(self, query, vars=None):
+        return self._report(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self._report(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self._report(super().copy_expert, sql, file, size)
+
+    def fetchmany(self, size=None):
+        activity = getattr(self.connection, "activity", None)
+        start = time.perf_counter()
+        try:
+            rows = super().fetchmany(self.arraysize if size is None else size)
+        except Exception as e:
+            if activity is not None:
+                activity.fail(e, self.connection)
+            raise
+        finally:
+            if activity is not None:
+                activity.add_db_time(time.perf_counter() - start)
+        if activity is not None and self.name is not None:
+            activity.add_rows(len(rows), self.connection)
+        return rows
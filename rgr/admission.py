@@ -0,0 +1,172 @@
+import copy
+import functools
+import inspect
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+class AdmissionTimeout(Exception):
+    """
+    This exception is raised when a call waited longer than the timeout of its class for a free slot.
+    """
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class Admission:
+    """
+    This class is used to coalesce identical concurrent calls and to limit the number of calls of a class running at once.
+
+    The first call of a key runs, the calls of the same key that arrive while it runs wait for it and get a
+    copy of its result, or its exception. Before it runs, the call takes a slot of its class. Calls without a
+    free slot queue for up to the timeout of the class, a full queue rejects the call at once.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[int, float, int]]):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        limits (dict): For every class the number of calls that run at once, the time in seconds a call waits
+            for a slot and the number of calls that may wait.
+        """
+        self.limits = limits
+        self.slots = {name: threading.BoundedSemaphore(limit[0]) for name, limit in limits.items()}
+        self.waiting = {name: 0 for name in limits}
+        self.flights: Dict[tuple, _Flight] = {}
+        self.lock = threading.Lock()
+        self.stats = {name: {"runs": 0, "coalesced": 0, "rejected": 0, "timed_out": 0} for name in limits}
+
+    def run(self, name: str, key: tuple, function: Callable[[], Any]) -> Any:
+        """
+        This method is used to run a call of a class, or to wait for the identical call that is already running.
+
+        Parameters:
+        name (str): The class of the call, one of the keys of limits.
+        key (tuple): The key of identical calls.
+        function (callable): The call to run.
+
+        Returns:
+        result: The result of the call, a copy for the calls that waited for it.
+        """
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            else:
+                flight.followers += 1
+                self.stats[name]["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        result = None
+        try:
+            result = self._admit(name, function)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            # The waiting calls copy from a private copy, so the caller may change the result
+            if flight.followers and flight.error is None:
+                flight.result = copy.deepcopy(result)
+            flight.done.set()
+        return result
+
+    def _admit(self, name: str, function: Callable[[], Any]) -> Any:
+        _, timeout, max_waiting = self.limits[name]
+        slot = self.slots[name]
+        if not slot.acquire(blocking=False):
+            with self.lock:
+                if self.waiting[name] >= max_waiting:
+                    self.stats[name]["rejected"] += 1
+                    raise AdmissionTimeout(f"Too many {name} calls are waiting")
+                self.waiting[name] += 1
+            try:
+                acquired = slot.acquire(timeout=timeout)
+            finally:
+                with self.lock:
+                    self.waiting[name] -= 1
+            if not acquired:
+                with self.lock:
+                    self.stats[name]["timed_out"] += 1
+                raise AdmissionTimeout(f"No {name} slot was free within {timeout} seconds")
+
+        try:
+            with self.lock:
+                self.stats[name]["runs"] += 1
+            return function()
+        finally:
+            slot.release()
+
+
+def call_key(signature: inspect.Signature, name: str, instance, args: tuple, kwargs: dict) -> tuple:
+    """
+    This function is used to get the key of identical calls of a method.
+
+    Parameters:
+    signature (inspect.Signature): The signature of the method.
+    name (str): The name of the method.
+    instance: The object the method is called on, it is not a part of the key.
+    args (tuple): The positional arguments of the call.
+    kwargs (dict): The keyword arguments of the call.
+
+    Returns:
+    key (tuple): The name of the method and the reprs of the arguments in the order of the parameters.
+    """
+    try:
+        bound = signature.bind(instance, *args, **kwargs)
+    except TypeError:
+        # The method raises the error itself, the call is only not coalesced with the right ones
+        return name, repr(args), repr(sorted(kwargs.items()))
+    bound.apply_defaults()
+    arguments = []
+    for parameter, value in list(bound.arguments.items())[1:]:
+        if signature.parameters[parameter].kind is inspect.Parameter.VAR_KEYWORD:
+            # The order of the extra keyword arguments does not matter
+            value = sorted(value.items())
+        arguments.append((parameter, value))
+    return name, repr(arguments)
+
+
+def admitted(name: str):
+    """
+    This function is used to make a decorator that runs a Model method through the admission of the Model.
+
+    Identical calls are found by the name of the method and the reprs of its arguments bound to its parameters,
+    with the defaults filled in, so f(1, 2), f(1, right=2) and f(left=1, right=2) are the same call. Filters
+    are compared by their values. A call that gets no slot prints the error and returns None, like
+    the other errors of the Model.
+
+    Parameters:
+    name (str): The class of the method, one of the keys of the limits of the admission.
+
+    Returns:
+    decorator (callable): The decorator.
+    """
+    def decorator(method: Callable) -> Callable:
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.admission is None:
+                return method(self, *args, **kwargs)
+            key = call_key(signature, method.__name__, self, args, kwargs)
+            try:
+                return self.admission.run(name, key, lambda: method(self, *args, **kwargs))
+            except AdmissionTimeout as e:
+                print(f"Error: Invalid {method.__name__} call\n", e)
+                return None
+        return wrapper
+    return decorator
@@ -0,0 +1,160 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.filters import check_identifier
+
+
+def _open(connect: Callable):
+    conn, cur = connect()
+    if conn is None or cur is None:
+        raise ConnectionError("Unable to connect to the database")
+    return conn, cur
+
+
+def secondary_indexes(cur, tables: List[str]) -> List[Tuple[str, str]]:
+    """
+    This function is used to find the indexes of tables that do not back a constraint.
+
+    Primary keys and unique constraints keep their indexes, the other indexes can be dropped and created again.
+
+    Parameters:
+    cur (psycopg2.extensions.cursor): The cursor to run the query on.
+    tables (list): The names of the tables.
+
+    Returns:
+    indexes (list): A list of (name, definition) tuples.
+    """
+    cur.execute(
+        """
+        SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+        FROM pg_index
+        WHERE indrelid::regclass::text = ANY(%s)
+            AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+        """,
+        (tables,),
+    )
+    return cur.fetchall()
+
+
+def run_statements(connect: Callable, statements: List[str], workers: int):
+    """
+    This function is used to run statements in parallel, each on its own connection and in its own transaction.
+
+    Parameters:
+    connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+    statements (list): The statements, e.g. CREATE INDEX.
+    workers (int): The number of statements run at once.
+    """
+    def run(statement: str):
+        conn, cur = _open(connect)
+        try:
+            cur.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    if statements:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            list(executor.map(run, statements))
+
+
+class LoadPipeline:
+    """
+    This class is used to load many rows into a table without keeping its indexes up to date row by row.
+
+    With defer_indexes the secondary indexes of the table are dropped before the load and built again after it,
+    several at once. With staging the rows are loaded into an UNLOGGED copy of the table without indexes,
+    which writes no WAL, and moved into the table with one INSERT ... SELECT. The table itself is never
+    swapped, since its foreign keys, triggers and sequences belong to it. With analyze the table is analyzed at
+    the end, so the planner sees the new rows at once. Every run keeps the time of every phase in report.
+
+    Other sessions run without the dropped indexes while the load runs.
+    """
+
+    def __init__(self, defer_indexes: bool = True, staging: bool = False, analyze: bool = True, workers: int = 4):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        defer_indexes (bool, optional): Drop the secondary indexes during the load. Defaults to True.
+        staging (bool, optional): Load into an UNLOGGED staging table first. Defaults to False.
+        analyze (bool, optional): Analyze the table after the load. Defaults to True.
+        workers (int, optional): The number of indexes built at once. Defaults to 4.
+        """
+        self.defer_indexes = defer_indexes
+        self.staging = staging
+        self.analyze = analyze
+        self.workers = workers
+        self.report: Optional[Dict] = None
+
+    def run(self, connect: Callable, table: str, load: Callable) -> dict:
+        """
+        This method is used to run a load through the pipeline.
+
+        If the load fails the staging table is dropped and the dropped indexes are built again before the error is raised.
+
+        Parameters:
+        connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+        table (str): The name of the table.
+        load (callable): The function called with (connection, cursor, target table) that loads the rows into
+            the target table and returns their number. It may commit.
+
+        Returns:
+        report (dict): The number of rows, the time of every phase and the total time in seconds.
+        """
+        check_identifier(table)
+        phases = {}
+        start = time.perf_counter()
+        stage = f"{table}_stage_{os.getpid()}"
+        indexes = []
+
+        conn, cur = _open(connect)
+        try:
+            phase_start = time.perf_counter()
+            if self.defer_indexes:
+                indexes = secondary_indexes(cur, [table])
+                for name, _ in indexes:
+                    cur.execute(f"DROP INDEX {name}")
+            if self.staging:
+                cur.execute(f"CREATE UNLOGGED TABLE {stage} (LIKE {table} INCLUDING DEFAULTS)")
+            conn.commit()
+            phases["prepare"] = round(time.perf_counter() - phase_start, 3)
+
+            phase_start = time.perf_counter()
+            rows = load(conn, cur, stage if self.staging else table)
+            conn.commit()
+            phases["load"] = round(time.perf_counter() - phase_start, 3)
+
+            if self.staging:
+                phase_start = time.perf_counter()
+                cur.execute(f"INSERT INTO {table} SELECT * FROM {stage}")
+                cur.execute(f"DROP TABLE {stage}")
+                conn.commit()
+                phases["merge"] = round(time.perf_counter() - phase_start, 3)
+        except Exception:
+            conn.rollback()
+            if self.staging:
+                cur.execute(f"DROP TABLE IF EXISTS {stage}")
+                conn.commit()
+            run_statements(connect, [definition for _, definition in indexes], self.workers)
+            conn.close()
+            raise
+
+        try:
+            phase_start = time.perf_counter()
+            run_statements(connect, [definition for _, definition in indexes], self.workers)
+            if self.defer_indexes:
+                phases["indexes"] = round(time.perf_counter() - phase_start, 3)
+
+            if self.analyze:
+                phase_start = time.perf_counter()
+                cur.execute(f"ANALYZE {table}")
+                conn.commit()
+                phases["analyze"] = round(time.perf_counter() - phase_start, 3)
+        finally:
+            conn.close()
+
+        self.report = {"rows": rows, "phases": phases, "seconds": round(time.perf_counter() - start, 3)}
+        return self.report
@@ -1,11 +1,32 @@
+import contextlib
+import threading
+
+from bulkload import LoadPipeline
 from model import Model
+from profiling import ActionProfiler
 from view import View
+from workload import RecordingModel, WorkloadRecorder
 
 
 class Controller:
-    def __init__(self, db_name, user, password, host):
-        self.model = Model(db_name, user, password, host)
+    # Methods that are not profiled as actions, they only dispatch or ask for the choice
+    UNPROFILED = ("run", "call", "show_menu", "show_algorithms", "show_health")
+
+    def __init__(self, db_name, user, password, host, replicas=None, record=None, profile=None, profile_mode="sampling"):
+        self.model = Model(db_name, user, password, host, replicas)
         self.view = View()
+        # Every Model call is written to the workload log at record, see workload.py
+        self.recorder = None
+        if record is not None:
+            self.recorder = WorkloadRecorder(record)
+            self.model = RecordingModel(self.model, self.recorder)
+        # Every action is profiled into the directory profile, see profiling.py
+        self.profiler = None
+        if profile is not None:
+            self.profiler = ActionProfiler(profile, self.model.activity, profile_mode)
+            for name, value in vars(Controller).items():
+                if callable(value) and not name.startswith("_") and name not in self.UNPROFILED:
+                    setattr(self, name, self._profiled(name, getattr(self, name)))
 
     def run(self):
         while True:
@@ -35,15 +56,98 @@ class Controller:
                     self.company_orders_thru_period()
                 elif a == "3":
                     self.top_5_orders_total_price()
+                elif a == "4":
+                    self.top_orders_per_company()
+                elif a == "5":
+                    self.pay_systems_income_histogram()
                 elif a == "0":
                     continue
+            elif choice == "10":
+                self.export_data()
+            elif choice == "11":
+                self.dump_snapshot()
+            elif choice == "12":
+                self.restore_snapshot()
+            elif choice == "13":
+                self.purge_data()
+            elif choice == "14":
+                self.show_table_sizes()
+            elif choice == "15":
+                h = self.show_health()
+                if h == "1":
+                    self.table_scans()
+                elif h == "2":
+                    self.unused_indexes()
+                elif h == "3":
+                    self.cache_hit_ratio()
+                elif h == "4":
+                    self.dead_tuples()
+                elif h == "5":
+                    self.top_statements()
+                elif h == "6":
+                    self.recommend_indexes()
+                elif h == "7":
+                    self.check_plans()
+                elif h == "0":
+                    continue
             elif choice == "0":
                 break
             else:
                 self.view.show_message("Invalid choice!")
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.profiler is not None:
+            self.view.show_data(self.profiler.summary(), ["action", "calls", "wall_s", "cpu_s", "database_s", "database_share"])
+
+    def _profiled(self, name, action):
+        def run(*args, **kwargs):
+            # Actions called by other actions are part of their profile
+            if self.profiler.active:
+                return action(*args, **kwargs)
+            with self.profiler.action(name) as summary:
+                result = action(*args, **kwargs)
+            self.view.show_message(
+                f"Profiled {name}: {summary['wall']} s, {summary['cpu']} s CPU, {summary['database']} s database, "
+                f"hottest {summary['hottest'] or '-'}, written to {summary['path']}"
+            )
+            return result
+        return run
                 
+    def call(self, method, *args, **kwargs):
+        # The call runs in a thread so Ctrl-C reaches the main thread while a statement runs,
+        # the statements of that thread are then cancelled on the server instead of running on,
+        # the connections of background threads are left alone, see Activity.follow()
+        activity = self.model.activity
+        activity.reset()
+        result = {}
+        done = threading.Event()
+
+        def run():
+            try:
+                with activity.follow(), self.profiler.thread() if self.profiler is not None else contextlib.nullcontext():
+                    result["value"] = method(*args, **kwargs)
+            except Exception as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=run, daemon=True).start()
+        while not done.is_set():
+            try:
+                done.wait(0.1)
+            except KeyboardInterrupt:
+                self.view.show_message("\nCancelling...")
+                self.model.cancel()
+
+        outcome = activity.outcome()
+        if outcome is not None:
+            self.view.show_message(f"Operation {outcome} after {activity.elapsed():.2f} s, {activity.rows} rows processed")
+        elif "error" in result:
+            self.view.show_message(f"Error: Invalid {getattr(method, '__name__', 'operation')} call\n {result['error']}")
+        return result.get("value")
+
     def show_tables(self):
-        tables = self.model.get_tables()
+        tables = self.call(self.model.get_tables)
         tables = [table[0] for table in tables]
         self.view.show_message(f"\nAvailable tables: {tables if tables is not None else 'None'}")
 
@@ -58,6 +162,12 @@ class Controller:
         self.view.show_message("7. Generate Random Data")
         self.view.show_message("8. Find Data")
         self.view.show_message("9. Algorithms")
+        self.view.show_message("10. Export Data")
+        self.view.show_message("11. Dump Snapshot")
+        self.view.show_message("12. Restore Snapshot")
+        self.view.show_message("13. Purge Data in Batches")
+        self.view.show_message("14. Table Sizes")
+        self.view.show_message("15. Health")
         self.view.show_message("0. Quit")
         return input("Enter your choice: ")
     
@@ -66,19 +176,33 @@ class Controller:
         self.view.show_message("1. Pay Systems' Total Income")
         self.view.show_message("2. Company's Orders' thru Period")
         self.view.show_message("3. Top 5 Orders' Total Price")
+        self.view.show_message("4. Top Orders per Company")
+        self.view.show_message("5. Pay Systems' Income Histogram")
+        self.view.show_message("0. Quit")
+        return input("Enter your choice: ")
+
+    def show_health(self):
+        self.view.show_message("\nHealth:")
+        self.view.show_message("1. Sequential vs Index Scans")
+        self.view.show_message("2. Unused Indexes")
+        self.view.show_message("3. Cache Hit Ratio")
+        self.view.show_message("4. Dead Tuples")
+        self.view.show_message("5. Top Statements")
+        self.view.show_message("6. Recommended Indexes")
+        self.view.show_message("7. Plan Regressions")
         self.view.show_message("0. Quit")
         return input("Enter your choice: ")
         
     def insert_data(self):
         table, columns, data = self.view.get_insert_input()
-        if self.model.insert_data(table, columns, data):
+        if self.call(self.model.insert_data, table, columns, data):
             self.view.show_message("Data inserted successfully!")
         else:
             self.view.show_message("Data insertion failed!")
         
     def view_data(self):
         table, columns, condition = self.view.get_view_input()
-        data = self.model.get_data(table, columns, condition)
+        data = self.call(self.model.get_data, table, columns, condition)
         if data is not None:
             self.view.show_data(data, columns)
         else:
@@ -86,42 +210,45 @@ class Controller:
 
     def update_data(self):
         table, data, condition = self.view.get_update_input()
-        if self.model.update_data(table, data, condition):
+        if self.call(self.model.update_data, table, data, condition):
             self.view.show_message("Data updated successfully!")
         else:
             self.view.show_message("Data update failed!")
 
     def delete_data(self):
         table, condition = self.view.get_delete_input()
-        if self.model.delete_data(table, condition):
+        if self.call(self.model.delete_data, table, condition):
             self.view.show_message("Data deleted successfully!")
         else:
             self.view.show_message("Data deletion failed!")
             
     def create_table(self):
         table, columns, data_types = self.view.get_create_input()
-        if self.model.create_table(table, columns, data_types):
+        if self.call(self.model.create_table, table, columns, data_types):
             self.view.show_message("Table created successfully!")
         else:
             self.view.show_message("Table creation failed!")
             
     def drop_table(self):
         table = self.view.get_drop_input()
-        if self.model.drop_table(table):
+        if self.call(self.model.drop_table, table):
             self.view.show_message("Table dropped successfully!")
         else:
             self.view.show_message("Table drop failed!")
             
     def generate_random_data(self):
-        table, columns, data_types, parameters, rows_number, text_len = self.view.get_generate_random_input()
-        if self.model.generate_random_data(table, columns, data_types, parameters, rows_number, text_len):
+        table, columns, data_types, parameters, rows_number, text_len, batch_size, pipeline = self.view.get_generate_random_input()
+        pipeline = LoadPipeline(staging=pipeline == "staging") if pipeline else None
+        if self.call(self.model.generate_random_data, table, columns, data_types, parameters, rows_number, text_len, batch_size, pipeline):
+            if pipeline is not None:
+                self.view.show_data(pipeline.report["phases"].items(), ["phase", "seconds"])
             self.view.show_message("Random data generated successfully!")
         else:
             self.view.show_message("Random data generation failed!")
             
     def find_data(self):
         table, column, condition = self.view.get_find_input()
-        data = self.model.get_data(table, [column], condition)
+        data = self.call(self.model.get_data, table, [column], condition)
         if data is not None:
             self.view.show_data(data, [column])
         else:
@@ -129,24 +256,164 @@ class Controller:
             
     def pay_systems_total_income(self):
         left, right = self.view.get_pay_systems_total_income_input()
-        data = self.model.pay_systems_total_income(left, right)
+        sample = self.view.get_sample_input()
+        data = self.call(self.model.pay_systems_total_income, left, right, sample)
         if data is not None:
-            self.view.show_data(data, ["id", "name", "count", "total_income"])
+            if sample is None:
+                self.view.show_data(data, ["id", "name", "count", "total_income"])
+            else:
+                self.view.show_data(data, ["id", "name", "count", "count_ci", "total_income", "total_income_ci"])
         else:
             self.view.show_message("Data retrieval failed!")
             
     def company_orders_thru_period(self):
         left, right = self.view.get_company_orders_thru_period_input()
-        data = self.model.company_orders_thru_period(left, right)
+        sample = self.view.get_sample_input()
+        data = self.call(self.model.company_orders_thru_period, left, right, sample)
         if data is not None:
-            self.view.show_data(data, ["id", "company", "orders"])
+            if sample is None:
+                self.view.show_data(data, ["id", "company", "orders"])
+            else:
+                self.view.show_data(data, ["id", "company", "orders", "orders_ci"])
         else:
             self.view.show_message("Data retrieval failed!")
             
     def top_5_orders_total_price(self):
         company = self.view.get_top_5_orders_total_price_input()
-        data = self.model.top_5_orders_total_price(company)
+        data = self.call(self.model.top_5_orders_total_price, company)
         if data is not None:
             self.view.show_data(data, ["order_id", "total_price"])
         else:
             self.view.show_message("Data retrieval failed!")
+
+    def top_orders_per_company(self):
+        companies, k, order_by = self.view.get_top_orders_per_company_input()
+
+        def fetch():
+            rows = self.model.top_orders_per_company(companies, k, order_by)
+            return None if rows is None else list(rows)
+
+        data = self.call(fetch)
+        if data is not None:
+            self.view.show_data(data, ["company_id", "company", "rank", "order_id", order_by])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def pay_systems_income_histogram(self):
+        ranges, buckets = self.view.get_pay_systems_income_histogram_input()
+        data = self.call(self.model.pay_systems_income_histogram, ranges, buckets)
+        if data is not None:
+            headers = ["id", "name"] + [f"{left:g}..{right:g}" for left, right in data["bins"]]
+            for key in ("count", "total"):
+                self.view.show_message(f"\n{key.capitalize()}:")
+                rows = [list(pay_system) + list(values) for pay_system, values in zip(data["pay_systems"], data[key])]
+                self.view.show_data(rows, headers)
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def export_data(self):
+        table, columns, condition, path, fmt, parallel = self.view.get_export_input()
+        files = self.call(self.model.export_data, table, path, columns, condition, fmt, parallel)
+        if files is not None:
+            self.view.show_data(files, ["file", "rows"])
+        else:
+            self.view.show_message("Data export failed!")
+
+    def dump_snapshot(self):
+        directory, workers = self.view.get_snapshot_input()
+        report = self.call(self.model.dump_snapshot, directory, workers=workers)
+        if report is not None:
+            self.show_throughput(report)
+            self.view.show_message("Snapshot dumped successfully!")
+        else:
+            self.view.show_message("Snapshot dump failed!")
+
+    def restore_snapshot(self):
+        directory, workers = self.view.get_snapshot_input()
+        report = self.call(self.model.restore_snapshot, directory, workers)
+        if report is not None:
+            self.show_throughput(report)
+            self.view.show_data(report["phases"].items(), ["phase", "seconds"])
+            self.view.show_message("Snapshot restored successfully!")
+        else:
+            self.view.show_message("Snapshot restore failed!")
+
+    def show_throughput(self, report):
+        columns = ["rows", "bytes", "seconds", "rows_per_second", "mb_per_second"]
+        rows = [[table] + [result[column] for column in columns] for table, result in report["tables"].items()]
+        rows.append(["total"] + [report[column] for column in columns])
+        self.view.show_data(rows, ["table"] + columns)
+
+    def purge_data(self):
+        table, condition, batch_size, archive_table, pause = self.view.get_purge_input()
+        progress = self.call(self.model.purge_data, table, condition, batch_size, archive_table, pause,
+                                         on_progress=lambda batches, deleted, last_key: self.view.show_message(f"Batch {batches}: {deleted} rows deleted, last id {last_key}"))
+        if progress is not None:
+            self.view.show_message(f"{progress['deleted']} rows deleted in {progress['batches']} batches, {progress['seconds']} s")
+        else:
+            self.view.show_message("Data purge failed!")
+
+    def show_table_sizes(self):
+        exact = self.view.get_table_sizes_input()
+        tables = self.call(self.model.get_tables, exact)
+        if tables is not None:
+            rows = [[name, rows, f"{total / 2 ** 20:.1f} MB", f"{indexes / 2 ** 20:.1f} MB", analyzed, exact_rows]
+                    for name, rows, total, indexes, analyzed, exact_rows in tables]
+            self.view.show_data(rows, ["table", "estimated_rows", "total_size", "index_size", "last_analyze", "exact_rows"])
+        else:
+            self.view.show_message("Table sizes retrieval failed!")
+
+    def table_scans(self):
+        data = self.call(self.model.table_scans)
+        if data is not None:
+            self.view.show_data(data, ["table", "seq_scan", "idx_scan", "seq_ratio", "seq_tup_read", "live_rows"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def unused_indexes(self):
+        data = self.call(self.model.unused_indexes)
+        if data is not None:
+            rows = [[table, index, f"{size / 2 ** 20:.1f} MB", definition] for table, index, size, definition in data]
+            self.view.show_data(rows, ["table", "index", "size", "definition"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def cache_hit_ratio(self):
+        data = self.call(self.model.cache_hit_ratio)
+        if data is not None:
+            self.view.show_data(data, ["table", "heap_hits", "heap_reads", "heap_hit_ratio", "index_hit_ratio"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def dead_tuples(self):
+        data = self.call(self.model.dead_tuples)
+        if data is not None:
+            rows = [[table, live, dead, ratio, vacuum, f"{size / 2 ** 20:.1f} MB"] for table, live, dead, ratio, vacuum, size in data]
+            self.view.show_data(rows, ["table", "live_rows", "dead_rows", "dead_ratio", "last_vacuum", "size"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def top_statements(self):
+        limit = self.view.get_top_statements_input()
+        data = self.call(self.model.top_statements, limit)
+        if data is not None:
+            self.view.show_data(data, ["query", "calls", "total_ms", "mean_ms", "rows", "hit_ratio"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def recommend_indexes(self):
+        statements = self.call(self.model.recommend_indexes)
+        if statements is not None:
+            self.view.show_data([[statement] for statement in statements], ["statement"])
+        else:
+            self.view.show_message("Data retrieval failed!")
+
+    def check_plans(self):
+        baseline, update = self.view.get_check_plans_input()
+        findings = self.call(self.model.check_plans, baseline, update=update)
+        if findings is None:
+            self.view.show_message("Plan check failed!")
+        elif findings:
+            self.view.show_data(findings, ["query", "change", "baseline", "current"])
+        else:
+            self.view.show_message("No plan regressions found!")
@@ -0,0 +1,105 @@
+from typing import Optional
+
+# Sequential and index scans of every table, seq_ratio is the share of scans that read the whole table
+TABLE_SCANS_QUERY = '''
+SELECT
+    relname,
+    seq_scan,
+    COALESCE(idx_scan, 0),
+    round(seq_scan::numeric / NULLIF(seq_scan + COALESCE(idx_scan, 0), 0), 3) AS seq_ratio,
+    seq_tup_read,
+    n_live_tup
+FROM
+    pg_stat_user_tables
+ORDER BY
+    seq_tup_read DESC;
+'''
+
+# Indexes never scanned since the statistics were reset, indexes of constraints are needed anyway
+UNUSED_INDEXES_QUERY = '''
+SELECT
+    pg_stat_user_indexes.relname,
+    pg_stat_user_indexes.indexrelname,
+    pg_relation_size(pg_stat_user_indexes.indexrelid) AS size,
+    pg_get_indexdef(pg_stat_user_indexes.indexrelid)
+FROM
+    pg_stat_user_indexes
+    INNER JOIN pg_index ON pg_index.indexrelid = pg_stat_user_indexes.indexrelid
+WHERE
+    pg_stat_user_indexes.idx_scan = 0
+    AND NOT pg_index.indisunique
+    AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE pg_constraint.conindid = pg_index.indexrelid)
+ORDER BY
+    size DESC;
+'''
+
+# Share of the table and index blocks found in shared buffers, the total row comes first
+CACHE_HIT_QUERY = '''
+SELECT
+    COALESCE(relname, 'total'),
+    SUM(heap_blks_hit),
+    SUM(heap_blks_read),
+    round(SUM(heap_blks_hit)::numeric / NULLIF(SUM(heap_blks_hit + heap_blks_read), 0), 4) AS heap_hit_ratio,
+    round(SUM(COALESCE(idx_blks_hit, 0))::numeric / NULLIF(SUM(COALESCE(idx_blks_hit, 0) + COALESCE(idx_blks_read, 0)), 0), 4) AS index_hit_ratio
+FROM
+    pg_statio_user_tables
+GROUP BY
+    ROLLUP (relname)
+ORDER BY
+    relname NULLS FIRST;
+'''
+
+# Dead tuples left by updates and deletes and the last vacuum of every table
+DEAD_TUPLES_QUERY = '''
+SELECT
+    relname,
+    n_live_tup,
+    n_dead_tup,
+    round(n_dead_tup::numeric / NULLIF(n_live_tup + n_dead_tup, 0), 3) AS dead_ratio,
+    GREATEST(last_vacuum, last_autovacuum),
+    pg_table_size(relid)
+FROM
+    pg_stat_user_tables
+ORDER BY
+    n_dead_tup DESC;
+'''
+
+# pg_stat_statements names its time columns total_exec_time and mean_exec_time since PostgreSQL 13
+TOP_STATEMENTS_QUERY = '''
+SELECT
+    query,
+    calls,
+    round({total}::numeric, 2) AS total_ms,
+    round({mean}::numeric, 3) AS mean_ms,
+    rows,
+    round(shared_blks_hit::numeric / NULLIF(shared_blks_hit + shared_blks_read, 0), 4) AS hit_ratio
+FROM
+    pg_stat_statements
+WHERE
+    dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+ORDER BY
+    {total} DESC
+LIMIT
+    %s;
+'''
+
+
+def statements_query(cur) -> Optional[str]:
+    """
+    This function is used to build the top statements query for the installed version of pg_stat_statements.
+
+    Parameters:
+    cur (psycopg2.extensions.cursor): The cursor to look up the extension with.
+
+    Returns:
+    query (str or None): The query, or None if pg_stat_statements is not installed in the database.
+    """
+    cur.execute("SELECT to_regclass('pg_stat_statements') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return None
+    cur.execute(
+        "SELECT attname FROM pg_attribute WHERE attrelid = 'pg_stat_statements'::regclass AND attname IN ('total_exec_time', 'total_time')"
+    )
+    if cur.fetchone()[0] == "total_exec_time":
+        return TOP_STATEMENTS_QUERY.format(total="total_exec_time", mean="mean_exec_time")
+    return TOP_STATEMENTS_QUERY.format(total="total_time", mean="mean_time")
@@ -0,0 +1,301 @@
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# The SQL that creates tbl_order_change, its readers table and the triggers that fill it
+CHANGE_LOG_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "incremental.sql")
+
+# Every report reads the new orders grouped by one column: (group column, name table, condition, has total)
+REPORTS = {
+    "pay_systems_total_income": ("pay_system_id", "tbl_pay_system", "tbl_order.sum BETWEEN %(left)s AND %(right)s", True),
+    "company_orders_thru_period": ("company_id", "tbl_company", "tbl_order.date BETWEEN %(left)s AND %(right)s", False),
+}
+
+# The oldest transaction still running when the snapshot was taken, as xid, so age() compares it with xmin
+SNAPSHOT_XMIN_QUERY = "SELECT (pg_snapshot_xmin(pg_current_snapshot())::text::bigint % 4294967296)::text::xid"
+# Log rows are pruned once every reader has read them and they are older than this
+PRUNE_AGE = "10 minutes"
+# A reader that has not checkpointed for this long stops holding back the pruning, it reloads when it comes back
+READER_TIMEOUT = "1 day"
+# The time in seconds between two checkpoints of a reader whose position did not move
+CHECKPOINT_INTERVAL = 60.0
+
+
+def snapshot_xmin(cur) -> str:
+    """
+    This function is used to get the oldest transaction that was running when the snapshot of the cursor was taken.
+
+    Parameters:
+    cur (psycopg2.extensions.cursor): The cursor of a REPEATABLE READ transaction.
+
+    Returns:
+    xmin (str): The transaction id.
+    """
+    cur.execute(SNAPSHOT_XMIN_QUERY)
+    return cur.fetchone()[0]
+
+
+def settled(cur, table: str, key: str, low: int, high: int, xmin: str) -> int:
+    """
+    This function is used to find how far the watermark of a serial key can move.
+
+    A key is taken from the sequence when the row is written, not when it commits, so a running transaction
+    can still commit a key below the highest visible one. Rows written by transactions older than every
+    running transaction (xmin older than the snapshot xmin) took their keys before the running ones did.
+    The watermark moves up to the highest such key below the first key written by a newer transaction,
+    keys above it are read again by the next refresh.
+
+    Parameters:
+    cur (psycopg2.extensions.cursor): The cursor of the snapshot.
+    table (str): The name of the table.
+    key (str): The name of the serial key column.
+    low (int): The current watermark.
+    high (int): The highest visible key.
+    xmin (str): The snapshot xmin, see snapshot_xmin().
+
+    Returns:
+    watermark (int): The new watermark, every key up to it is committed or will never commit.
+    """
+    cur.execute(
+        f"""
+        SELECT COALESCE(max({key}), %(low)s)
+        FROM {table}
+        WHERE {key} > %(low)s
+            AND {key} < COALESCE(
+                (SELECT min({key}) FROM {table} WHERE {key} > %(low)s AND {key} <= %(high)s AND age(xmin) <= age(%(xmin)s::xid)),
+                %(high)s + 1)
+        """,
+        {"low": low, "high": high, "xmin": xmin},
+    )
+    return cur.fetchone()[0]
+
+
+class ChangeLogReader:
+    """
+    This class is used to follow tbl_order_change from one refresh to the next.
+
+    The reader keeps the seq up to which it has read every log row and the seqs above it it has read already,
+    so log rows that commit after rows with a higher seq are still found. checkpoint() records the position in
+    tbl_order_change_reader and deletes the log rows every reader has read, so the log does not grow with the history.
+    """
+
+    def __init__(self, name: str, connect: Optional[Callable] = None):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        name (str): The kind of reader, a unique suffix is added.
+        connect (callable, optional): The function returning a new (connection, cursor) pair that can write, used by
+            checkpoint(). Defaults to None, which neither records the position nor prunes the log.
+        """
+        self.name = f"{name}-{uuid.uuid4().hex[:12]}"
+        self.connect = connect
+        # (seq, seqs above it already read), None before the first read
+        self.position: Optional[Tuple[int, Tuple[int, ...]]] = None
+        self.checkpointed = False
+        self.last_checkpoint: Tuple[Optional[int], float] = (None, 0.0)
+
+    def read(self, cur, xmin: str) -> Optional[List[Tuple[Optional[int], str]]]:
+        """
+        This method is used to read the log rows added since the last read, in the snapshot of the cursor.
+
+        Parameters:
+        cur (psycopg2.extensions.cursor): The cursor of the snapshot.
+        xmin (str): The snapshot xmin, see snapshot_xmin().
+
+        Returns:
+        changes (list or None): The (order_id, op) of every new log row, or None if the changes are unknown:
+            the log is missing, this is the first read or the log rows after the last checkpoint may be pruned.
+        """
+        cur.execute("SELECT to_regclass('tbl_order_change') IS NOT NULL, to_regclass('tbl_order_change_reader') IS NOT NULL")
+        has_log, has_readers = cur.fetchone()
+        if not has_log:
+            self.position = None
+            return None
+
+        known = self.position is not None
+        if known and self.checkpointed and has_readers:
+            # A reader that timed out may have missed pruned rows
+            cur.execute("SELECT 1 FROM tbl_order_change_reader WHERE reader = %s", (self.name,))
+            known = cur.fetchone() is not None
+        seq, seen = self.position if known else (0, ())
+
+        cur.execute("SELECT COALESCE(max(seq), 0) FROM tbl_order_change")
+        high = max(cur.fetchone()[0], seq)
+        cur.execute(
+            "SELECT seq, order_id, op FROM tbl_order_change WHERE seq > %s AND seq <= %s AND seq <> ALL(%s::bigint[])",
+            (seq, high, list(seen)),
+        )
+        rows = cur.fetchall()
+        watermark = settled(cur, "tbl_order_change", "seq", seq, high, xmin)
+        self.position = (watermark, tuple(sorted(number for number in set(seen) | {row[0] for row in rows} if number > watermark)))
+        if not known:
+            return None
+        return [(order_id, op) for _, order_id, op in rows]
+
+    def checkpoint(self):
+        """
+        This method is used to record the position of the reader and to delete the log rows every reader has read.
+        """
+        if self.connect is None or self.position is None:
+            return
+        seq, at = self.last_checkpoint
+        if seq == self.position[0] and time.monotonic() - at < CHECKPOINT_INTERVAL:
+            return
+        conn, cur = self.connect()
+        if conn is None or cur is None:
+            raise ConnectionError("Unable to connect to the database")
+        try:
+            cur.execute("SELECT to_regclass('tbl_order_change_reader') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                return
+            cur.execute(
+                """
+                INSERT INTO tbl_order_change_reader (reader, seq) VALUES (%s, %s)
+                ON CONFLICT (reader) DO UPDATE SET seq = EXCLUDED.seq, checkpointed_at = now()
+                """,
+                (self.name, self.position[0]),
+            )
+            cur.execute("DELETE FROM tbl_order_change_reader WHERE checkpointed_at < now() - %s::interval", (READER_TIMEOUT,))
+            # A reader that has not checkpointed yet may still need the newest rows, so only old rows go
+            cur.execute(
+                """
+                DELETE FROM tbl_order_change
+                WHERE seq <= (SELECT min(seq) FROM tbl_order_change_reader) AND changed_at < now() - %s::interval
+                """,
+                (PRUNE_AGE,),
+            )
+            conn.commit()
+            self.checkpointed = True
+            self.last_checkpoint = (self.position[0], time.monotonic())
+        finally:
+            conn.close()
+
+
+class IncrementalReports:
+    """
+    This class is used to keep the results of the reports up to date by reading only the orders added since the last refresh.
+
+    Every (report, left, right) keeps an id watermark, the ids above it already counted and the count and total
+    per group. A refresh reads the orders above the watermark that were not counted yet and adds them to the
+    groups. The watermark only moves past ids that no running transaction can still commit, see settled(), so
+    orders that commit out of id order are counted too. Updates, deletes and truncates of tbl_order are logged
+    to tbl_order_change by the triggers of incremental.sql. When the log has new rows every report is computed
+    again from scratch. Without the log every refresh is a full recompute, since changes could not be detected.
+    A report older than full_interval seconds is computed again from scratch as well.
+    """
+
+    def __init__(self, model, full_interval: float = 600.0):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        model (Model): The Model used to connect to the database.
+        full_interval (float, optional): The longest time in seconds a report is updated incrementally. Defaults to 600.0.
+        """
+        self.model = model
+        self.full_interval = full_interval
+        self.states: Dict[tuple, dict] = {}
+        self.log = ChangeLogReader("reports", model.connect)
+        self.lock = threading.Lock()
+        self.stats = {"incremental": 0, "full": 0}
+
+    def refresh(self, report: str, left, right) -> List[Tuple]:
+        """
+        This method is used to bring a report up to date and return its result.
+
+        Parameters:
+        report (str): pay_systems_total_income or company_orders_thru_period.
+        left: The left bound of the report.
+        right: The right bound of the report.
+
+        Returns:
+        data (list): The rows of the report in the same form as the Model method of the same name.
+        """
+        group_column, name_table, condition, has_total = REPORTS[report]
+        key = (report, str(left), str(right))
+
+        # The states and the log position move together, so the refreshes run one at a time
+        with self.lock:
+            conn, cur = self.model.connect(read_only=True, operation="report")
+            if conn is None or cur is None:
+                raise ConnectionError("Unable to connect to the database")
+
+            try:
+                # One snapshot for the watermark, the change log and the new orders
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                xmin = snapshot_xmin(cur)
+                changes = self.log.read(cur, xmin)
+                if changes is None or changes:
+                    self.states.clear()
+                cur.execute("SELECT COALESCE(max(id), 0) FROM tbl_order")
+                high = cur.fetchone()[0]
+
+                state = self.states.get(key)
+                if state is None or high < state["watermark"] or time.monotonic() - state["computed_at"] > self.full_interval:
+                    state = {"watermark": 0, "seen": (), "groups": {}, "computed_at": time.monotonic()}
+                    self.stats["full"] += 1
+                else:
+                    state = dict(state, groups=dict(state["groups"]))
+                    self.stats["incremental"] += 1
+
+                params = {"watermark": state["watermark"], "high": high, "seen": list(state["seen"]), "left": left, "right": right}
+                new_orders = f"tbl_order.id > %(watermark)s AND tbl_order.id <= %(high)s AND tbl_order.id <> ALL(%(seen)s::int[]) AND {condition}"
+                total = "SUM(tbl_order.sum)" if has_total else "0"
+                cur.execute(
+                    f"""
+                    SELECT
+                        tbl_order.{group_column},
+                        COUNT(*),
+                        {total}
+                    FROM
+                        tbl_order
+                    WHERE
+                        {new_orders}
+                    GROUP BY
+                        tbl_order.{group_column};
+                    """,
+                    params,
+                )
+                for group, count, group_total in cur.fetchall():
+                    old_count, old_total = state["groups"].get(group, (0, 0))
+                    state["groups"][group] = (old_count + count, old_total + group_total)
+
+                # The ids counted above the new watermark are kept, so they are not counted again
+                watermark = settled(cur, "tbl_order", "id", state["watermark"], high, xmin)
+                cur.execute(f"SELECT tbl_order.id FROM tbl_order WHERE {new_orders} AND tbl_order.id > %(settled)s", dict(params, settled=watermark))
+                seen = {number for number in state["seen"] if number > watermark} | {row[0] for row in cur.fetchall()}
+                state.update(watermark=watermark, seen=tuple(sorted(seen)))
+
+                cur.execute(f"SELECT id, name FROM {name_table}")
+                names = dict(cur.fetchall())
+                conn.commit()
+            finally:
+                conn.close()
+
+            self.states[key] = state
+
+        try:
+            self.log.checkpoint()
+        except Exception as e:
+            print("Error: Invalid change log checkpoint\n", e)
+
+        rows = []
+        for group, (count, group_total) in sorted(state["groups"].items()):
+            if group in names and count > 0:
+                rows.append((group, names[group], count, group_total) if has_total else (group, names[group], count))
+        return rows
+
+    def reset(self, report: Union[str, None] = None):
+        """
+        This method is used to drop the kept state, so the next refresh is a full recompute.
+
+        Parameters:
+        report (str, optional): The report to reset. Defaults to None, which resets every report.
+        """
+        with self.lock:
+            for key in list(self.states):
+                if report is None or key[0] == report:
+                    del self.states[key]
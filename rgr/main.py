@@ -1,11 +1,26 @@
+import os
+import sys
+
+# The modules shared by the apps are in the common package at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
 from controller import Controller
 
 DB_NAME = "CustomerCompaniesManagementSystem"
 USER = "postgres"
 HOST = "localhost"
 PASSWORD = "1111"
+# Read replicas as "host:port", e.g. ["localhost:5433"]
+REPLICAS = []
+# Workload log every Model call is recorded to, e.g. "workload.jsonl.gz", replayed with workload.py
+RECORD = None
+# Directory every menu action is profiled into, e.g. "profiles", and the profiler, "sampling" or "cprofile"
+PROFILE = None
+PROFILE_MODE = "sampling"
 
 if __name__ == "__main__":
-    controller = Controller(DB_NAME, USER, PASSWORD, HOST)
+    controller = Controller(DB_NAME, USER, PASSWORD, HOST, REPLICAS, RECORD, PROFILE, PROFILE_MODE)
     controller.run()
     
\ No newline at end of file
@@ -1,42 +1,487 @@
+import math
+import time
+
 import psycopg2
-from typing import Optional, Tuple, Union, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterator, Optional, Tuple, Union, List
+
+from activity import STATEMENT_TIMEOUTS, Activity, ActivityCursor
+from admission import Admission, admitted
+from bulkload import LoadPipeline
+from common.columnar import arrow_types, concat_chunks, fetch_columns, pa, to_arrow
+from common.export import EXPORT_FORMATS, export_parallel, export_query, key_ranges
+from common.filters import Comparison, Filter, Range, Raw, check_identifier
+from health import CACHE_HIT_QUERY, DEAD_TUPLES_QUERY, TABLE_SCANS_QUERY, UNUSED_INDEXES_QUERY, statements_query
+from incremental import CHANGE_LOG_SQL, IncrementalReports
+from ordercache import OrderCache
+from plans import compare, explain, load_baseline, representative_parameters, save_baseline
+from resilience import RetryMetrics, RetryPolicy, retried
+from routing import ReplicaRouter, TrackedConnection, replica_dsn
+from snapshot import TABLES, dump_snapshot, restore_snapshot
+from common.upsert import NULL_MARKER, RowsReader, bulk_upsert
+from writebehind import WriteBehindQueue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Report queries, plans.py explains them with the same text
+PAY_SYSTEMS_QUERY = '''
+SELECT
+    tbl_pay_system.id,
+    tbl_pay_system.name,
+    COUNT(*) AS Count,
+    SUM(tbl_order.sum) AS total
+FROM
+    tbl_order
+    INNER JOIN tbl_pay_system ON tbl_order.pay_system_id = tbl_pay_system.id
+WHERE
+    sum BETWEEN %(left)s AND %(right)s
+GROUP BY
+    tbl_pay_system.id,
+    tbl_pay_system.name;
+'''
+
+COMPANY_ORDERS_QUERY = '''
+SELECT
+    tbl_company.id,
+    tbl_company.name,
+    COUNT(*) AS Count
+FROM
+    tbl_order
+    INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+WHERE
+    tbl_order.date BETWEEN %(left)s AND %(right)s
+GROUP BY
+    tbl_company.id,
+    tbl_company.name;
+'''
+
+TOP_ORDERS_QUERY = '''
+SELECT
+    tbl_order.id,
+    tbl_order.sum
+FROM
+    tbl_order
+    INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+WHERE
+    tbl_company.name = %(company)s
+ORDER BY
+    tbl_order.sum DESC
+LIMIT
+    5;
+'''
+
+# Insert of generate_random_data, select is the SELECT list of random_select()
+RANDOM_INSERT = "INSERT INTO {table} ({columns}) {select} FROM generate_series(1, {rows})"
+
+# Sampled report queries return the group columns followed by the sample count, sum and sum of squares
+PAY_SYSTEMS_SAMPLE_QUERY = '''
+SELECT
+    tbl_pay_system.id,
+    tbl_pay_system.name,
+    COUNT(*) AS Count,
+    SUM(tbl_order.sum) AS total,
+    SUM(tbl_order.sum * tbl_order.sum) AS total_squares
+FROM
+    tbl_order {sample}
+    INNER JOIN tbl_pay_system ON tbl_order.pay_system_id = tbl_pay_system.id
+WHERE
+    tbl_order.sum BETWEEN %(left)s AND %(right)s
+GROUP BY
+    tbl_pay_system.id,
+    tbl_pay_system.name;
+'''
+
+COMPANY_ORDERS_SAMPLE_QUERY = '''
+SELECT
+    tbl_company.id,
+    tbl_company.name,
+    COUNT(*) AS Count,
+    NULL,
+    NULL
+FROM
+    tbl_order {sample}
+    INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+WHERE
+    tbl_order.date BETWEEN %(left)s AND %(right)s
+GROUP BY
+    tbl_company.id,
+    tbl_company.name;
+'''
+
+SAMPLE_METHODS = ("SYSTEM", "BERNOULLI")
+# z-score of the 95% confidence interval
+CONFIDENCE_Z = 1.96
+# Sample rate of the pilot run in auto mode, in percent
+PILOT_PERCENT = 0.1
+
+
+# For every class of heavy calls: the calls that run at once, the time in seconds a call waits for a slot and the calls that may wait.
+# The rest of the calls keep the connections the limits leave free.
+ADMISSION_LIMITS = {
+    "aggregate": (2, 30.0, 16),
+    "export": (1, 60.0, 4),
+}
+
+
+def select_statement(table: str, columns: Tuple[str, ...], where: str) -> str:
+    # The values of the condition are bound by psycopg2, the statement only holds placeholders
+    return f"SELECT {', '.join(columns)} FROM {table}{where}"
+
+
+def random_select(data_types: list, parameters: list, text_len: int = 1) -> str:
+    """
+    This function is used to build the SELECT list that generates one random row, see Model.generate_random_data().
+
+    Parameters:
+    data_types (list): The data types of the columns, e.g. int, text or fk_int.
+    parameters (list): A pair of parameters of the random data of every column.
+    text_len (int, optional): The length of the generated text. Defaults to 1.
+
+    Returns:
+    query (str): The SELECT without FROM.
+
+    Raises:
+    ValueError: If a data type is not supported.
+    """
+
+    def handle_int(min_value: int, max_value: int) -> str:
+        return f''' trunc(random() * ({max_value} - {min_value} + 1) + {min_value})::integer,'''
+    
+    def handle_text(min_value: int, max_value: int, text_len: int) -> str:
+        random_selection = []
+        for _ in range(text_len):
+            random_selection.append(f"chr(trunc(random() * ({max_value} - {min_value} + 1) + {min_value})::int)")
+        random_selection = " || ".join(random_selection)
+
+        return f" {random_selection},"
+    
+    def handle_date(min_value: str, max_value: str) -> str:
+        return f" (TIMESTAMP '{min_value}' + (random() * (TIMESTAMP '{max_value}' - TIMESTAMP '{min_value}'))::interval)::date,"
+    
+    def handle_time(min_value: str, max_value: str) -> str:
+        return f" (random() * ('{max_value}'::time - '{min_value}'::time) + '{min_value}'::time)::time,"
+    
+    def handle_timestamp(min_value: str, max_value: str) -> str:
+        return f" (date_trunc('second', TIMESTAMP '{min_value}' + (random() * (TIMESTAMP '{max_value}' - TIMESTAMP '{min_value}'))::interval))::timestamp,"
+    
+    def handle_bool() -> str:
+        return f" (random() < 0.5)::bool,"
+    
+    def handle_foreign_key(parent_table: str, parent_column: str) -> str:
+        return f'''
+        (SELECT
+            {parent_column}
+        FROM
+            {parent_table}
+        ORDER BY
+            random()
+        LIMIT
+            1),'''
+
+    query = "SELECT"
+
+    for parameter, data_type in zip(parameters, data_types):
+        if data_type == 'fk_int':
+            parent_table, parent_column = parameter
+            query += handle_foreign_key(parent_table, parent_column)
+            
+        elif data_type == 'int':
+            min_value, max_value = parameter
+            min_value = int(min_value)
+            max_value = int(max_value)
+            query += handle_int(min_value, max_value)
+            
+        elif data_type == 'text':
+            min_value, max_value = parameter
+            min_value = int(min_value)
+            max_value = int(max_value)
+            query += handle_text(min_value, max_value, text_len)
+            
+        elif data_type == 'date':
+            min_value, max_value = parameter
+            query += handle_date(min_value, max_value)
+            
+        elif data_type == 'time':
+            min_value, max_value = parameter
+            query += handle_time(min_value, max_value)
+            
+        elif data_type == 'timestamp':
+            min_value, max_value = parameter
+            min_value = ' '.join(min_value.split('/'))
+            max_value = ' '.join(max_value.split('/'))
+            query += handle_timestamp(min_value, max_value)
+            
+        elif data_type == 'bool':
+            query += handle_bool()
+            
+        else:
+            raise ValueError(f"Unsupported data type '{data_type}'")
+
+    return query.rstrip(',')
+
 
 class Model:
-    def __init__(self, db_name: str, user: str, password: str, host: str):
+    def __init__(self, db_name: str, user: str, password: str, host: str, replicas: Optional[List[str]] = None,
+                 replica_selection: str = "round_robin", read_your_writes: float = 0.0, fallback_hosts: Optional[List[str]] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
         """
         This is the constructor method for the class. It initializes the instance variables with the provided values.
 
         Parameters:
         db_name (str): The name of the PostgreSQL database to connect to.
         user (str): The username used to authenticate with the PostgreSQL server.
-        host (str): The host of the PostgreSQL server.
+        host (str): The host of the PostgreSQL server, optionally with the port as "host:port".
         password (str): The password used to authenticate with the PostgreSQL server.
+        replicas (list, optional): The read replicas, as libpq DSNs ("host=localhost port=5433") or "host:port" strings.
+            Read-only methods are routed to them. Defaults to None, which sends everything to host.
+        replica_selection (str, optional): round_robin or least_loaded. Defaults to "round_robin".
+        read_your_writes (float, optional): The time in seconds reads stay on the primary after a write. Defaults to 0.0.
+        fallback_hosts (list, optional): The hosts tried, as "host" or "host:port", when host can not be reached.
+            Write connections skip hosts that only accept reads. Defaults to None.
+        retry_policy (RetryPolicy, optional): How often and how long to wait before a connection or a transaction is tried again.
+            Defaults to None, which means RetryPolicy().
         """
         self.db_name = db_name
         self.user = user
         self.password = password
         self.host = host
-
-    def connect(self) -> Tuple[Optional[psycopg2.extensions.connection], Optional[psycopg2.extensions.cursor]]:
+        self.replicas = None
+        if replicas:
+            dsns = [replica_dsn(replica, db_name, user, password) for replica in replicas]
+            self.replicas = ReplicaRouter(dsns, replica_selection, read_your_writes)
+        # How many times each column was used in a structured filter, per table
+        self.filter_usage: Dict[str, Counter] = {}
+        # Buffer of insert_data rows written in the background, see enable_write_behind()
+        self.write_behind: Optional[WriteBehindQueue] = None
+        # Per-report watermarks and partial aggregates of the incremental reports
+        self.incremental = IncrementalReports(self)
+        # In-memory copy of tbl_order the reports answer from, see enable_order_cache()
+        self.order_cache: Optional[OrderCache] = None
+        self.order_cache_directory: Optional[str] = None
+        # Coalesces identical concurrent reports and limits the reports running at once, None turns it off
+        self.admission: Optional[Admission] = Admission(ADMISSION_LIMITS)
+        # The time in seconds a statement of each class may run, None for no limit
+        self.statement_timeouts: Dict[str, Optional[float]] = dict(STATEMENT_TIMEOUTS)
+        # The connections, rows and cancellations of the running operation
+        self.activity = Activity()
+        # The hosts that are tried, the last host that was reached first
+        self.hosts = [host] + list(fallback_hosts or [])
+        self.current_host = host
+        self.retry_policy = retry_policy or RetryPolicy()
+        # Calls, retries, failovers and latencies of connect() and the retried methods
+        self.retry_metrics = RetryMetrics()
+
+    def connect(self, read_only: bool = False, operation: Optional[str] = None) -> Tuple[Optional[psycopg2.extensions.connection], Optional[psycopg2.extensions.cursor]]:
         """
         This method is used to establish a connection to the PostgreSQL database.
 
         It uses the psycopg2 library to create a connection and a cursor object.
         The connection details are taken from the instance variables of the class.
 
+        Parameters:
+        read_only (bool, optional): The connection only reads, so it can go to a replica. If no replica is reachable
+            the primary is used. Defaults to False.
+        operation (str, optional): The class of the statements, its limit in statement_timeouts is set on the connection.
+            Defaults to None, which means "read" for read-only connections and "write" otherwise.
+
         Returns:
         conn (psycopg2.extensions.connection, optional): The connection object to the database, or None if the connection was not successful.
         cur (psycopg2.extensions.cursor, optional): The cursor object to execute PostgreSQL commands through Python, or None if the connection was not successful.
         """
+        operation = operation or ("read" if read_only else "write")
+        timeout = self.statement_timeouts.get(operation)
+        options = {} if timeout is None else {"options": f"-c statement_timeout={int(timeout * 1000)}"}
+
+        if self.replicas is not None:
+            if not read_only:
+                self.replicas.mark_write()
+            else:
+                for dsn in self.replicas.candidates():
+                    try:
+                        conn = self.replicas.connect(dsn, **options)
+                        return self._track(conn)
+                    except psycopg2.OperationalError as e:
+                        print("Unable to connect to the replica\n", e)
+
+        if len(self.hosts) > 1 and not read_only:
+            # A standby in the host list must not take writes
+            options["target_session_attrs"] = "read-write"
+
+        start = time.perf_counter()
+        for attempt in range(self.retry_policy.attempts + 1):
+            if attempt > 0:
+                time.sleep(self.retry_policy.delay(attempt - 1))
+            for host in [self.current_host] + [host for host in self.hosts if host != self.current_host]:
+                try:
+                    name, _, port = host.partition(":")
+                    port = f" port='{port}'" if port else ""
+                    conn = psycopg2.connect(f"dbname='{self.db_name}' user='{self.user}' host='{name}' password='{self.password}'{port}",
+                                            connection_factory=TrackedConnection, **options)
+                except psycopg2.OperationalError as e:
+                    error = e
+                    continue
+                self.current_host = host
+                self.retry_metrics.record("connect", attempt, time.perf_counter() - start, True, host != self.host)
+                return self._track(conn)
+
+        self.retry_metrics.record("connect", self.retry_policy.attempts, time.perf_counter() - start, False)
+        print("Unable to connect to the database\n", error)
+        return None, None
+
+    def _track(self, conn: TrackedConnection) -> Tuple[TrackedConnection, ActivityCursor]:
+        # The cursors of the connection count rows and cancellations, cancel() reaches the connection
+        self.activity.register(conn)
+        conn.cursor_factory = ActivityCursor
+        return conn, conn.cursor()
+
+    def cancel(self) -> int:
+        """
+        This method is used to cancel the statements running on the connections of the running operation, e.g. after Ctrl-C.
+
+        The operation is the one followed by Model.activity, see Activity.follow(). The connections of background
+        threads, e.g. the write-behind queue and the order cache, keep running. The server stops the statements
+        and the methods running them fail as if the statements had failed.
+
+        Returns:
+        count (int): The number of connections a cancel request was sent to.
+        """
+        return self.activity.cancel()
+
+    def _where(self, table: str, condition) -> Tuple[str, list]:
+        """
+        This method is used to build the WHERE clause of a query from a condition.
+
+        Parameters:
+        table (str): The name of the table the condition is applied to.
+        condition (str, Filter or None): A raw SQL condition, a structured filter, or None.
+
+        Returns:
+        where (str): The WHERE clause with %s placeholders, or an empty string if there is no condition.
+        params (list): The values to bind to the placeholders.
+        """
+        if condition is None:
+            return "", []
+
+        if isinstance(condition, Filter):
+            usage = self.filter_usage.setdefault(table, Counter())
+            for column in condition.columns():
+                usage[column.split('.')[-1]] += 1
+            sql, params = condition.compile()
+            return f" WHERE {sql}", params
+
+        # Raw conditions are kept as they are, only % is escaped for the parameter binding
+        return f" WHERE {condition.replace('%', '%%')}", []
+
+    def _stream(self, conn: psycopg2.extensions.connection, query: str, params: Union[list, tuple, dict], chunk_size: int) -> Iterator[tuple]:
+        """
+        This method is used to stream the rows of a query through a server-side cursor.
+
+        Only chunk_size rows are held in memory at once. The connection is closed when the
+        stream is exhausted or closed.
+
+        Parameters:
+        conn (psycopg2.extensions.connection): The connection to run the query on.
+        query (str): The query to execute.
+        params (list, tuple or dict): The values to bind to the placeholders of the query.
+        chunk_size (int): The number of rows fetched from the server per round trip.
+
+        Returns:
+        rows (iterator): An iterator over the rows of the query.
+        """
+        try:
+            with conn.cursor(name="stream") as cur:
+                cur.itersize = chunk_size
+                cur.execute(query, params)
+                for row in cur:
+                    yield row
+            conn.commit()
+        except Exception as e:
+            print("Error: Invalid data stream\n", e)
+        finally:
+            conn.close()
+
+    def _approximate_report(self, query: str, params: dict, sample: Union[float, str], method: str, latency_budget: float) -> Union[List[Tuple], None]:
+        """
+        This method is used to run a report on a TABLESAMPLE of tbl_order and scale the result up.
+
+        With a sample rate p the estimates are count / p and sum / p, and the variances are
+        count * (1 - p) / p^2 and sum_of_squares * (1 - p) / p^2 as for Bernoulli sampling.
+        SYSTEM sampling picks whole pages, so its intervals are optimistic when similar orders share pages.
+
+        In auto mode a pilot query runs at PILOT_PERCENT and the sample rate is scaled by the remaining
+        latency budget, assuming the run time grows linearly with the rate, which holds for SYSTEM.
+
+        Parameters:
+        query (str): One of the *_SAMPLE_QUERY templates.
+        params (dict): The values to bind to the template.
+        sample (float or str): The percent of tbl_order to sample, or "auto".
+        method (str): The TABLESAMPLE method, SYSTEM or BERNOULLI.
+        latency_budget (float): The time in seconds the auto mode aims for.
+
+        Returns:
+        data (list or None): A list of (group columns..., count, count_ci, total, total_ci) tuples.
+        If there is an error in connection, execution or the parameters, it returns None.
+        """
+        method = method.upper()
+        if method not in SAMPLE_METHODS:
+            print("Error: Invalid sample method\n", method)
+            return None
+
+        conn, cur = self.connect(read_only=True, operation="report")
+
+        if conn is None or cur is None:
+            return None
+
+        def run(percent: float) -> list:
+            sample_clause = "" if percent >= 100 else f"TABLESAMPLE {method} (%(percent)s)"
+            cur.execute(query.format(sample=sample_clause), dict(params, percent=percent))
+            return cur.fetchall()
+
         try:
-            conn = psycopg2.connect(f"dbname='{self.db_name}' user='{self.user}' host='{self.host}' password='{self.password}'")
-            cur = conn.cursor()
-        except psycopg2.OperationalError as e:
-            print("Unable to connect to the database\n", e)
-            return None, None
+            if sample == "auto":
+                start = time.perf_counter()
+                data = run(PILOT_PERCENT)
+                elapsed = time.perf_counter() - start
+                remaining = latency_budget - elapsed
+                percent = PILOT_PERCENT
+                if remaining > 0:
+                    percent = min(100.0, PILOT_PERCENT * remaining / max(elapsed, 1e-3))
+                    data = run(percent)
+            else:
+                percent = float(sample)
+                if not 0 < percent <= 100:
+                    raise ValueError(f"Sample percent must be in (0, 100], got {percent}")
+                data = run(percent)
+        except Exception as e:
+            print("Error: Invalid approximate report\n", e)
+            return None
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        p = percent / 100
+        scaled = []
+        for row in data:
+            *group, count, total, total_squares = row
+            count_ci = CONFIDENCE_Z * math.sqrt(count * (1 - p)) / p
+            if total is None:
+                total_ci = None
+            else:
+                total, total_squares = float(total), float(total_squares)
+                total_ci = CONFIDENCE_Z * math.sqrt(total_squares * (1 - p)) / p
+                total = total / p
+            scaled.append((*group, round(count / p), round(count_ci), total, total_ci))
 
-        return conn, cur
+        return scaled
 
+    @retried("write")
     def insert_data(self, table: str, columns: list, data: dict) -> bool:
         """
         This method is used to insert data into a specific table in the database.
@@ -48,7 +493,11 @@ class Model:
 
         Returns:
         bool: True if the data was successfully inserted, False otherwise.
+        In write-behind mode True means the data was queued, failed writes are passed to the on_error callback.
         """
+        if self.write_behind is not None:
+            return self.write_behind.put(table, columns, [data[key] for key in data])
+
         conn, cur = self.connect()
         
         if conn is None or cur is None:
@@ -73,21 +522,136 @@ class Model:
 
         return True
     
-    def get_tables(self) -> Union[list, None]:
+    def enable_write_behind(self, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 10000,
+                            put_timeout: Optional[float] = None, on_error=None) -> WriteBehindQueue:
+        """
+        This method is used to make insert_data queue the rows and return instead of inserting them one by one.
+
+        A background thread writes the queued rows of every table with multi-row inserts, when batch_size rows
+        are queued or every flush_interval seconds. The queued rows are written when the program exits.
+
+        Parameters:
+        batch_size (int, optional): The number of rows of one table written at once. Defaults to 500.
+        flush_interval (float, optional): The longest time in seconds a row waits in the queue. Defaults to 1.0.
+        max_pending (int, optional): The number of rows the queue holds before insert_data blocks. Defaults to 10000.
+        put_timeout (float, optional): The time in seconds insert_data waits for space in a full queue before it returns False.
+            Defaults to None, which waits forever.
+        on_error (callable, optional): The function called with (table, columns, rows, exception) for rows that could not be written.
+            Defaults to None, which prints the error.
+
+        Returns:
+        write_behind (WriteBehindQueue): The queue, its stats attribute counts the queued, written and failed rows.
+        """
+        self.disable_write_behind()
+        self.write_behind = WriteBehindQueue(self.connect, batch_size, flush_interval, max_pending, put_timeout, on_error)
+        return self.write_behind
+
+    def disable_write_behind(self):
+        """
+        This method is used to write the queued rows, stop the background thread and make insert_data insert directly again.
+        """
+        if self.write_behind is not None:
+            self.write_behind.close()
+            self.write_behind = None
+
+    def enable_order_cache(self, directory: Optional[str] = None, refresh_interval: float = 5.0) -> Union[OrderCache, None]:
+        """
+        This method is used to make the three reports answer from an in-memory copy of tbl_order.
+
+        The copy is loaded now and refreshed every refresh_interval seconds with the orders added or changed
+        since the last refresh. Changes are found through the change log of install_change_log(), without it
+        every refresh loads the whole table. The cache records how far it read the log, so the log can be pruned. Sampled and incremental reports still go to the database.
+
+        Parameters:
+        directory (str, optional): The directory the copy is saved to by disable_order_cache() and mapped from here,
+            so only the changes since the save are loaded. Defaults to None, which keeps the copy in memory only.
+        refresh_interval (float, optional): The time in seconds between refreshes. Defaults to 5.0.
+
+        Returns:
+        order_cache (OrderCache or None): The cache, its stats attribute counts the full and delta loads.
+        If there is an error in connection or execution, it returns None.
+        """
+        self.disable_order_cache()
+        try:
+            order_cache = OrderCache(partial(self.connect, read_only=True, operation="bulk"), checkpoint_connect=self.connect)
+            if directory is not None:
+                order_cache.open(directory)
+            order_cache.refresh()
+        except Exception as e:
+            print("Error: Invalid order cache load\n", e)
+            return None
+
+        order_cache.start(refresh_interval)
+        self.order_cache = order_cache
+        self.order_cache_directory = directory
+        return order_cache
+
+    def disable_order_cache(self):
+        """
+        This method is used to stop the refreshes of the order cache, save it if it has a directory and make the reports query the database again.
+        """
+        if self.order_cache is not None:
+            self.order_cache.stop()
+            if self.order_cache_directory is not None:
+                try:
+                    self.order_cache.save(self.order_cache_directory)
+                except Exception as e:
+                    print("Error: Invalid order cache save\n", e)
+            self.order_cache = None
+
+    def _from_order_cache(self, report: str, *args) -> Union[List[Tuple], None]:
+        # None sends the report to the database
+        if self.order_cache is None:
+            return None
+        try:
+            return getattr(self.order_cache, report)(*args)
+        except Exception as e:
+            print("Error: Invalid order cache report\n", e)
+            return None
+
+    @retried("read")
+    def get_tables(self, exact: bool = False, workers: int = 4) -> Union[list, None]:
         """
-        This method is used to retrieve the names of all the tables in the database.
+        This method is used to retrieve the tables of the database with their estimated sizes.
+
+        The estimates come from the catalog in one query without reading the tables: the row count is
+        pg_class.reltuples scaled to the current number of pages, like the planner does.
+
+        Parameters:
+        exact (bool, optional): Also count the rows of every table with count(*), several tables at once. Defaults to False.
+        workers (int, optional): The number of tables counted at once. Defaults to 4.
 
         Returns:
-        tables (list or None): A list of strings representing the names of the tables in the database.
+        tables (list or None): A list of (name, estimated_rows, total_bytes, index_bytes, last_analyze, exact_rows) tuples.
+            estimated_rows is None for tables that were never analyzed, exact_rows is None unless exact is set.
         None: If there is an error in connection or execution, or if there are no tables in the database.
         """
-        conn, cur = self.connect()
+        conn, cur = self.connect(read_only=True)
 
         if conn is None or cur is None:
             return None
         
         try:
-            query = "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"
+            query = """
+            SELECT
+                pg_class.relname,
+                CASE
+                    WHEN pg_class.relkind NOT IN ('r', 'p', 'm') OR pg_class.reltuples < 0 THEN NULL
+                    WHEN pg_class.relpages = 0 THEN pg_class.reltuples::bigint
+                    ELSE (pg_class.reltuples / pg_class.relpages * (pg_relation_size(pg_class.oid) / current_setting('block_size')::int))::bigint
+                END,
+                pg_total_relation_size(pg_class.oid),
+                pg_indexes_size(pg_class.oid),
+                GREATEST(pg_stat_user_tables.last_analyze, pg_stat_user_tables.last_autoanalyze)
+            FROM
+                pg_class
+                INNER JOIN pg_namespace ON pg_namespace.oid = pg_class.relnamespace
+                LEFT JOIN pg_stat_user_tables ON pg_stat_user_tables.relid = pg_class.oid
+            WHERE
+                pg_namespace.nspname = 'public' AND pg_class.relkind IN ('r', 'p', 'v', 'm', 'f')
+            ORDER BY
+                pg_class.relname
+            """
             cur.execute(query)
             tables = cur.fetchall()
         except Exception as e:
@@ -102,8 +666,31 @@ class Model:
         if len(tables) == 0:
             return None
 
-        return tables
-
+        counts = [None] * len(tables)
+        if exact:
+            # The counts run in worker threads, their connections still belong to the operation
+            connect = self.activity.bind(self.connect)
+
+            def count(table: str) -> int:
+                count_conn, count_cur = connect(read_only=True, operation="report")
+                if count_conn is None or count_cur is None:
+                    raise ConnectionError("Unable to connect to the database")
+                try:
+                    count_cur.execute(f'SELECT count(*) FROM "{table}"')
+                    return count_cur.fetchone()[0]
+                finally:
+                    count_conn.close()
+
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                    counts = list(executor.map(count, [table[0] for table in tables]))
+            except Exception as e:
+                print("Error: Invalid row count\n", e)
+                return None
+
+        return [table + (rows,) for table, rows in zip(tables, counts)]
+
+    @retried("read")
     def get_data(self, table: str, columns: list, condition=None) -> Union[list, None]:
         """
         This method is used to retrieve data from a specific table in the database.
@@ -111,27 +698,22 @@ class Model:
         Parameters:
         table (str): The name of the table from which the data will be retrieved.
         columns (list): The names of the columns to be retrieved.
-        condition (str, optional): The condition for the data retrieval. Defaults to None.
+        condition (str or Filter, optional): The condition for the data retrieval. Defaults to None.
 
         Returns:
         data (list or None): A list of tuples representing the rows of data retrieved from the database.
         None: If there is an error in connection or execution, or if the table is empty
         """
-        conn, cur = self.connect()
+        conn, cur = self.connect(read_only=True)
 
         if conn is None or cur is None:
             return None
         
-        # Convert the list of columns into a comma-separated string
-        columns_str = ', '.join(columns)
-        
         try:
-            if condition is None:
-                query = f"SELECT {columns_str} FROM {table}"
-            else:
-                query = f"SELECT {columns_str} FROM {table} WHERE {condition}"
+            where, params = self._where(table, condition)
+            query = select_statement(table, tuple(columns), where)
 
-            cur.execute(query)
+            cur.execute(query, params)
             data = cur.fetchall()
         except Exception as e:
             print("Error: Invalid data get\n", e)
@@ -147,6 +729,114 @@ class Model:
 
         return data
 
+    @retried("read")
+    def get_columns(self, table: str, columns: list, condition=None, chunk_size: int = 65536, arrow: bool = False) -> Union[dict, "pa.Table", None]:
+        """
+        This method is used to retrieve data from a specific table in the database as columns instead of rows.
+
+        The rows are read chunk by chunk with binary COPY when every column has a fixed-width type
+        (int, float, bool, date, timestamp), so no Python object is created per value. Other columns
+        are read through a server-side cursor.
+
+        Parameters:
+        table (str): The name of the table from which the data will be retrieved.
+        columns (list): The names of the columns to be retrieved.
+        condition (str or Filter, optional): The condition for the data retrieval. Defaults to None.
+        chunk_size (int, optional): The number of rows read at once. Defaults to 65536.
+        arrow (bool, optional): Return a pyarrow.Table instead of a dictionary of NumPy arrays. Defaults to False.
+
+        Returns:
+        data (dict, pyarrow.Table or None): A dictionary of one NumPy array per column, masked where the values are NULL, or an Arrow table.
+        None: If there is an error in connection or execution, or if NumPy (or pyarrow) is not installed.
+        """
+        if np is None or (arrow and pa is None):
+            print("Error: Invalid columns get\n", "NumPy and pyarrow are required for columnar results")
+            return None
+
+        conn, cur = self.connect(read_only=True)
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        chunks, type_codes = [], []
+        try:
+            where, params = self._where(table, condition)
+            query = select_statement(table, tuple(columns), where)
+            fetch_columns(conn, query, params, chunk_size, chunks.append, lambda names, codes: type_codes.extend(codes))
+        except Exception as e:
+            print("Error: Invalid columns get\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        if arrow:
+            return to_arrow(chunks, columns, arrow_types(type_codes))
+        return concat_chunks(chunks, columns, type_codes)
+
+    @admitted("export")
+    def export_data(self, table: str, path: str, columns: Optional[list] = None, condition=None, fmt: str = "csv", parallel: int = 1, key: str = "id", chunk_size: int = 65536) -> Union[List[Tuple[str, int]], None]:
+        """
+        This method is used to export a table, or the filtered rows of it, to a CSV or Parquet file.
+
+        The rows are streamed to the file, so the memory use does not depend on the size of the table.
+        With parallel > 1 the table is split into ranges of the integer primary key, every range is
+        exported on its own connection and written to its own file (e.g. orders.part0.csv).
+
+        Parameters:
+        table (str): The name of the table to export.
+        path (str): The path of the file to write.
+        columns (list, optional): The names of the columns to export. Defaults to None, which means all columns.
+        condition (str or Filter, optional): The condition for the exported rows. Defaults to None.
+        fmt (str, optional): The file format, csv or parquet. Defaults to "csv".
+        parallel (int, optional): The number of connections and files for a parallel export. Defaults to 1.
+        key (str, optional): The integer primary key used to split a parallel export. Defaults to "id".
+        chunk_size (int, optional): The number of rows per Parquet row group. Defaults to 65536.
+
+        Returns:
+        files (list or None): A list of (path, rows) tuples, one per written file.
+        If there is an error in connection or execution, it returns None.
+        """
+        if fmt not in EXPORT_FORMATS:
+            print("Error: Invalid data export\n", f"Unsupported format '{fmt}'")
+            return None
+
+        columns = tuple(columns or ["*"])
+        conn, cur = self.connect(read_only=True, operation="bulk")
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        try:
+            if parallel <= 1:
+                where, params = self._where(table, condition)
+                query = select_statement(table, columns, where)
+                files = [(path, export_query(conn, query, params, path, fmt, chunk_size))]
+            else:
+                ranges = key_ranges(conn, table, check_identifier(key), parallel)
+                if condition is not None and not isinstance(condition, Filter):
+                    condition = Raw(condition)
+
+                def build_query(first: int, last: int) -> Tuple[str, list]:
+                    key_range = Range(key, first, last)
+                    where, params = self._where(table, key_range if condition is None else condition & key_range)
+                    return select_statement(table, columns, where), params
+
+                files = export_parallel(self.activity.bind(partial(self.connect, read_only=True, operation="bulk")), ranges, build_query, path, fmt, chunk_size)
+        except Exception as e:
+            print("Error: Invalid data export\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        return files
+
+    @retried("write")
     def update_data(self, table: str, data: dict, condition=None) -> bool:
         """
         This method is used to update data in a specific table in the database.
@@ -154,7 +844,7 @@ class Model:
         Parameters:
         table (str): The name of the table where the data will be updated.
         data (dict): A dictionary where the key is the column name and the value is the new data to be updated.
-        condition (str, optional): The condition for the data update. Defaults to None.
+        condition (str or Filter, optional): The condition for the data update. Defaults to None.
 
         Returns:
         bool: True if the data was successfully updated, False otherwise.
@@ -165,19 +855,18 @@ class Model:
             return False
 
         values = []
+        params = []
         for key in data:
-            # Format the values correctly for PostgreSQL
-            values.append(f"{key} = '{data[key]}'")
+            # The values are bound by psycopg2, so they are quoted correctly for PostgreSQL
+            values.append(f"{check_identifier(key)} = %s")
+            params.append(data[key])
         
         try:
             values_str = ', '.join(values)
+            where, where_params = self._where(table, condition)
+            query = f"UPDATE {table} SET {values_str}{where}"
 
-            if condition is None:
-                query = f"UPDATE {table} SET {values_str}"
-            else:
-                query = f"UPDATE {table} SET {values_str} WHERE {condition}"
-
-            cur.execute(query)
+            cur.execute(query, params + where_params)
         except Exception as e:
             print("Error: Invalid data update\n", e)
             return False
@@ -188,25 +877,94 @@ class Model:
 
         return True
 
-    def delete_data(self, table: str, condition: str) -> bool:
+    def bulk_upsert(self, table: str, key_columns: list, rows, columns: Optional[list] = None) -> Union[Tuple[int, int], None]:
+        """
+        This method is used to insert new rows and update existing rows of a table in one transaction.
+
+        The rows are streamed with COPY into a temporary staging table and merged with one
+        INSERT ... ON CONFLICT (key_columns) DO UPDATE, so millions of rows can be synced in one call.
+
+        Parameters:
+        table (str): The name of the table.
+        key_columns (list): The names of the columns that identify a row, they must have a unique index or constraint.
+        rows (iterable): The rows, either dictionaries or tuples in the order of columns.
+        columns (list, optional): The names of the columns of the rows. Defaults to None, which takes the keys of the first dictionary.
+
+        Returns:
+        counts (tuple or None): The number of inserted rows and the number of updated rows.
+        If there is an error in connection or execution, it returns None.
+        """
+        conn, cur = self.connect(operation="bulk")
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        try:
+            counts = bulk_upsert(conn, table, key_columns, rows, columns)
+        except Exception as e:
+            print("Error: Invalid data upsert\n", e)
+            conn.close()
+            return None
+
+        conn.commit()
+        conn.close()
+
+        return counts
+
+    def load_data(self, table: str, columns: list, rows, pipeline: Optional[LoadPipeline] = None) -> Union[dict, None]:
+        """
+        This method is used to load many rows into a table with COPY through a load pipeline.
+
+        Parameters:
+        table (str): The name of the table.
+        columns (list): The names of the columns of the rows.
+        rows (iterable): The rows, tuples in the order of columns.
+        pipeline (LoadPipeline, optional): How the load is run. Defaults to None, which means LoadPipeline(),
+            deferring the secondary indexes and analyzing the table afterwards.
+
+        Returns:
+        report (dict or None): The number of rows, the time of every phase and the total time in seconds.
+        If there is an error in connection or execution, it returns None.
+        """
+        pipeline = pipeline or LoadPipeline()
+        columns = [check_identifier(column) for column in columns]
+
+        def load(conn, cur, target: str) -> int:
+            cur.copy_expert(f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')", RowsReader(iter(rows)))
+            return cur.rowcount
+
+        try:
+            return pipeline.run(partial(self.connect, operation="bulk"), table, load)
+        except Exception as e:
+            print("Error: Invalid data load\n", e)
+            return None
+
+    @retried("write")
+    def delete_data(self, table: str, condition: Union[str, Filter]) -> bool:
         """
         This method is used to delete data from a specific table in the database.
 
         Parameters:
         table (str): The name of the table where the data will be deleted.
-        condition (str): The condition for the data deletion.
+        condition (str or Filter): The condition for the data deletion.
 
         Returns:
         bool: True if the data was successfully deleted, False otherwise.
         """
+        if condition is None:
+            print("Error: Invalid data delete\n", "The condition can not be empty")
+            return False
+
         conn, cur = self.connect()
         
         if conn is None or cur is None:
             return False
 
         try:
-            query = f"DELETE FROM {table} WHERE {condition}"
-            cur.execute(query)
+            where, params = self._where(table, condition)
+            query = f"DELETE FROM {table}{where}"
+            cur.execute(query, params)
         except Exception as e:
             print("Error: Invalid data delete\n", e)
             return False
@@ -217,6 +975,94 @@ class Model:
 
         return True
 
+    def purge_data(self, table: str, condition: Union[str, Filter], batch_size: int = 10000, archive_table: Optional[str] = None,
+                   pause: float = 0.0, key: str = "id", start_after=None, on_progress=None) -> Union[dict, None]:
+        """
+        This method is used to delete a large number of rows in small batches, optionally moving them into an archive table.
+
+        Every batch deletes at most batch_size rows in key order in its own transaction, so locks are short and the
+        WAL is written in small steps. With archive_table the deleted rows are inserted into it by the same statement.
+        The batches go in increasing key order, so an interrupted purge continues with start_after set to the last key.
+
+        Parameters:
+        table (str): The name of the table where the data will be deleted.
+        condition (str or Filter): The condition for the data deletion.
+        batch_size (int, optional): The number of rows deleted per transaction. Defaults to 10000.
+        archive_table (str, optional): The table the deleted rows are moved to, it is created like table if it does not exist.
+            Defaults to None, which does not keep the rows.
+        pause (float, optional): The time in seconds to sleep between batches to limit the I/O rate. Defaults to 0.0.
+        key (str, optional): The name of the unique key column the batches are taken in. Defaults to "id".
+        start_after (optional): Only rows with a key greater than this are deleted. Defaults to None.
+        on_progress (callable, optional): The function called with (batches, deleted, last_key) after every batch. Defaults to None.
+
+        Returns:
+        progress (dict or None): The number of batches and deleted rows, the last deleted key and the elapsed time.
+        If there is an error in connection or execution, it returns None. The last deleted key is printed with the error.
+        """
+        if condition is None:
+            print("Error: Invalid data purge\n", "The condition can not be empty")
+            return None
+        if not isinstance(condition, Filter):
+            condition = Raw(condition)
+
+        conn, cur = self.connect(operation="bulk")
+
+        if conn is None or cur is None:
+            return None
+
+        progress = {"batches": 0, "deleted": 0, "last_key": start_after, "seconds": 0.0}
+        start = time.perf_counter()
+        try:
+            key = check_identifier(key)
+            archive = ""
+            if archive_table is not None:
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {check_identifier(archive_table)} (LIKE {table})")
+                conn.commit()
+                archive = f"""
+            , archived AS (
+                INSERT INTO {archive_table} SELECT * FROM deleted
+            )"""
+
+            while True:
+                batch_condition = condition
+                if progress["last_key"] is not None:
+                    batch_condition = Comparison(key, ">", progress["last_key"]) & condition
+                where, params = self._where(table, batch_condition)
+                query = f'''
+            WITH batch AS (
+                SELECT {key} FROM {table}{where} ORDER BY {key} LIMIT %s
+            ), deleted AS (
+                DELETE FROM {table} USING batch WHERE {table}.{key} = batch.{key} RETURNING {table}.*
+            ){archive}
+            SELECT COUNT(*), MAX({key}) FROM deleted;
+            '''
+                cur.execute(query, params + [batch_size])
+                deleted, last_key = cur.fetchone()
+                conn.commit()
+                if deleted == 0:
+                    break
+
+                progress["batches"] += 1
+                progress["deleted"] += deleted
+                progress["last_key"] = last_key
+                progress["seconds"] = round(time.perf_counter() - start, 3)
+                if on_progress is not None:
+                    on_progress(progress["batches"], progress["deleted"], last_key)
+                if deleted < batch_size:
+                    break
+                if pause > 0:
+                    time.sleep(pause)
+        except Exception as e:
+            print(f"Error: Invalid data purge (resume with start_after={progress['last_key']})\n", e)
+            conn.close()
+            return None
+
+        cur.close()
+        conn.close()
+
+        progress["seconds"] = round(time.perf_counter() - start, 3)
+        return progress
+
     def create_table(self, table: str, columns: list, data_types: list) -> bool:
         """
         This method is used to create a table in the database.
@@ -278,7 +1124,8 @@ class Model:
 
         return True
 
-    def generate_random_data(self, table: str, columns: list, data_types: list, parameters: list, rows_number: int, text_len=1) -> bool:
+    def generate_random_data(self, table: str, columns: list, data_types: list, parameters: list, rows_number: int, text_len=1, batch_size: Optional[int] = None,
+                             pipeline: Optional[LoadPipeline] = None) -> bool:
         """
         This method is used to generate random data and insert it into a specific table in the database.
 
@@ -297,140 +1144,96 @@ class Model:
         parameters (list): A list of tuples, each containing a pair of parameters for the random data.
         rows_number (int): The number of rows of data to be generated and inserted.
         text_len (int, optional): The length of the text to be generated. Ignored if data_type is not text.
+        batch_size (int, optional): The number of rows inserted and committed at once. The batches committed before
+            an error or a cancel stay in the table. Defaults to None, which inserts all rows in one statement.
+        pipeline (LoadPipeline, optional): The pipeline that defers the indexes, stages the rows and analyzes the table,
+            its report attribute holds the time of every phase afterwards. Defaults to None, which inserts into the table directly.
 
         Returns:
         bool: True if the data was successfully generated and inserted, False otherwise.
         """
 
-        def handle_int(min_value: int, max_value: int) -> str:
-            return f''' trunc(random() * ({max_value} - {min_value} + 1) + {min_value})::integer,'''
-        
-        def handle_text(min_value: int, max_value: int, text_len: int) -> str:
-            random_selection = []
-            for _ in range(text_len):
-                random_selection.append(f"chr(trunc(random() * ({max_value} - {min_value} + 1) + {min_value})::int)")
-            random_selection = " || ".join(random_selection)
-
-            return f" {random_selection},"
-        
-        def handle_date(min_value: str, max_value: str) -> str:
-            return f" (TIMESTAMP '{min_value}' + (random() * (TIMESTAMP '{max_value}' - TIMESTAMP '{min_value}'))::interval)::date,"
-        
-        def handle_time(min_value: str, max_value: str) -> str:
-            return f" (random() * ('{max_value}'::time - '{min_value}'::time) + '{min_value}'::time)::time,"
-        
-        def handle_timestamp(min_value: str, max_value: str) -> str:
-            return f" (date_trunc('second', TIMESTAMP '{min_value}' + (random() * (TIMESTAMP '{max_value}' - TIMESTAMP '{min_value}'))::interval))::timestamp,"
-        
-        def handle_bool() -> str:
-            return f" (random() < 0.5)::bool,"
-        
-        def handle_foreign_key(parent_table: str, parent_column: str) -> str:
-            return f'''
-            (SELECT
-                {parent_column}
-            FROM
-                {parent_table}
-            ORDER BY
-                random()
-            LIMIT
-                1),'''
-
-        conn, cur = self.connect()
+        # The pipeline opens its own connections
+        conn, cur = None, None
+        if pipeline is None:
+            conn, cur = self.connect(operation="bulk")
         
-        if conn is None or cur is None:
-            return False
+            if conn is None or cur is None:
+                return False
         
+        inserted = 0
         try:
             columns = ', '.join(columns)
-            query = f"INSERT INTO {table} ({columns}) SELECT"
-
-            for parameter, data_type in zip(parameters, data_types):
-                if data_type == 'fk_int':
-                    parent_table, parent_column = parameter
-                    query += handle_foreign_key(parent_table, parent_column)
-                    
-                elif data_type == 'int':
-                    min_value, max_value = parameter
-                    min_value = int(min_value)
-                    max_value = int(max_value)
-                    query += handle_int(min_value, max_value)
-                    
-                elif data_type == 'text':
-                    min_value, max_value = parameter
-                    min_value = int(min_value)
-                    max_value = int(max_value)
-                    query += handle_text(min_value, max_value, text_len)
-                    
-                elif data_type == 'date':
-                    min_value, max_value = parameter
-                    query += handle_date(min_value, max_value)
-                    
-                elif data_type == 'time':
-                    min_value, max_value = parameter
-                    query += handle_time(min_value, max_value)
-                    
-                elif data_type == 'timestamp':
-                    min_value, max_value = parameter
-                    min_value = ' '.join(min_value.split('/'))
-                    max_value = ' '.join(max_value.split('/'))
-                    query += handle_timestamp(min_value, max_value)
-                    
-                elif data_type == 'bool':
-                    query += handle_bool()
-                    
-                else:
-                    print(f"Error: Unsupported data type '{data_type}'")
-                    return False
-
-            query = query.rstrip(',') + f" FROM generate_series(1, {rows_number})"
-
-            cur.execute(query)
+            query = random_select(data_types, parameters, text_len)
+            batch_size = batch_size or rows_number
+
+            def load(load_conn, load_cur, target: str) -> int:
+                nonlocal inserted
+                while inserted < rows_number:
+                    rows = min(batch_size, rows_number - inserted)
+                    load_cur.execute(RANDOM_INSERT.format(table=target, columns=columns, select=query, rows=rows))
+                    load_conn.commit()
+                    inserted += rows
+                return inserted
+
+            if pipeline is None:
+                load(conn, cur, table)
+            else:
+                pipeline.run(partial(self.connect, operation="bulk"), table, load)
         except Exception as e:
-            print("Error: Invalid random data generation\n", e)
+            print(f"Error: Invalid random data generation, {inserted} rows inserted\n", e)
+            if conn is not None:
+                conn.close()
             return False
 
-        conn.commit()
-        cur.close()
-        conn.close()
+        if conn is not None:
+            conn.commit()
+            cur.close()
+            conn.close()
 
         return True
 
-    def pay_systems_total_income(self, left: int, right: int) -> Union[List[Tuple], None]:
+    @admitted("aggregate")
+    @retried("read")
+    def pay_systems_total_income(self, left: int, right: int, sample: Union[float, str, None] = None, method: str = "SYSTEM", latency_budget: float = 1.0, incremental: bool = False) -> Union[List[Tuple], None]:
         """
         This method is used to retrieve the total income of each pay system in the database.
         
         Parameters:
         left (int): The left bound of the sum of the orders.
         right (int): The right bound of the sum of the orders.
+        sample (float or str, optional): The percent of tbl_order to sample for an approximate answer,
+            or "auto" to pick the percent that fits latency_budget. Defaults to None, which means the exact answer.
+        method (str, optional): The TABLESAMPLE method, SYSTEM or BERNOULLI. Defaults to "SYSTEM".
+        latency_budget (float, optional): The time in seconds the auto mode aims for. Defaults to 1.0.
+        incremental (bool, optional): Read only the orders added since the last call with the same bounds, see install_change_log().
+            Defaults to False.
         
         Returns:
         data (list or None): A list of tuples representing the rows of data retrieved from the database.
+        With sampling every row is (id, name, count, count_ci, total, total_ci), where the *_ci values are the
+        half widths of the 95% confidence intervals.
         If there is an error in connection or execution, it returns None.
         """
+        if sample is not None:
+            return self._approximate_report(PAY_SYSTEMS_SAMPLE_QUERY, {"left": left, "right": right}, sample, method, latency_budget)
+        if incremental:
+            try:
+                return self.incremental.refresh("pay_systems_total_income", left, right)
+            except Exception as e:
+                print("Error: Invalid incremental report\n", e)
+                return None
+        data = self._from_order_cache("pay_systems_total_income", left, right)
+        if data is not None:
+            return data
         
-        conn, cur = self.connect()
+        conn, cur = self.connect(read_only=True, operation="report")
         
         if conn is None or cur is None:
             return None
         
         try:
-            query = f'''
-            SELECT
-                tbl_pay_system.id,
-                tbl_pay_system.name,
-                COUNT(*) AS Count,
-                SUM(tbl_order.sum) AS total
-            FROM
-                tbl_order
-                INNER JOIN tbl_pay_system ON tbl_order.pay_system_id = tbl_pay_system.id
-            WHERE
-                sum BETWEEN {left} AND {right}
-            GROUP BY
-                tbl_pay_system.id,
-                tbl_pay_system.name;
-            '''
-            cur.execute(query)
+            cur.execute(PAY_SYSTEMS_QUERY, {"left": left, "right": right})
             data = cur.fetchall()
         except Exception as e:
             print("Error: Invalid random data generation\n", e)
@@ -442,40 +1245,48 @@ class Model:
 
         return data
     
-    def company_orders_thru_period(self, left: str, right: str) -> Union[List[Tuple], None]:
+    @admitted("aggregate")
+    @retried("read")
+    def company_orders_thru_period(self, left: str, right: str, sample: Union[float, str, None] = None, method: str = "SYSTEM", latency_budget: float = 1.0, incremental: bool = False) -> Union[List[Tuple], None]:
         """
         This method is used to retrieve the number of orders placed by each company in the database.
         
         Parameters:
         left (str): The left bound of the period.
         right (str): The right bound of the period.
+        sample (float or str, optional): The percent of tbl_order to sample for an approximate answer,
+            or "auto" to pick the percent that fits latency_budget. Defaults to None, which means the exact answer.
+        method (str, optional): The TABLESAMPLE method, SYSTEM or BERNOULLI. Defaults to "SYSTEM".
+        latency_budget (float, optional): The time in seconds the auto mode aims for. Defaults to 1.0.
+        incremental (bool, optional): Read only the orders added since the last call with the same bounds, see install_change_log().
+            Defaults to False.
         
         Returns:
         data (list or None): A list of tuples representing the rows of data retrieved from the database.
+        With sampling every row is (id, company, orders, orders_ci), where orders_ci is the half width
+        of the 95% confidence interval.
         If there is an error in connection or execution, it returns None.
         """
+        if sample is not None:
+            rows = self._approximate_report(COMPANY_ORDERS_SAMPLE_QUERY, {"left": left, "right": right}, sample, method, latency_budget)
+            return None if rows is None else [row[:4] for row in rows]
+        if incremental:
+            try:
+                return self.incremental.refresh("company_orders_thru_period", left, right)
+            except Exception as e:
+                print("Error: Invalid incremental report\n", e)
+                return None
+        data = self._from_order_cache("company_orders_thru_period", left, right)
+        if data is not None:
+            return data
         
-        conn, cur = self.connect()
+        conn, cur = self.connect(read_only=True, operation="report")
         
         if conn is None or cur is None:
             return None
         
         try:
-            query = f'''
-            SELECT
-                tbl_company.id,
-                tbl_company.name,
-                COUNT(*) AS Count
-            FROM
-                tbl_order
-                INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
-            WHERE
-                tbl_order.date BETWEEN '{left}' AND '{right}'
-            GROUP BY
-                tbl_company.id,
-                tbl_company.name;
-            '''
-            cur.execute(query)
+            cur.execute(COMPANY_ORDERS_QUERY, {"left": left, "right": right})
             data = cur.fetchall()
         except Exception as e:
             print("Error: Invalid random data generation\n", e)
@@ -487,6 +1298,8 @@ class Model:
 
         return data
     
+    @admitted("aggregate")
+    @retried("read")
     def top_5_orders_total_price(self, company: str) -> Union[List[Tuple], None]:
         """
         This method is used to retrieve the top 5 orders with the highest total price for a specific company.
@@ -499,30 +1312,98 @@ class Model:
         If there is an error in connection or execution, it returns None.
         """
         
-        conn, cur = self.connect()
+        data = self._from_order_cache("top_5_orders_total_price", company)
+        if data is not None:
+            return data
+
+        conn, cur = self.connect(read_only=True, operation="report")
         
         if conn is None or cur is None:
             return None
         
         try:
-            query = f'''
+            cur.execute(TOP_ORDERS_QUERY, {"company": company})
+            data = cur.fetchall()
+        except Exception as e:
+            print("Error: Invalid random data generation\n", e)
+            return None
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        return data
+
+    @retried("read")
+    def recommend_indexes(self, min_uses: int = 1) -> Union[List[str], None]:
+        """
+        This method is used to recommend indexes for the columns that are often used in structured filters.
+
+        A column is recommended if it was filtered at least min_uses times and it is not the leading column of any index.
+
+        Parameters:
+        min_uses (int, optional): The minimal number of filters on a column to recommend it. Defaults to 1.
+
+        Returns:
+        statements (list or None): A list of CREATE INDEX statements, the most used columns first.
+        If there is an error in connection or execution, it returns None.
+        """
+        candidates = [
+            (uses, table, column)
+            for table, usage in self.filter_usage.items()
+            for column, uses in usage.items()
+            if uses >= min_uses
+        ]
+        if len(candidates) == 0:
+            return []
+
+        conn, cur = self.connect(read_only=True)
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            query = '''
             SELECT
-                tbl_order.id,
-                tbl_order.sum
+                tbl.relname,
+                col.attname
             FROM
-                tbl_order
-                INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+                pg_index idx
+                INNER JOIN pg_class tbl ON tbl.oid = idx.indrelid
+                INNER JOIN pg_attribute col ON col.attrelid = tbl.oid AND col.attnum = idx.indkey[0]
             WHERE
-                tbl_company.name = '{company}'
-            ORDER BY
-                tbl_order.sum DESC
-            LIMIT
-                5;
+                tbl.relname = ANY(%s);
             '''
-            cur.execute(query)
+            cur.execute(query, (list(self.filter_usage),))
+            indexed = set(cur.fetchall())
+        except Exception as e:
+            print("Error: Invalid index recommendation\n", e)
+            return None
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        statements = []
+        for uses, table, column in sorted(candidates, reverse=True):
+            if (table, column) not in indexed:
+                statements.append(f"CREATE INDEX ON {table} ({column});")
+
+        return statements
+
+    def _statistics(self, query: str, name: str, params: tuple = ()) -> Union[List[Tuple], None]:
+        # The statistics views are read on the primary, replicas keep their own counters
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            cur.execute(query, params)
             data = cur.fetchall()
         except Exception as e:
-            print("Error: Invalid random data generation\n", e)
+            print(f"Error: Invalid {name} get\n", e)
+            conn.close()
             return None
 
         conn.commit()
@@ -530,3 +1411,401 @@ class Model:
         conn.close()
 
         return data
+
+    def table_scans(self) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve how often every table was read by sequential scans and by index scans.
+
+        Returns:
+        data (list or None): A list of (table, seq_scan, idx_scan, seq_ratio, seq_tup_read, live_rows) tuples,
+        the tables with the most rows read by sequential scans first.
+        If there is an error in connection or execution, it returns None.
+        """
+        return self._statistics(TABLE_SCANS_QUERY, "table scans")
+
+    def unused_indexes(self) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the indexes that were never scanned since the statistics were reset.
+
+        Indexes of primary keys and unique constraints are left out, they are needed for the constraints.
+
+        Returns:
+        data (list or None): A list of (table, index, size_bytes, definition) tuples, the largest first.
+        If there is an error in connection or execution, it returns None.
+        """
+        return self._statistics(UNUSED_INDEXES_QUERY, "unused indexes")
+
+    def cache_hit_ratio(self) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the share of table and index blocks found in the buffer cache.
+
+        Returns:
+        data (list or None): A list of (table, heap_hits, heap_reads, heap_hit_ratio, index_hit_ratio) tuples,
+        the first row is the total of all tables.
+        If there is an error in connection or execution, it returns None.
+        """
+        return self._statistics(CACHE_HIT_QUERY, "cache hit ratio")
+
+    def dead_tuples(self) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the dead tuples of every table, the rows left by updates and deletes until a vacuum.
+
+        Returns:
+        data (list or None): A list of (table, live_rows, dead_rows, dead_ratio, last_vacuum, size_bytes) tuples,
+        the tables with the most dead rows first.
+        If there is an error in connection or execution, it returns None.
+        """
+        return self._statistics(DEAD_TUPLES_QUERY, "dead tuples")
+
+    def top_statements(self, limit: int = 10) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the statements of the database that took the most time, from pg_stat_statements.
+
+        Parameters:
+        limit (int, optional): The number of statements. Defaults to 10.
+
+        Returns:
+        data (list or None): A list of (query, calls, total_ms, mean_ms, rows, hit_ratio) tuples, the slowest first.
+        If pg_stat_statements is not available or there is an error in connection or execution, it returns None.
+        """
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            query = statements_query(cur)
+        except Exception as e:
+            print("Error: Invalid top statements get\n", e)
+            conn.close()
+            return None
+        conn.close()
+
+        if query is None:
+            print("Error: pg_stat_statements is not installed, run CREATE EXTENSION pg_stat_statements")
+            return None
+        return self._statistics(query, "top statements", (int(limit),))
+
+    def capture_plans(self, parameters: Optional[Dict[str, dict]] = None) -> Union[Dict[str, dict], None]:
+        """
+        This method is used to capture the plans of the report queries and of the generate_random_data insert.
+
+        Every query runs with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) in a transaction that is rolled back.
+        The parameters are picked from the data, see plans.representative_parameters().
+
+        Parameters:
+        parameters (dict, optional): Parameters that replace the picked ones, by query name. Defaults to None.
+
+        Returns:
+        plans (dict or None): The summary of every plan and its parameters by query name, see plans.summarize().
+        If there is an error in connection or execution, it returns None.
+        """
+        conn, cur = self.connect(operation="report")
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            chosen = representative_parameters(cur)
+            conn.rollback()
+            for name, values in (parameters or {}).items():
+                chosen[name] = dict(chosen.get(name, {}), **values)
+            generate = chosen["generate_random_data"]
+            insert = RANDOM_INSERT.format(
+                table=check_identifier(generate["table"]),
+                columns=", ".join(check_identifier(column) for column in generate["columns"]),
+                select=random_select(generate["data_types"], generate["parameters"]),
+                rows=int(generate["rows"]),
+            )
+            queries = {
+                "pay_systems_total_income": (PAY_SYSTEMS_QUERY, chosen["pay_systems_total_income"]),
+                "company_orders_thru_period": (COMPANY_ORDERS_QUERY, chosen["company_orders_thru_period"]),
+                "top_5_orders_total_price": (TOP_ORDERS_QUERY, chosen["top_5_orders_total_price"]),
+                "generate_random_data": (insert, None),
+            }
+            plans = {}
+            for name, (query, params) in queries.items():
+                plans[name] = dict(explain(conn, cur, query, params), parameters=chosen[name])
+        except Exception as e:
+            print("Error: Invalid plan capture\n", e)
+            conn.close()
+            return None
+
+        cur.close()
+        conn.close()
+
+        return plans
+
+    def check_plans(self, baseline: str, cost_factor: float = 2.0, time_factor: float = 3.0, update: bool = False) -> Union[List[Tuple], None]:
+        """
+        This method is used to compare the current plans of the canned queries with the baseline plans.
+
+        If the baseline file does not exist yet, the current plans are written to it.
+
+        Parameters:
+        baseline (str): The path of the JSON file of the baseline plans.
+        cost_factor (float, optional): How many times the estimated cost may grow. Defaults to 2.0.
+        time_factor (float, optional): How many times the execution time may grow. Defaults to 3.0.
+        update (bool, optional): Write the current plans to the baseline file after the comparison. Defaults to False.
+
+        Returns:
+        findings (list or None): A list of (query, change, baseline, current) tuples, see plans.compare(),
+        empty if no plan regressed. If there is an error in connection, execution or with the file, it returns None.
+        """
+        plans = self.capture_plans()
+        if plans is None:
+            return None
+
+        try:
+            previous = load_baseline(baseline)
+            findings = [] if previous is None else compare(previous, plans, cost_factor, time_factor)
+            if previous is None or update:
+                save_baseline(baseline, plans)
+        except (OSError, ValueError, KeyError) as e:
+            print("Error: Invalid plan baseline\n", e)
+            return None
+
+        return findings
+
+    def top_orders_per_company(self, companies: Optional[List[str]] = None, k: int = 5, order_by: str = "sum", chunk_size: int = 1000) -> Union[Iterator[tuple], None]:
+        """
+        This method is used to retrieve the top k orders of many companies in one query.
+
+        Every company is joined once and its orders are read with a LATERAL subquery, so an index on
+        tbl_order (company_id, <order_by>) turns each company into a short index scan.
+
+        Parameters:
+        companies (list, optional): The names of the companies. Defaults to None, which means all companies.
+        k (int, optional): The number of orders per company. Defaults to 5.
+        order_by (str, optional): The column of tbl_order the orders are ranked by, highest first. Defaults to "sum".
+        chunk_size (int, optional): The number of rows fetched from the server per round trip. Defaults to 1000.
+
+        Returns:
+        rows (iterator or None): An iterator over (company_id, company, rank, order_id, value) tuples,
+        ordered by company and rank. If there is an error in connection or the parameters, it returns None.
+        """
+        try:
+            order_by = check_identifier(order_by)
+            k = int(k)
+        except ValueError as e:
+            print("Error: Invalid top orders parameters\n", e)
+            return None
+
+        conn, cur = self.connect(read_only=True, operation="report")
+
+        if conn is None or cur is None:
+            return None
+        cur.close()
+
+        where = "" if companies is None else "WHERE tbl_company.name = ANY(%(companies)s)"
+        query = f'''
+        SELECT
+            tbl_company.id,
+            tbl_company.name,
+            top.rank,
+            top.id,
+            top.value
+        FROM
+            tbl_company
+            CROSS JOIN LATERAL (
+                SELECT
+                    tbl_order.id,
+                    tbl_order.{order_by} AS value,
+                    row_number() OVER (ORDER BY tbl_order.{order_by} DESC) AS rank
+                FROM
+                    tbl_order
+                WHERE
+                    tbl_order.company_id = tbl_company.id
+                ORDER BY
+                    tbl_order.{order_by} DESC
+                LIMIT
+                    %(k)s
+            ) AS top
+        {where}
+        ORDER BY
+            tbl_company.id,
+            top.rank;
+        '''
+        params = {"k": k, "companies": list(companies or [])}
+
+        return self._stream(conn, query, params, chunk_size)
+
+    @admitted("aggregate")
+    @retried("read")
+    def pay_systems_income_histogram(self, ranges: Optional[List[Tuple[float, float]]] = None, buckets: Optional[Tuple[float, float, int]] = None, as_numpy: bool = False) -> Union[dict, None]:
+        """
+        This method is used to retrieve the count and the total income of each pay system for many sum ranges in a single scan of tbl_order.
+
+        Either ranges or buckets must be given. Explicit ranges are computed with one filtered aggregate per range,
+        equal-width buckets are computed with width_bucket().
+
+        Parameters:
+        ranges (list, optional): A list of (left, right) bounds of the sum of the orders, both bounds included.
+        buckets (tuple, optional): A (low, high, count) tuple that splits [low, high) into count equal-width buckets.
+        as_numpy (bool, optional): Return the matrices as NumPy arrays instead of lists of lists. Defaults to False.
+
+        Returns:
+        histogram (dict or None): A dictionary with the keys:
+            - pay_systems: a list of (id, name) tuples, one per matrix row
+            - bins: a list of (left, right) tuples, one per matrix column
+            - count: the matrix of order counts
+            - total: the matrix of order totals
+        If there is an error in connection, execution or the parameters, it returns None.
+        """
+        if (ranges is None) == (buckets is None):
+            print("Error: Invalid histogram parameters\n", "Exactly one of ranges and buckets must be given")
+            return None
+        if as_numpy and np is None:
+            print("Error: Invalid histogram parameters\n", "NumPy is not installed")
+            return None
+
+        conn, cur = self.connect(read_only=True, operation="report")
+
+        if conn is None or cur is None:
+            return None
+
+        try:
+            if ranges is not None:
+                bins = [(float(left), float(right)) for left, right in ranges]
+                aggregates = []
+                params = []
+                for left, right in bins:
+                    aggregates.append("COUNT(tbl_order.id) FILTER (WHERE tbl_order.sum BETWEEN %s AND %s)")
+                    aggregates.append("COALESCE(SUM(tbl_order.sum) FILTER (WHERE tbl_order.sum BETWEEN %s AND %s), 0)")
+                    params.extend([left, right, left, right])
+                aggregates = ",\n                ".join(aggregates)
+                query = f'''
+            SELECT
+                tbl_pay_system.id,
+                tbl_pay_system.name,
+                {aggregates}
+            FROM
+                tbl_pay_system
+                LEFT JOIN tbl_order ON tbl_order.pay_system_id = tbl_pay_system.id
+                    AND tbl_order.sum BETWEEN %s AND %s
+            GROUP BY
+                tbl_pay_system.id,
+                tbl_pay_system.name
+            ORDER BY
+                tbl_pay_system.id;
+            '''
+                params.extend([min(left for left, _ in bins), max(right for _, right in bins)])
+                cur.execute(query, params)
+
+                pay_systems, count, total = [], [], []
+                for row in cur.fetchall():
+                    pay_systems.append((row[0], row[1]))
+                    count.append([int(value) for value in row[2::2]])
+                    total.append([float(value) for value in row[3::2]])
+            else:
+                low, high, number = float(buckets[0]), float(buckets[1]), int(buckets[2])
+                width = (high - low) / number
+                bins = [(low + i * width, low + (i + 1) * width) for i in range(number)]
+
+                cur.execute("SELECT id, name FROM tbl_pay_system ORDER BY id;")
+                pay_systems = cur.fetchall()
+                rows = {pay_system_id: i for i, (pay_system_id, _) in enumerate(pay_systems)}
+                count = [[0] * number for _ in pay_systems]
+                total = [[0.0] * number for _ in pay_systems]
+
+                query = '''
+            SELECT
+                tbl_order.pay_system_id,
+                width_bucket(tbl_order.sum, %(low)s, %(high)s, %(number)s) AS bucket,
+                COUNT(*) AS Count,
+                SUM(tbl_order.sum) AS total
+            FROM
+                tbl_order
+            WHERE
+                tbl_order.sum >= %(low)s AND tbl_order.sum < %(high)s
+            GROUP BY
+                tbl_order.pay_system_id,
+                bucket;
+            '''
+                cur.execute(query, {"low": low, "high": high, "number": number})
+                for pay_system_id, bucket, bucket_count, bucket_total in cur.fetchall():
+                    if pay_system_id in rows:
+                        count[rows[pay_system_id]][bucket - 1] = int(bucket_count)
+                        total[rows[pay_system_id]][bucket - 1] = float(bucket_total)
+        except Exception as e:
+            print("Error: Invalid income histogram\n", e)
+            return None
+
+        conn.commit()
+        cur.close()
+        conn.close()
+
+        if as_numpy:
+            count = np.array(count, dtype=np.int64).reshape(len(pay_systems), len(bins))
+            total = np.array(total, dtype=np.float64).reshape(len(pay_systems), len(bins))
+
+        return {"pay_systems": pay_systems, "bins": bins, "count": count, "total": total}
+
+    def dump_snapshot(self, directory: str, tables: List[str] = TABLES, workers: int = 4) -> Union[dict, None]:
+        """
+        This method is used to dump the tables of the schema in parallel from one consistent snapshot.
+
+        Parameters:
+        directory (str): The directory to write the binary COPY files and the manifest to.
+        tables (list, optional): The tables to dump. Defaults to all the tables of the schema.
+        workers (int, optional): The number of tables dumped at once. Defaults to 4.
+
+        Returns:
+        manifest (dict or None): The snapshot id and the rows, bytes and throughput of every table.
+        If there is an error in connection or execution, it returns None.
+        """
+        try:
+            return dump_snapshot(self.activity.bind(partial(self.connect, operation="bulk")), directory, tables, workers)
+        except Exception as e:
+            print("Error: Invalid snapshot dump\n", e)
+            return None
+
+    def restore_snapshot(self, directory: str, workers: int = 4) -> Union[dict, None]:
+        """
+        This method is used to replace the data of the tables with a dump written by dump_snapshot().
+
+        The indexes and foreign keys are created after the load and the tables are analyzed.
+
+        Parameters:
+        directory (str): The directory with the binary COPY files and the manifest.
+        workers (int, optional): The number of tables loaded at once. Defaults to 4.
+
+        Returns:
+        report (dict or None): The time of every phase and the rows, bytes and throughput of every table.
+        If there is an error in connection or execution, it returns None.
+        """
+        try:
+            return restore_snapshot(self.activity.bind(partial(self.connect, operation="bulk")), directory, workers)
+        except Exception as e:
+            print("Error: Invalid snapshot restore\n", e)
+            return None
+
+    def install_change_log(self) -> bool:
+        """
+        This method is used to create tbl_order_change and the triggers that log updates and deletes of tbl_order.
+
+        The incremental reports and the order cache read the log to know which orders changed. Every reader records
+        how far it has read in tbl_order_change_reader, and the rows all readers have read are deleted.
+
+        Returns:
+        bool: True if the change log was installed, False otherwise.
+        """
+        conn, cur = self.connect()
+
+        if conn is None or cur is None:
+            return False
+
+        try:
+            with open(CHANGE_LOG_SQL) as file:
+                cur.execute(file.read())
+        except Exception as e:
+            print("Error: Invalid change log install\n", e)
+            conn.close()
+            return False
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        self.incremental.reset()
+
+        return True
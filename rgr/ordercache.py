@@ -0,0 +1,306 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.columnar import concat_chunks, fetch_columns
+from incremental import ChangeLogReader, settled, snapshot_xmin
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The columns of tbl_order kept in memory and their NumPy types
+COLUMNS = {
+    "id": "int32",
+    "company_id": "int32",
+    "pay_system_id": "int32",
+    "date": "datetime64[D]",
+    "sum": "float64",
+}
+# Orders of the columns that are searched by range, the permutation that sorts the column
+ORDERS = {"by_sum": "sum", "by_date": "date"}
+# The sorted values of every order, kept next to its permutation
+SORTED = {order: f"{order}_values" for order in ORDERS}
+META = "meta.json"
+# The arrays written by save()
+ARRAYS = list(COLUMNS) + list(ORDERS) + list(SORTED.values())
+
+
+def _open(connect: Callable):
+    conn, cur = connect()
+    if conn is None or cur is None:
+        raise ConnectionError("Unable to connect to the database")
+    return conn, cur
+
+
+def _range(state: dict, order: str, left, right) -> "np.ndarray":
+    # The positions of the rows with left <= value <= right, found by binary search in the sorted column
+    values = state[SORTED[order]]
+    return state[order][np.searchsorted(values, left, "left"):np.searchsorted(values, right, "right")]
+
+
+class OrderCache:
+    """
+    This class is used to keep a copy of tbl_order in NumPy arrays and answer the reports from it.
+
+    The columns are loaded with binary COPY. refresh() reads the orders above the id watermark that are not
+    loaded yet and the orders logged in tbl_order_change since the last refresh (see Model.install_change_log()),
+    deleted orders are dropped. The watermark only moves past ids that no running transaction can still commit,
+    see incremental.settled(), so orders that commit out of id order are loaded too. A truncate, a missing
+    change log and every full_interval seconds reload the whole table. Range lookups search the sorted sum and
+    date columns, kept with the permutations that sort them, group-bys use np.bincount().
+
+    save() writes the arrays as .npy files and open() maps them back without reading them, so a restarted
+    process only loads the changes made since the save.
+    """
+
+    def __init__(self, connect: Callable, chunk_size: int = 65536, checkpoint_connect: Optional[Callable] = None, full_interval: float = 600.0):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+        chunk_size (int, optional): The number of rows parsed at once during a load. Defaults to 65536.
+        checkpoint_connect (callable, optional): The function returning a connection that can write, used to record
+            how far the change log was read so it can be pruned. Defaults to None, which does not record it.
+        full_interval (float, optional): The longest time in seconds the cache is refreshed by deltas. Defaults to 600.0.
+        """
+        if np is None:
+            raise ImportError("numpy is required for the order cache")
+        self.connect = connect
+        self.chunk_size = chunk_size
+        self.full_interval = full_interval
+        self.log = ChangeLogReader("order-cache", checkpoint_connect)
+        # Replaced as a whole, so readers always see one consistent version
+        self.state: Optional[dict] = None
+        self.lock = threading.Lock()
+        self.stats = {"full_loads": 0, "delta_loads": 0, "rows_loaded": 0}
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def _fetch(self, conn, condition: str, params) -> Dict[str, "np.ndarray"]:
+        chunks, type_codes = [], []
+        fetch_columns(conn, f"SELECT {', '.join(COLUMNS)} FROM tbl_order WHERE {condition}", params, self.chunk_size, chunks.append,
+                      lambda names, codes: type_codes.extend(codes))
+        columns = concat_chunks(chunks, list(COLUMNS), type_codes)
+        # The cached columns are NOT NULL, the arrays are plain so np.concatenate() in refresh() loses no mask
+        for name in COLUMNS:
+            if np.ma.is_masked(columns[name]):
+                raise ValueError(f"tbl_order.{name} holds NULL values, the order cache needs NOT NULL columns")
+        self.stats["rows_loaded"] += len(columns["id"])
+        return {name: np.ma.getdata(columns[name]).astype(dtype, copy=False) for name, dtype in COLUMNS.items()}
+
+    def refresh(self) -> dict:
+        """
+        This method is used to load the orders changed since the last refresh, or all of them on the first call.
+
+        Returns:
+        stats (dict): The number of full loads, delta loads and rows loaded so far.
+        """
+        with self.lock:
+            conn, cur = _open(self.connect)
+            try:
+                # The watermark, the change log and the rows are read from one snapshot
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                xmin = snapshot_xmin(cur)
+                changes = self.log.read(cur, xmin)
+                cur.execute("SELECT COALESCE(max(id), 0) FROM tbl_order")
+                high = cur.fetchone()[0]
+
+                state = self.state
+                changed = None
+                if (state is not None and changes is not None and not any(op == "T" for _, op in changes)
+                        and high >= state["watermark"] and time.time() - state["loaded_at"] <= self.full_interval):
+                    changed = np.array(sorted({order_id for order_id, _ in changes if order_id is not None}), dtype="int32")
+
+                if changed is None:
+                    columns = self._fetch(conn, "id <= %s", (high,))
+                    watermark, loaded_at = 0, time.time()
+                    self.stats["full_loads"] += 1
+                else:
+                    # The ids above the watermark that are loaded already are left out
+                    loaded = state["id"][state["id"] > state["watermark"]]
+                    delta = self._fetch(
+                        conn,
+                        "id > %s AND id <= %s AND id <> ALL(%s::int[]) OR id = ANY(%s::int[])",
+                        (state["watermark"], high, loaded.tolist(), changed.tolist()),
+                    )
+                    keep = ~np.isin(state["id"], np.concatenate([changed, delta["id"]]))
+                    columns = {name: np.concatenate([state[name][keep], delta[name]]) for name in COLUMNS}
+                    watermark, loaded_at = state["watermark"], state["loaded_at"]
+                    self.stats["delta_loads"] += 1
+                watermark = settled(cur, "tbl_order", "id", watermark, high, xmin)
+
+                names = {}
+                for table in ("tbl_company", "tbl_pay_system"):
+                    cur.execute(f"SELECT id, name FROM {table}")
+                    names[table] = dict(cur.fetchall())
+                conn.commit()
+            finally:
+                conn.close()
+
+            if changed is not None and len(changed) == 0 and len(columns["id"]) == len(state["id"]):
+                orders = {name: state[name] for name in list(ORDERS) + list(SORTED.values())}
+            else:
+                orders = {}
+                for order, column in ORDERS.items():
+                    permutation = np.argsort(columns[column], kind="stable")
+                    orders[order] = permutation
+                    orders[SORTED[order]] = columns[column][permutation]
+            self.state = {**columns, **orders, "watermark": watermark, "loaded_at": loaded_at, "names": names}
+
+        try:
+            self.log.checkpoint()
+        except Exception as e:
+            print("Error: Invalid change log checkpoint\n", e)
+        return dict(self.stats)
+
+    def start(self, interval: float = 5.0):
+        """
+        This method is used to refresh the cache every interval seconds in a background thread.
+
+        Parameters:
+        interval (float, optional): The time in seconds between refreshes. Defaults to 5.0.
+        """
+        self.stop()
+        self.stopped.clear()
+
+        def run():
+            while not self.stopped.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print("Error: Invalid order cache refresh\n", e)
+
+        self.thread = threading.Thread(target=run, name="order-cache", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        This method is used to stop the background refreshes.
+        """
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def save(self, directory: str):
+        """
+        This method is used to write the cache to .npy files that open() can map back.
+
+        Parameters:
+        directory (str): The directory to write the files to.
+        """
+        state = self.state
+        if state is None:
+            raise ValueError("The order cache is not loaded")
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.tmp.npy"), state[name])
+            os.replace(os.path.join(directory, f"{name}.tmp.npy"), os.path.join(directory, f"{name}.npy"))
+        meta = {
+            "watermark": state["watermark"],
+            "loaded_at": state["loaded_at"],
+            "reader": self.log.name,
+            "position": self.log.position,
+            "checkpointed": self.log.checkpointed,
+            "names": {table: list(names.items()) for table, names in state["names"].items()},
+        }
+        # The meta file is written last, a missing one means the files are incomplete
+        with open(os.path.join(directory, META + ".tmp"), "w") as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(directory, META + ".tmp"), os.path.join(directory, META))
+
+    def open(self, directory: str) -> bool:
+        """
+        This method is used to map a cache written by save() into memory, the next refresh loads the changes since then.
+
+        Parameters:
+        directory (str): The directory of the files.
+
+        Returns:
+        bool: True if the cache was opened, False if the directory has no complete cache.
+        """
+        path = os.path.join(directory, META)
+        if not os.path.exists(path):
+            return False
+        with open(path) as file:
+            meta = json.load(file)
+        # Caches saved by an older version have no sorted values or log position
+        if "reader" not in meta or not all(os.path.exists(os.path.join(directory, f"{name}.npy")) for name in ARRAYS):
+            return False
+        state = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        state.update(
+            watermark=meta["watermark"],
+            loaded_at=meta["loaded_at"],
+            names={table: dict((key, value) for key, value in names) for table, names in meta["names"].items()},
+        )
+        with self.lock:
+            # The next refresh goes on from the saved position of the change log
+            self.log.name = meta["reader"]
+            self.log.position = None if meta["position"] is None else (meta["position"][0], tuple(meta["position"][1]))
+            self.log.checkpointed = meta["checkpointed"]
+            self.state = state
+        return True
+
+    def _loaded(self) -> dict:
+        state = self.state
+        if state is None:
+            self.refresh()
+            state = self.state
+        return state
+
+    def pay_systems_total_income(self, left: float, right: float) -> List[Tuple]:
+        """
+        This method is used to compute the total income of each pay system from the cache.
+
+        Parameters:
+        left (float): The left bound of the sum of the orders.
+        right (float): The right bound of the sum of the orders.
+
+        Returns:
+        data (list): A list of (id, name, count, total) tuples.
+        """
+        state = self._loaded()
+        rows = _range(state, "by_sum", float(left), float(right))
+        pay_systems = state["pay_system_id"][rows]
+        count = np.bincount(pay_systems)
+        total = np.bincount(pay_systems, weights=state["sum"][rows])
+        names = state["names"]["tbl_pay_system"]
+        return [(int(i), names[i], int(count[i]), float(total[i])) for i in np.flatnonzero(count) if int(i) in names]
+
+    def company_orders_thru_period(self, left: str, right: str) -> List[Tuple]:
+        """
+        This method is used to compute the number of orders placed by each company from the cache.
+
+        Parameters:
+        left (str): The left bound of the period.
+        right (str): The right bound of the period.
+
+        Returns:
+        data (list): A list of (id, company, orders) tuples.
+        """
+        state = self._loaded()
+        rows = _range(state, "by_date", np.datetime64(str(left), "D"), np.datetime64(str(right), "D"))
+        count = np.bincount(state["company_id"][rows])
+        names = state["names"]["tbl_company"]
+        return [(int(i), names[i], int(count[i])) for i in np.flatnonzero(count) if int(i) in names]
+
+    def top_5_orders_total_price(self, company: str) -> List[Tuple]:
+        """
+        This method is used to find the 5 orders with the highest total price of a company from the cache.
+
+        Parameters:
+        company (str): The name of the company.
+
+        Returns:
+        data (list): A list of (order_id, total_price) tuples, the highest total price first.
+        """
+        state = self._loaded()
+        companies = [i for i, name in state["names"]["tbl_company"].items() if name == company]
+        rows = np.flatnonzero(np.isin(state["company_id"], companies))
+        top = rows[np.argsort(-state["sum"][rows], kind="stable")[:5]]
+        return [(int(state["id"][i]), float(state["sum"][i])) for i in top]
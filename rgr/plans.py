@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Orders inserted by the explained generate_random_data statement, the transaction is rolled back
+GENERATE_ROWS = 100
+
+# Parameters that make the report queries read a typical share of tbl_order:
+# the middle half of the sums and of the dates and the company with the most orders
+REPRESENTATIVE_QUERY = '''
+SELECT
+    percentile_disc(0.25) WITHIN GROUP (ORDER BY tbl_order.sum),
+    percentile_disc(0.75) WITHIN GROUP (ORDER BY tbl_order.sum),
+    percentile_disc(0.25) WITHIN GROUP (ORDER BY tbl_order.date),
+    percentile_disc(0.75) WITHIN GROUP (ORDER BY tbl_order.date),
+    (SELECT tbl_company.name
+     FROM tbl_order INNER JOIN tbl_company ON tbl_order.company_id = tbl_company.id
+     GROUP BY tbl_company.name ORDER BY COUNT(*) DESC LIMIT 1)
+FROM
+    tbl_order;
+'''
+
+
+def representative_parameters(cur) -> Dict[str, dict]:
+    """
+    This function is used to pick the parameters of the canned queries from the data.
+
+    Parameters:
+    cur (psycopg2.extensions.cursor): The cursor to run the query on.
+
+    Returns:
+    parameters (dict): The parameters of every canned query.
+    """
+    cur.execute(REPRESENTATIVE_QUERY)
+    low_sum, high_sum, low_date, high_date, company = cur.fetchone()
+    return {
+        "pay_systems_total_income": {"left": low_sum, "right": high_sum},
+        "company_orders_thru_period": {"left": low_date, "right": high_date},
+        "top_5_orders_total_price": {"company": company},
+        "generate_random_data": {
+            "table": "tbl_order",
+            "columns": ["client_id", "company_id", "pay_system_id", "date", "sum"],
+            "data_types": ["fk_int", "fk_int", "fk_int", "date", "int"],
+            "parameters": [("tbl_client", "id"), ("tbl_company", "id"), ("tbl_pay_system", "id"), ("2020-01-01", "2024-12-31"), (1, 1000)],
+            "rows": GENERATE_ROWS,
+        },
+    }
+
+
+def _shape(node: dict, depth: int = 0) -> List[str]:
+    # One line per node with what decides the plan, costs and row counts are left out
+    line = node["Node Type"]
+    for key, template in (("Join Type", " ({})"), ("Strategy", " [{}]"), ("Index Name", " using {}"), ("Relation Name", " on {}")):
+        if key in node:
+            line += template.format(node[key])
+    lines = ["  " * depth + line]
+    for child in node.get("Plans", []):
+        lines.extend(_shape(child, depth + 1))
+    return lines
+
+
+def summarize(explained: dict) -> dict:
+    """
+    This function is used to keep what the regression check needs of an EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) result.
+
+    Parameters:
+    explained (dict): The only element of the JSON result.
+
+    Returns:
+    summary (dict): The fingerprint and the shape of the plan, its estimated cost and rows, the actual rows,
+        the execution time in milliseconds and the shared buffers hit and read.
+    """
+    plan = explained["Plan"]
+    shape = _shape(plan)
+    return {
+        "fingerprint": hashlib.sha1("\n".join(shape).encode()).hexdigest()[:16],
+        "shape": shape,
+        "cost": plan["Total Cost"],
+        "estimated_rows": plan["Plan Rows"],
+        "rows": plan.get("Actual Rows"),
+        "ms": round(explained.get("Execution Time", 0.0), 3),
+        "buffers": plan.get("Shared Hit Blocks", 0) + plan.get("Shared Read Blocks", 0),
+    }
+
+
+def explain(conn, cur, query: str, params=None) -> dict:
+    """
+    This function is used to run a query with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) and to undo its changes.
+
+    ANALYZE runs the query, so the transaction is rolled back afterwards. Sequences used by an insert are not rolled back.
+
+    Parameters:
+    conn (psycopg2.extensions.connection): The connection of the cursor.
+    cur (psycopg2.extensions.cursor): The cursor to run the query on.
+    query (str): The query.
+    params (dict or list, optional): The values to bind to the placeholders of the query. Defaults to None.
+
+    Returns:
+    summary (dict): The summary of the plan, see summarize().
+    """
+    try:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query.strip().rstrip(";"), params)
+        explained = cur.fetchone()[0]
+    finally:
+        conn.rollback()
+    # psycopg2 parses json columns, older servers return the plan as text
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    return summarize(explained[0])
+
+
+def compare(baseline: Dict[str, dict], current: Dict[str, dict], cost_factor: float = 2.0, time_factor: float = 3.0,
+            min_ms: float = 5.0) -> List[Tuple[str, str, str, str]]:
+    """
+    This function is used to find the plans that changed against the baseline.
+
+    Parameters:
+    baseline (dict): The summaries of the baseline plans by query name.
+    current (dict): The summaries of the current plans by query name.
+    cost_factor (float, optional): How many times the estimated cost may grow. Defaults to 2.0.
+    time_factor (float, optional): How many times the execution time may grow. Defaults to 3.0.
+    min_ms (float, optional): The growth of the execution time in milliseconds that is always ignored, as noise. Defaults to 5.0.
+
+    Returns:
+    findings (list): A list of (query, change, baseline, current) tuples. The change is "new plan" for queries
+        without a baseline, "plan" when the nodes changed, "cost" or "time" when they grew too much.
+    """
+    findings = []
+    for name, plan in current.items():
+        old = baseline.get(name)
+        if old is None:
+            findings.append((name, "new plan", "", plan["fingerprint"]))
+            continue
+        if plan["fingerprint"] != old["fingerprint"]:
+            old_nodes, new_nodes = Counter(line.strip() for line in old["shape"]), Counter(line.strip() for line in plan["shape"])
+            findings.append((name, "plan", "; ".join((old_nodes - new_nodes).elements()), "; ".join((new_nodes - old_nodes).elements())))
+        if plan["cost"] > cost_factor * old["cost"]:
+            findings.append((name, "cost", str(old["cost"]), str(plan["cost"])))
+        if plan["ms"] > time_factor * old["ms"] and plan["ms"] - old["ms"] > min_ms:
+            findings.append((name, "time", f"{old['ms']} ms", f"{plan['ms']} ms"))
+    return findings
+
+
+def load_baseline(path: str) -> Optional[Dict[str, dict]]:
+    """
+    This function is used to read the baseline plans.
+
+    Parameters:
+    path (str): The path of the JSON file.
+
+    Returns:
+    baseline (dict or None): The summaries of the plans by query name, or None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, plans: Dict[str, dict]):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(plans, file, indent=2, default=str)
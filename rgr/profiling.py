@@ -0,0 +1,245 @@
+import builtins
+import cProfile
+import contextlib
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import thread as futures_thread
+from typing import Dict, List
+
+from activity import ActivityCursor
+from routing import TrackedConnection
+
+PROFILE_MODES = ("sampling", "cprofile")
+# Appended to the stacks that wait for the server
+DATABASE_FRAME = "[database]"
+_DATABASE_CODES = {ActivityCursor._report.__code__, ActivityCursor.fetchmany.__code__, TrackedConnection.commit.__code__}
+# Built-in functions left out of the hottest function of the cprofile mode
+_IDLE_BUILTINS = ("'acquire' of '_thread.lock'", "builtins.input")
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    This class is used to count the Python stacks of all threads, sampled every interval by a background thread.
+
+    Stacks of threads waiting for a lock, an event, a queue or the user are left out, stacks waiting for the
+    server end with DATABASE_FRAME.
+    """
+
+    def __init__(self, interval: float = 0.005, idle_codes=()):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        interval (float, optional): The time in seconds between two samples. Defaults to 0.005.
+        idle_codes (iterable, optional): Code objects of functions that only wait when they are the innermost frame.
+        """
+        self.interval = interval
+        self.idle_codes = {futures_thread._worker.__code__, *idle_codes}
+        self.stacks: Counter = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self) -> Counter:
+        """
+        This method is used to stop sampling.
+
+        Returns:
+        stacks (Counter): The number of samples of every stack, frames joined by ";" from the outermost.
+        """
+        self.stopped.set()
+        self.thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self._sample(frame)
+
+    def _sample(self, frame):
+        code = frame.f_code
+        if code in self.idle_codes or os.path.basename(code.co_filename) == "threading.py":
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        if code in _DATABASE_CODES:
+            stack.append(DATABASE_FRAME)
+        self.stacks[";".join(stack)] += 1
+
+
+class ActionProfiler:
+    """
+    This class is used to profile actions, e.g. the menu actions of the Controller, one file per action.
+
+    Every action gets its wall time without the prompts, the CPU time of the process and the time the
+    statements waited for the server, from Activity.db_seconds. Both add up all threads, so an action with
+    parallel statements can wait longer for the server than it ran. The sampling mode writes the sampled stacks
+    as collapsed stacks (.collapsed), which flamegraph.pl and speedscope draw as flame graphs. The cprofile mode
+    writes the calls of the action thread and of the threads run under thread() as pstats files (.prof).
+    """
+
+    def __init__(self, directory: str, activity, mode: str = "sampling", interval: float = 0.005):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        directory (str): The directory the profiles and the summary are written to, created if missing.
+        activity (Activity): The activity whose cursors measure the time spent waiting for the server.
+        mode (str, optional): sampling or cprofile. Defaults to "sampling".
+        interval (float, optional): The time in seconds between two samples of the sampling mode. Defaults to 0.005.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.activity = activity
+        self.mode = mode
+        self.interval = interval
+        self.count = 0
+        self.summaries: List[dict] = []
+        self.lock = threading.Lock()
+        self.thread_profiles: List[cProfile.Profile] = []
+        self.active = False
+        self.input_seconds = 0.0
+        self._input = builtins.input
+
+    def _timed_input(self, prompt=""):
+        # The time the user takes to answer is not time of the action
+        start = time.perf_counter()
+        try:
+            return self._input(prompt)
+        finally:
+            self.input_seconds += time.perf_counter() - start
+
+    @contextlib.contextmanager
+    def action(self, name: str):
+        """
+        This method is used to profile the block as one action.
+
+        Parameters:
+        name (str): The name of the action, used for the file name and the summary.
+
+        Returns:
+        summary (dict): Filled when the block ends with the action, its wall, CPU and database seconds,
+            the innermost function seen most often and the path of the profile.
+        """
+        self.count += 1
+        path = os.path.join(self.directory, f"{self.count:03d}-{name}")
+        summary = {"action": name}
+        self.input_seconds = 0.0
+        self.thread_profiles = []
+        builtins.input = self._timed_input
+        start, cpu_start, db_start = time.perf_counter(), time.process_time(), self.activity.db_seconds
+        if self.mode == "sampling":
+            sampler = StackSampler(self.interval, {self._timed_input.__code__})
+            sampler.start()
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.active = True
+        try:
+            yield summary
+        finally:
+            self.active = False
+            builtins.input = self._input
+            if self.mode == "sampling":
+                stacks = sampler.stop()
+                path += ".collapsed"
+                with open(path, "w", encoding="utf-8") as file:
+                    for stack, samples in stacks.most_common():
+                        file.write(f"{stack} {samples}\n")
+                leaves = Counter()
+                for stack, samples in stacks.items():
+                    leaves[stack.rsplit(";", 1)[-1]] += samples
+                hottest = leaves.most_common(1)[0][0] if leaves else ""
+            else:
+                profile.disable()
+                path += ".prof"
+                stats = pstats.Stats(profile)
+                for thread_profile in self.thread_profiles:
+                    stats.add(thread_profile)
+                stats.dump_stats(path)
+                # Waiting for a lock or the user takes time without running anything
+                functions = sorted(
+                    (item for item in stats.stats.items() if not any(idle in item[0][2] for idle in _IDLE_BUILTINS)),
+                    key=lambda item: item[1][2],
+                    reverse=True,
+                )
+                hottest = ""
+                if functions:
+                    filename, line, function = functions[0][0]
+                    # Built-in functions have no file
+                    hottest = re.sub(r" at 0x[0-9a-f]+", "", function) if filename == "~" else f"{function} ({os.path.basename(filename)}:{line})"
+            summary.update(
+                wall=round(time.perf_counter() - start - self.input_seconds, 3),
+                cpu=round(time.process_time() - cpu_start, 3),
+                database=round(self.activity.db_seconds - db_start, 3),
+                hottest=hottest,
+                path=path,
+            )
+            self.summaries.append(summary)
+
+    @contextlib.contextmanager
+    def thread(self):
+        """
+        This method is used to profile the block, run in another thread, as part of the running action.
+
+        cProfile follows only the thread that enabled it, so the threads of an action that run Python code
+        enable their own profile. Python 3.12 and later profile every thread with one profile and refuse a second one.
+        """
+        if self.mode != "cprofile" or not self.active:
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                self.thread_profiles.append(profile)
+
+    def summary(self) -> List[tuple]:
+        """
+        This method is used to sum the profiled actions by name and to write the sums to summary.csv.
+
+        Returns:
+        rows (list): A list of (action, calls, wall, cpu, database, database share) tuples, the slowest actions first.
+        """
+        totals: Dict[str, List[float]] = {}
+        for summary in self.summaries:
+            total = totals.setdefault(summary["action"], [0, 0.0, 0.0, 0.0])
+            total[0] += 1
+            total[1] += summary["wall"]
+            total[2] += summary["cpu"]
+            total[3] += summary["database"]
+        rows = [
+            (name, calls, round(wall, 3), round(cpu, 3), round(database, 3), round(database / wall, 3) if wall > 0 else 0.0)
+            for name, (calls, wall, cpu, database) in totals.items()
+        ]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        with open(os.path.join(self.directory, "summary.csv"), "w", encoding="utf-8") as file:
+            file.write("action,calls,wall_s,cpu_s,database_s,database_share\n")
+            for row in rows:
+                file.write(",".join(str(value) for value in row) + "\n")
+        return rows
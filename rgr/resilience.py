@@ -0,0 +1,156 @@
+import functools
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import errors
+
+# Kinds of failures worth another attempt
+RECONNECT = "reconnect"
+RETRY = "retry"
+
+
+def classify(error: BaseException) -> Optional[str]:
+    """
+    This function is used to tell whether a failed call may succeed if it is run again.
+
+    Parameters:
+    error (Exception): The error of the call.
+
+    Returns:
+    kind (str or None): RETRY for serialization failures and deadlocks, which roll the transaction back,
+        RECONNECT for lost connections, None for errors another attempt would not fix, including timeouts and cancels.
+    """
+    if isinstance(error, psycopg2.extensions.TransactionRollbackError):
+        return RETRY
+    if isinstance(error, errors.QueryCanceled):
+        return None
+    if isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+        return RECONNECT
+    return None
+
+
+class RetryPolicy:
+    """
+    This class is used to hold how often and how long to wait before a failed call is run again.
+
+    The n-th wait is a random time between 0 and min(max_delay, base_delay * 2 ** n), so callers that failed
+    together do not come back together.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.05, max_delay: float = 2.0):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        attempts (int, optional): The number of attempts after the first one. Defaults to 3.
+        base_delay (float, optional): The longest first wait in seconds. Defaults to 0.05.
+        max_delay (float, optional): The longest wait in seconds. Defaults to 2.0.
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class RetryMetrics:
+    """
+    This class is used to count the attempts, retries and failures of calls and to keep their latencies.
+    """
+
+    def __init__(self, window: int = 1000):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        window (int, optional): The number of latest latencies kept per name. Defaults to 1000.
+        """
+        self.window = window
+        self.lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self.latencies: Dict[str, List[float]] = {}
+
+    def record(self, name: str, retries: int, seconds: float, ok: bool, failover: bool = False):
+        """
+        This method is used to record one call.
+
+        Parameters:
+        name (str): The name of the call, e.g. the method or "connect".
+        retries (int): The number of attempts after the first one.
+        seconds (float): The time of the call with all attempts and waits.
+        ok (bool): Whether the call succeeded in the end.
+        failover (bool, optional): Whether the call succeeded on another host than the first one. Defaults to False.
+        """
+        with self.lock:
+            counts = self.counts.setdefault(name, {"calls": 0, "retries": 0, "recovered": 0, "failed": 0, "failovers": 0})
+            counts["calls"] += 1
+            counts["retries"] += retries
+            counts["recovered"] += retries > 0 and ok
+            counts["failed"] += not ok
+            counts["failovers"] += failover
+            latencies = self.latencies.setdefault(name, [])
+            latencies.append(seconds)
+            del latencies[:-self.window]
+
+    def summary(self) -> Dict[str, dict]:
+        """
+        This method is used to get the counts and the latency percentiles of every name.
+
+        Returns:
+        summary (dict): For every name the counts and the p50, p95 and max latency in milliseconds.
+        """
+        with self.lock:
+            summary = {}
+            for name, counts in self.counts.items():
+                latencies = sorted(self.latencies[name])
+                summary[name] = dict(counts)
+                for label, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("max_ms", 1.0)):
+                    summary[name][label] = round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2)
+            return summary
+
+
+def retried(kind: str):
+    """
+    This function is used to make a decorator that runs a Model method again after a transient failure.
+
+    The Model methods report errors by printing them and returning None or False, so the decorator looks at the
+    errors the cursors of the call recorded in Model.activity. RETRY failures are run again for every method,
+    RECONNECT failures only for kind "read", since a write may have committed before its connection broke.
+
+    Parameters:
+    kind (str): "read" for methods that only read, "write" for methods whose transaction changes data.
+
+    Returns:
+    decorator (callable): The decorator.
+    """
+    def decorator(method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            policy = self.retry_policy
+            start = time.perf_counter()
+            attempt = 0
+            while True:
+                self.activity.take_error()
+                raised = None
+                try:
+                    result = method(self, *args, **kwargs)
+                    error = self.activity.take_error()
+                except Exception as e:
+                    result, error, raised = None, e, e
+                failure = None if result not in (None, False) or error is None else classify(error)
+                if failure == RECONNECT and kind != "read":
+                    failure = None
+                if failure is None or attempt >= policy.attempts:
+                    ok = result not in (None, False)
+                    self.retry_metrics.record(method.__name__, attempt, time.perf_counter() - start, ok)
+                    if raised is not None:
+                        raise raised
+                    return result
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+        return wrapper
+    return decorator
@@ -0,0 +1,142 @@
+import itertools
+import threading
+import time
+from typing import Dict, List
+
+import psycopg2
+from psycopg2.extensions import parse_dsn, make_dsn
+
+REPLICA_SELECTIONS = ("round_robin", "least_loaded")
+
+
+class TrackedConnection(psycopg2.extensions.connection):
+    """
+    This class is a psycopg2 connection that calls on_close once when it is closed or garbage collected
+    and reports the errors and the time of its commits to its activity.
+    """
+
+    on_close = None
+    # The Activity the cursors of the connection report to and the number of its operation, see activity.py
+    activity = None
+    operation = None
+
+    def commit(self):
+        # Errors of the commit, e.g. serialization failures, count as errors of the statements
+        start = time.perf_counter()
+        try:
+            super().commit()
+        except Exception as e:
+            if self.activity is not None:
+                self.activity.fail(e, self)
+            raise
+        finally:
+            if self.activity is not None:
+                self.activity.add_db_time(time.perf_counter() - start)
+
+    def close(self):
+        if self.on_close is not None:
+            callback, self.on_close = self.on_close, None
+            callback()
+        super().close()
+
+    def __del__(self):
+        if self.on_close is not None:
+            callback, self.on_close = self.on_close, None
+            callback()
+
+
+def replica_dsn(replica: str, db_name: str, user: str, password: str) -> str:
+    """
+    This function is used to build the DSN of a replica.
+
+    Parameters:
+    replica (str): A libpq DSN such as "host=localhost port=5433", or "host:port".
+        Missing database name, user and password are taken from the primary.
+    db_name (str): The name of the database on the primary.
+    user (str): The user on the primary.
+    password (str): The password on the primary.
+
+    Returns:
+    dsn (str): The DSN of the replica.
+    """
+    params = {"dbname": db_name, "user": user, "password": password}
+    if "=" in replica:
+        params.update(parse_dsn(replica))
+    else:
+        host, _, port = replica.partition(":")
+        params["host"] = host
+        if port:
+            params["port"] = port
+    return make_dsn(**params)
+
+
+class ReplicaRouter:
+    """
+    This class is used to pick the replica for a read-only connection.
+
+    round_robin takes the replicas in turn, least_loaded takes the replica with the fewest open connections
+    of this process. After a write all reads go to the primary for read_your_writes seconds, so a caller
+    sees its own writes even if the replicas lag behind.
+    """
+
+    def __init__(self, dsns: List[str], selection: str = "round_robin", read_your_writes: float = 0.0):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        dsns (list): The DSNs of the replicas.
+        selection (str, optional): round_robin or least_loaded. Defaults to "round_robin".
+        read_your_writes (float, optional): The time in seconds reads stay on the primary after a write. Defaults to 0.0.
+        """
+        if selection not in REPLICA_SELECTIONS:
+            raise ValueError(f"Unsupported replica selection '{selection}'")
+        self.dsns = dsns
+        self.selection = selection
+        self.read_your_writes = read_your_writes
+        self.in_flight: Dict[str, int] = {dsn: 0 for dsn in dsns}
+        self.last_write = float("-inf")
+        self.lock = threading.Lock()
+        self.cycle = itertools.cycle(dsns)
+
+    def mark_write(self):
+        """
+        This method is used to record that a write connection was opened.
+        """
+        self.last_write = time.monotonic()
+
+    def candidates(self) -> List[str]:
+        """
+        This method is used to get the replicas to try for a read, the preferred one first.
+
+        Returns:
+        dsns (list): The DSNs of the replicas, empty if the read has to go to the primary.
+        """
+        if time.monotonic() - self.last_write < self.read_your_writes:
+            return []
+        with self.lock:
+            if self.selection == "round_robin":
+                first = next(self.cycle)
+                index = self.dsns.index(first)
+                return self.dsns[index:] + self.dsns[:index]
+            return sorted(self.dsns, key=lambda dsn: self.in_flight[dsn])
+
+    def connect(self, dsn: str, **kwargs) -> TrackedConnection:
+        """
+        This method is used to open a connection to a replica and count it until it is closed.
+
+        Parameters:
+        dsn (str): The DSN of the replica.
+        **kwargs: Further connection parameters, e.g. options.
+
+        Returns:
+        conn (TrackedConnection): The connection to the replica.
+        """
+        conn = psycopg2.connect(dsn, connection_factory=TrackedConnection, **kwargs)
+        with self.lock:
+            self.in_flight[dsn] += 1
+        conn.on_close = lambda: self._release(dsn)
+        return conn
+
+    def _release(self, dsn: str):
+        with self.lock:
+            self.in_flight[dsn] -= 1
@@ -0,0 +1,288 @@
+import heapq
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from common.filters import Comparison, check_identifier
+from model import Model
+
+# Tables split across the shards by SHARD_KEY
+SHARDED_TABLES = ("tbl_order", "tbl_company_client")
+# Tables copied to every shard. tbl_client is copied too, because every order references a client.
+REFERENCE_TABLES = ("tbl_company", "tbl_pay_system", "tbl_client")
+SHARD_KEY = "company_id"
+
+
+class ShardedModel:
+    """
+    This class is used to spread the orders over several PostgreSQL databases by the hash of company_id.
+
+    Every shard is a Model with the full schema. Orders and company clients live on the shard of their company,
+    the reference tables are written to every shard with the id taken from the first shard, so joins stay local.
+    Reads of sharded tables and the reports run on all shards at once and their partial results are merged.
+    Call interleave_ids() once so the shards do not hand out the same order ids.
+    """
+
+    def __init__(self, shards: List[Model]):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        shards (list): The Models of the shards. The order must not change while the shards hold data.
+        """
+        self.shards = shards
+        self.executor = ThreadPoolExecutor(max_workers=len(shards))
+
+    def shard_for(self, company_id) -> Model:
+        """
+        This method is used to get the shard of a company.
+
+        Parameters:
+        company_id (int or str): The id of the company.
+
+        Returns:
+        shard (Model): The Model of the shard that holds the orders of the company.
+        """
+        # crc32 gives the same shard in every process, unlike hash()
+        return self.shards[zlib.crc32(str(int(company_id)).encode()) % len(self.shards)]
+
+    def interleave_ids(self) -> bool:
+        """
+        This method is used to make the serial ids of the sharded tables unique across the shards.
+
+        The id sequence of shard i is restarted at the highest id of all shards plus i + 1 and steps by the
+        number of shards, so the shards never hand out the same id. The id sequences of the reference tables of the
+        first shard, which hand out the ids of every shard, are moved past the ids of all shards. It should run once
+        before sharded inserts.
+
+        Returns:
+        bool: True if the sequences of every shard were changed, False otherwise.
+        """
+        for table in SHARDED_TABLES:
+            key = "id" if table == "tbl_order" else "company_client_id"
+            maxima = self._scatter("get_data", table, [f"COALESCE(max({key}), 0)"])
+            if any(result is None for result in maxima):
+                return False
+            start = max(result[0][0] for result in maxima) + 1
+
+            for i, shard in enumerate(self.shards):
+                conn, cur = shard.connect()
+                if conn is None or cur is None:
+                    return False
+                try:
+                    cur.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, key))
+                    sequence = cur.fetchone()[0]
+                    cur.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {len(self.shards)} RESTART WITH {start + i}")
+                except Exception as e:
+                    print("Error: Invalid sequence change\n", e)
+                    conn.close()
+                    return False
+                conn.commit()
+                cur.close()
+                conn.close()
+
+        # The ids of the reference tables come from the first shard, it starts past the ids of every shard
+        for table in REFERENCE_TABLES:
+            maxima = self._scatter("get_data", table, ["COALESCE(max(id), 0)"])
+            if any(result is None for result in maxima):
+                return False
+            conn, cur = self.shards[0].connect()
+            if conn is None or cur is None:
+                return False
+            try:
+                cur.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", (table, max(1, max(result[0][0] for result in maxima))))
+            except Exception as e:
+                print("Error: Invalid sequence change\n", e)
+                conn.close()
+                return False
+            conn.commit()
+            cur.close()
+            conn.close()
+        return True
+
+    def _scatter(self, method: str, *args, **kwargs) -> list:
+        # Run the method on every shard at once, the results are in the order of the shards
+        futures = [self.executor.submit(getattr(shard, method), *args, **kwargs) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def insert_data(self, table: str, columns: list, data: dict) -> bool:
+        """
+        This method is used to insert data into the shard of its company, or into every shard for a reference table.
+
+        Parameters:
+        table (str): The name of the table where the data will be inserted.
+        columns (list): A list of column names where the data will be inserted.
+        data (dict): A dictionary where the key is the column name and the value is the data to be inserted.
+
+        Returns:
+        bool: True if the data was successfully inserted, False otherwise.
+        """
+        if table in SHARDED_TABLES:
+            if SHARD_KEY not in data:
+                print(f"Error: Invalid data insert\n {SHARD_KEY} is required for {table}")
+                return False
+            return self.shard_for(data[SHARD_KEY]).insert_data(table, columns, data)
+        if table in REFERENCE_TABLES:
+            return self._insert_reference(table, columns, data)
+        return self.shards[0].insert_data(table, columns, data)
+
+    def _insert_reference(self, table: str, columns: list, data: dict) -> bool:
+        # The id is taken once from the sequence of the first shard, so the copies of the row have the same id.
+        # The row is inserted on every shard and committed only when every insert succeeded.
+        data = dict(zip(columns, (data[key] for key in data)))
+        connections, shard = [], 0
+        try:
+            if "id" not in data:
+                conn, cur = self.shards[0].connect()
+                if conn is None or cur is None:
+                    raise ConnectionError("Unable to connect to the database")
+                try:
+                    cur.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", (table,))
+                    data["id"] = cur.fetchone()[0]
+                    conn.commit()
+                finally:
+                    conn.close()
+            query = f"INSERT INTO {check_identifier(table)} ({', '.join(check_identifier(column) for column in data)}) VALUES %s"
+            for shard, model in enumerate(self.shards):
+                conn, cur = model.connect()
+                if conn is None or cur is None:
+                    raise ConnectionError("Unable to connect to the database")
+                connections.append(conn)
+                cur.execute(query, (tuple(data.values()),))
+        except Exception as e:
+            print(f"Error: Invalid data insert on shard {shard}\n", e)
+            for conn in connections:
+                conn.rollback()
+                conn.close()
+            return False
+
+        failed = []
+        for i, conn in enumerate(connections):
+            try:
+                conn.commit()
+            except Exception as e:
+                print(f"Error: Invalid data insert commit on shard {i}\n", e)
+                failed.append(i)
+            conn.close()
+        if failed:
+            # Remove the row again from the shards that committed it, so all shards hold the same rows
+            for i, model in enumerate(self.shards):
+                if i not in failed and not model.delete_data(table, Comparison("id", "=", data["id"])):
+                    print(f"Error: Invalid data insert\n Shard {i} keeps {table} row {data['id']}")
+            return False
+        return True
+
+    def get_data(self, table: str, columns: list, condition=None) -> Union[list, None]:
+        """
+        This method is used to retrieve data from a table, from all shards for a sharded table.
+
+        Parameters:
+        table (str): The name of the table from which the data will be retrieved.
+        columns (list): The names of the columns to be retrieved.
+        condition (str or Filter, optional): The condition for the data retrieval. Defaults to None.
+
+        Returns:
+        data (list or None): A list of tuples representing the rows of data retrieved from the database.
+        None: If there is an error in connection or execution, or if no shard has data.
+        """
+        if table not in SHARDED_TABLES:
+            return self.shards[0].get_data(table, columns, condition)
+        data = [row for result in self._scatter("get_data", table, columns, condition) if result for row in result]
+        return data or None
+
+    def update_data(self, table: str, data: dict, condition=None) -> bool:
+        """
+        This method is used to update data on every shard, since the condition may match rows of any shard.
+
+        Parameters:
+        table (str): The name of the table where the data will be updated.
+        data (dict): A dictionary where the key is the column name and the value is the new data to be updated.
+        condition (str or Filter, optional): The condition for the data update. Defaults to None.
+
+        Returns:
+        bool: True if the data was successfully updated on every shard, False otherwise.
+        """
+        if table in SHARDED_TABLES and SHARD_KEY in data:
+            print(f"Error: Invalid data update\n {SHARD_KEY} of {table} can not be changed")
+            return False
+        return _all_shards(self._scatter("update_data", table, data, condition), "update")
+
+    def delete_data(self, table: str, condition) -> bool:
+        """
+        This method is used to delete data on every shard.
+
+        Parameters:
+        table (str): The name of the table where the data will be deleted.
+        condition (str or Filter): The condition for the data deletion.
+
+        Returns:
+        bool: True if the data was successfully deleted on every shard, False otherwise.
+        """
+        return _all_shards(self._scatter("delete_data", table, condition), "delete")
+
+    def pay_systems_total_income(self, left: int, right: int) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the total income of each pay system by summing the results of all shards.
+
+        Parameters:
+        left (int): The left bound of the sum of the orders.
+        right (int): The right bound of the sum of the orders.
+
+        Returns:
+        data (list or None): A list of (id, name, count, total) tuples.
+        If there is an error in connection or execution on any shard, it returns None.
+        """
+        return _merge_sums(self._scatter("pay_systems_total_income", left, right))
+
+    def company_orders_thru_period(self, left: str, right: str) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the number of orders placed by each company by summing the results of all shards.
+
+        Parameters:
+        left (str): The left bound of the period.
+        right (str): The right bound of the period.
+
+        Returns:
+        data (list or None): A list of (id, company, orders) tuples.
+        If there is an error in connection or execution on any shard, it returns None.
+        """
+        return _merge_sums(self._scatter("company_orders_thru_period", left, right))
+
+    def top_5_orders_total_price(self, company: str) -> Union[List[Tuple], None]:
+        """
+        This method is used to retrieve the top 5 orders of a company from the top 5 of every shard.
+
+        Parameters:
+        company (str): The name of the company.
+
+        Returns:
+        data (list or None): A list of (order_id, total_price) tuples, the highest total price first.
+        If there is an error in connection or execution on any shard, it returns None.
+        """
+        results = self._scatter("top_5_orders_total_price", company)
+        if any(result is None for result in results):
+            return None
+        return heapq.nlargest(5, (row for result in results for row in result), key=lambda row: row[1])
+
+
+def _all_shards(results: List[bool], action: str) -> bool:
+    # The shards that failed are named, the others keep their change
+    failed = [str(i) for i, result in enumerate(results) if not result]
+    if failed:
+        print(f"Error: Invalid data {action}\n It failed on shard {', '.join(failed)}")
+    return not failed
+
+
+def _merge_sums(results: List[Union[List[Tuple], None]]) -> Union[List[Tuple], None]:
+    # Rows are (id, name, aggregates...), the aggregates of the same id are added up
+    if any(result is None for result in results):
+        return None
+    merged: Dict[Tuple, list] = {}
+    for result in results:
+        for row in result:
+            key = tuple(row[:2])
+            if key in merged:
+                merged[key] = [total + value for total, value in zip(merged[key], row[2:])]
+            else:
+                merged[key] = list(row[2:])
+    return [key + tuple(values) for key, values in sorted(merged.items())]
@@ -0,0 +1,253 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from bulkload import run_statements, secondary_indexes
+
+# The tables of the schema, parents before children
+TABLES = ["tbl_client", "tbl_company", "tbl_pay_system", "tbl_company_client", "tbl_order"]
+MANIFEST = "manifest.json"
+
+
+def _open(connect: Callable):
+    conn, cur = connect()
+    if conn is None or cur is None:
+        raise ConnectionError("Unable to connect to the database")
+    return conn, cur
+
+
+def _throughput(rows: int, size: int, seconds: float) -> Dict[str, float]:
+    seconds = max(seconds, 1e-9)
+    return {
+        "rows": rows,
+        "bytes": size,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 1),
+        "mb_per_second": round(size / seconds / 2 ** 20, 2),
+    }
+
+
+def dump_snapshot(connect: Callable, directory: str, tables: List[str] = TABLES, workers: int = 4) -> dict:
+    """
+    This function is used to dump tables to binary COPY files from one consistent snapshot.
+
+    A coordinator transaction exports its snapshot with pg_export_snapshot() and stays open while the workers
+    dump the tables in parallel. Every worker imports the snapshot with SET TRANSACTION SNAPSHOT, so all
+    the files show the database at the same moment.
+
+    Parameters:
+    connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+    directory (str): The directory to write the files and the manifest to.
+    tables (list, optional): The tables to dump. Defaults to TABLES.
+    workers (int, optional): The number of tables dumped at once. Defaults to 4.
+
+    Returns:
+    manifest (dict): The snapshot id, the total time and the columns and throughput of every table.
+    """
+    os.makedirs(directory, exist_ok=True)
+    start = time.perf_counter()
+
+    coordinator, cur = _open(connect)
+    try:
+        coordinator.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        cur.execute("SELECT pg_export_snapshot()")
+        snapshot = cur.fetchone()[0]
+
+        def dump_table(table: str) -> dict:
+            conn, worker_cur = _open(connect)
+            try:
+                conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+                worker_cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+                worker_cur.execute(f"SELECT * FROM {table} LIMIT 0")
+                columns = [column.name for column in worker_cur.description]
+
+                path = os.path.join(directory, f"{table}.bin")
+                table_start = time.perf_counter()
+                with open(path, "wb") as file:
+                    worker_cur.copy_expert(f"COPY {table} TO STDOUT (FORMAT binary)", file)
+                elapsed = time.perf_counter() - table_start
+                conn.commit()
+                return dict(file=os.path.basename(path), columns=columns, **_throughput(worker_cur.rowcount, os.path.getsize(path), elapsed))
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = dict(zip(tables, executor.map(dump_table, tables)))
+        coordinator.commit()
+    finally:
+        coordinator.close()
+
+    manifest = dict(snapshot=snapshot, tables=results, **_throughput(
+        sum(result["rows"] for result in results.values()),
+        sum(result["bytes"] for result in results.values()),
+        time.perf_counter() - start,
+    ))
+    with open(os.path.join(directory, MANIFEST), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+    return manifest
+
+
+def _fk_levels(cur, tables: List[str]) -> List[List[str]]:
+    # Split the tables into levels, every table only references tables of the previous levels
+    cur.execute(
+        """
+        SELECT conrelid::regclass::text, confrelid::regclass::text
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s) AND confrelid::regclass::text = ANY(%s)
+        """,
+        (tables, tables),
+    )
+    parents = {table: set() for table in tables}
+    for child, parent in cur.fetchall():
+        if child != parent:
+            parents[child].add(parent)
+
+    levels, done = [], set()
+    while len(done) < len(tables):
+        level = [table for table in tables if table not in done and parents[table] <= done]
+        if not level:
+            # A reference cycle, the constraints are dropped anyway so the rest loads together
+            level = [table for table in tables if table not in done]
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+def _recreate(connect: Callable, conn, cur, indexes: List[Tuple[str, str]], foreign_keys: List[tuple], workers: int):
+    # After a failed restore the missing indexes and foreign keys are created one by one, so one failure does not stop the others.
+    # A foreign key the loaded rows break is added NOT VALID, it checks the new rows but not the loaded ones.
+    for name, definition in indexes:
+        cur.execute("SELECT to_regclass(%s)", (name,))
+        if cur.fetchone()[0] is not None:
+            continue
+        try:
+            run_statements(connect, [definition], workers)
+        except Exception as e:
+            print(f"Error: Invalid index {name} after the failed restore\n", e)
+    for table, name, definition in foreign_keys:
+        cur.execute("SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass AND conname = %s", (table, name))
+        if cur.fetchone() is not None:
+            continue
+        for suffix in ("", " NOT VALID"):
+            try:
+                cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}{suffix}")
+                conn.commit()
+                break
+            except Exception as e:
+                conn.rollback()
+                if suffix:
+                    print(f"Error: Invalid constraint {name} after the failed restore\n", e)
+    conn.commit()
+
+
+def restore_snapshot(connect: Callable, directory: str, workers: int = 4) -> dict:
+    """
+    This function is used to load a dump written by dump_snapshot() into existing tables.
+
+    The foreign keys and the secondary indexes of the tables are dropped and the tables are truncated.
+    The files are loaded with binary COPY in foreign key order, the tables of one level in parallel.
+    Afterwards the indexes and the foreign keys are created again, the serial sequences are moved past
+    the loaded keys and the tables are analyzed. If a step after the truncate fails, the missing indexes and
+    foreign keys are created again before the error is raised and the tables keep the rows loaded so far.
+
+    Parameters:
+    connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+    directory (str): The directory with the files and the manifest.
+    workers (int, optional): The number of tables loaded or indexes built at once. Defaults to 4.
+
+    Returns:
+    report (dict): The time of every phase and the throughput of every table.
+    """
+    with open(os.path.join(directory, MANIFEST)) as file:
+        manifest = json.load(file)
+    tables = list(manifest["tables"])
+    phases = {}
+    start = time.perf_counter()
+
+    conn, cur = _open(connect)
+    try:
+        levels = _fk_levels(cur, tables)
+        cur.execute(
+            """
+            SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+            FROM pg_constraint
+            WHERE contype = 'f' AND conrelid::regclass::text = ANY(%s)
+            """,
+            (tables,),
+        )
+        foreign_keys = cur.fetchall()
+        # Indexes that back a constraint (primary keys, unique constraints) stay
+        indexes = secondary_indexes(cur, tables)
+
+        for table, name, _ in foreign_keys:
+            cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        for name, _ in indexes:
+            cur.execute(f"DROP INDEX {name}")
+        cur.execute(f"TRUNCATE {', '.join(tables)}")
+        conn.commit()
+        phases["prepare"] = round(time.perf_counter() - start, 3)
+    except Exception:
+        conn.close()
+        raise
+
+    try:
+        def load_table(table: str) -> dict:
+            load_conn, load_cur = _open(connect)
+            try:
+                entry = manifest["tables"][table]
+                path = os.path.join(directory, entry["file"])
+                table_start = time.perf_counter()
+                with open(path, "rb") as file:
+                    load_cur.copy_expert(f"COPY {table} ({', '.join(entry['columns'])}) FROM STDIN (FORMAT binary)", file)
+                load_conn.commit()
+                return _throughput(load_cur.rowcount, os.path.getsize(path), time.perf_counter() - table_start)
+            finally:
+                load_conn.close()
+
+        phase_start = time.perf_counter()
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for level in levels:
+                results.update(zip(level, executor.map(load_table, level)))
+            phases["load"] = round(time.perf_counter() - phase_start, 3)
+
+        phase_start = time.perf_counter()
+        run_statements(connect, [definition for _, definition in indexes], workers)
+        phases["indexes"] = round(time.perf_counter() - phase_start, 3)
+
+        phase_start = time.perf_counter()
+        for table, name, definition in foreign_keys:
+            cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        cur.execute(
+            """
+            SELECT table_name, column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = ANY(%s) AND column_default LIKE 'nextval(%%'
+            """,
+            (tables,),
+        )
+        for table, column in cur.fetchall():
+            cur.execute(f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(max({column}), 1), max({column}) IS NOT NULL) FROM {table}", (table, column))
+        conn.commit()
+        phases["constraints"] = round(time.perf_counter() - phase_start, 3)
+
+        phase_start = time.perf_counter()
+        conn.autocommit = True
+        cur.execute(f"ANALYZE {', '.join(tables)}")
+        phases["analyze"] = round(time.perf_counter() - phase_start, 3)
+    except Exception:
+        conn.rollback()
+        conn.autocommit = False
+        _recreate(connect, conn, cur, indexes, foreign_keys, workers)
+        raise
+    finally:
+        conn.close()
+
+    return dict(phases=phases, tables=results, **_throughput(
+        sum(result["rows"] for result in results.values()),
+        sum(result["bytes"] for result in results.values()),
+        time.perf_counter() - start,
+    ))
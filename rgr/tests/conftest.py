@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules of the app import each other by their plain names, the shared ones come from the common package
+APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP, os.path.dirname(APP)]
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from admission import Admission, admitted
+
+
+class Reports:
+    def __init__(self):
+        self.admission = Admission({"aggregate": (1, 1.0, 10)})
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.calls = 0
+
+    @admitted("aggregate")
+    def total(self, left: int, right: int, sample=None) -> list:
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return [left, right]
+
+
+def test_spellings_of_the_same_call_are_coalesced():
+    reports = Reports()
+    results = []
+    calls = [((1, 2), {}), ((1,), {"right": 2}), ((), {"right": 2, "left": 1}), ((1, 2, None), {})]
+    threads = [threading.Thread(target=lambda args=args, kwargs=kwargs: results.append(reports.total(*args, **kwargs))) for args, kwargs in calls]
+    threads[0].start()
+    assert reports.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # The followers wait for the running call before it is released
+    deadline = time.monotonic() + 1
+    while reports.admission.stats["aggregate"]["coalesced"] < len(calls) - 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    reports.release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert reports.calls == 1
+    assert results == [[1, 2]] * len(calls)
+    assert reports.admission.stats["aggregate"] == {"runs": 1, "coalesced": 3, "rejected": 0, "timed_out": 0}
+
+
+def test_different_arguments_are_not_coalesced():
+    reports = Reports()
+    reports.release.set()
+    assert reports.total(1, 2) == [1, 2]
+    assert reports.total(1, 2, sample=0.1) == [1, 2]
+    assert reports.calls == 2
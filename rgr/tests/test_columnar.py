@@ -0,0 +1,78 @@
+import struct
+
+import numpy as np
+import pytest
+
+from common.columnar import COPY_SIGNATURE, BinaryCopyReader, concat_chunks
+
+INT4, FLOAT8, DATE = 23, 701, 1082
+
+
+def _stream(rows, formats) -> bytes:
+    # A binary COPY stream: header, one tuple per row with None written as NULL, trailer
+    data = COPY_SIGNATURE + struct.pack(">ii", 0, 0)
+    for row in rows:
+        data += struct.pack(">h", len(row))
+        for value, fmt in zip(row, formats):
+            if value is None:
+                data += struct.pack(">i", -1)
+            else:
+                data += struct.pack(">i", struct.calcsize(fmt)) + struct.pack(fmt, value)
+    return data + struct.pack(">h", -1)
+
+
+def _read(rows, chunk_size=2, piece=7):
+    chunks = []
+    reader = BinaryCopyReader(["id", "sum", "date"], [INT4, FLOAT8, DATE], chunk_size, chunks.append)
+    data = _stream(rows, (">i", ">d", ">i"))
+    # copy_expert() writes the stream in pieces that split the header and the rows
+    for start in range(0, len(data), piece):
+        reader.write(data[start:start + piece])
+    reader.close()
+    return reader, concat_chunks(chunks, ["id", "sum", "date"])
+
+
+def test_fixed_width_rows():
+    reader, columns = _read([(1, 1.5, 0), (2, 2.5, 1), (3, 3.5, -10957)])
+    assert reader.rows == 3
+    assert columns["id"].dtype == np.int32 and columns["id"].tolist() == [1, 2, 3]
+    assert columns["sum"].tolist() == [1.5, 2.5, 3.5]
+    assert columns["date"].dtype == np.dtype("datetime64[D]")
+    assert [str(value) for value in columns["date"]] == ["2000-01-01", "2000-01-02", "1970-01-01"]
+
+
+def test_null_values():
+    reader, columns = _read([(1, None, 0), (2, 2.5, None), (3, 3.5, 1)])
+    assert reader.rows == 3
+    assert columns["id"].tolist() == [1, 2, 3]
+    assert np.ma.getmaskarray(columns["sum"]).tolist() == [True, False, False]
+    assert np.ma.getmaskarray(columns["date"]).tolist() == [False, True, False]
+    assert columns["sum"].dtype == np.float64
+    assert columns["sum"][1:].tolist() == [2.5, 3.5]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_chunk_sizes(chunk_size):
+    rows = [(i, i / 2, None if i % 3 == 0 else i) for i in range(10)]
+    reader, columns = _read(rows, chunk_size=chunk_size, piece=5)
+    assert reader.rows == 10
+    assert columns["id"].tolist() == list(range(10))
+    assert np.ma.getmaskarray(columns["date"]).tolist() == [i % 3 == 0 for i in range(10)]
+
+
+def test_empty_stream():
+    reader, columns = _read([])
+    assert reader.rows == 0
+    assert all(len(column) == 0 for column in columns.values())
+
+
+def test_invalid_signature():
+    reader = BinaryCopyReader(["id"], [INT4], 10, lambda chunk: None)
+    with pytest.raises(ValueError):
+        reader.write(b"NOTCOPY\n\xff\r\n\x00" + bytes(8))
+
+
+def test_no_chunks_keep_the_column_types():
+    columns = concat_chunks([], ["id", "sum", "date", "name"], [INT4, FLOAT8, DATE, 25])
+    assert {name: str(values.dtype) for name, values in columns.items()} == {"id": "int32", "sum": "float64", "date": "datetime64[D]", "name": "object"}
+    assert all(len(values) == 0 for values in columns.values())
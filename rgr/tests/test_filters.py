@@ -0,0 +1,69 @@
+import pytest
+
+from common.filters import And, Comparison, Filter, In, Like, Not, Or, Range, Raw, check_identifier, from_dict
+
+FILTERS = [
+    Raw("sum > 5"),
+    Comparison("sum", ">", 5),
+    Comparison("description", "=", None),
+    Range("date", "2020-01-01", "2020-12-31"),
+    In("company_id", [1, 2, 3]),
+    Like("name", "%shop%", case_sensitive=False),
+    And(Comparison("sum", ">=", 10), Or(In("pay_system_id", [1]), Not(Like("description", "a%")))),
+]
+
+
+def test_compile():
+    assert Comparison("tbl_order.sum", "<=", 5).compile() == ("tbl_order.sum <= %s", [5])
+    assert Range("date", "2020-01-01", "2020-12-31").compile() == ("date BETWEEN %s AND %s", ["2020-01-01", "2020-12-31"])
+    assert In("company_id", (1, 2)).compile() == ("company_id = ANY(%s)", [[1, 2]])
+    assert Like("name", "a%", case_sensitive=False).compile() == ("name ILIKE %s", ["a%"])
+
+
+def test_compile_null_comparisons():
+    assert Comparison("description", "=", None).compile() == ("description IS NULL", [])
+    assert Comparison("description", "!=", None).compile() == ("description IS NOT NULL", [])
+
+
+def test_compile_groups_in_order():
+    condition = And(Comparison("sum", ">", 1), Or(Comparison("sum", "<", 2), Not(In("id", [3]))))
+    assert condition.compile() == ("(sum > %s) AND ((sum < %s) OR (NOT (id = ANY(%s))))", [1, 2, [3]])
+    assert condition.columns() == {"sum", "id"}
+
+
+def test_raw_escapes_percent():
+    assert Raw("name LIKE 'a%'").compile() == ("name LIKE 'a%%'", [])
+
+
+def test_operators_combine():
+    condition = Comparison("sum", ">", 1) & Comparison("sum", "<", 2) | Comparison("id", "=", 3)
+    assert condition.compile() == ("((sum > %s) AND (sum < %s)) OR (id = %s)", [1, 2, 3])
+
+
+@pytest.mark.parametrize("condition", FILTERS, ids=lambda condition: type(condition).__name__)
+def test_round_trip(condition):
+    copy = from_dict(condition.to_dict())
+    assert type(copy) is type(condition)
+    assert copy.compile() == condition.compile()
+    assert copy.to_dict() == condition.to_dict()
+    assert repr(copy) == repr(condition)
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        check_identifier("sum; DROP TABLE tbl_order")
+    with pytest.raises(ValueError):
+        Comparison("sum", "LIKE", 1)
+    with pytest.raises(ValueError):
+        And()
+    with pytest.raises(ValueError):
+        from_dict({"type": "Exists"})
+
+
+def test_incomplete_filter_fails_on_creation():
+    class Half(Filter):
+        def compile(self):
+            return "TRUE", []
+
+    with pytest.raises(TypeError):
+        Half()
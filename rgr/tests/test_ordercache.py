@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from ordercache import COLUMNS, OrderCache
+
+
+def _chunk(sums) -> dict:
+    count = len(sums)
+    chunk = {
+        "id": np.arange(1, count + 1, dtype="int32"),
+        "company_id": np.ones(count, dtype="int32"),
+        "pay_system_id": np.ones(count, dtype="int32"),
+        "date": np.zeros(count, dtype="datetime64[D]"),
+    }
+    mask = [value is None for value in sums]
+    values = np.array([0.0 if value is None else value for value in sums])
+    chunk["sum"] = np.ma.MaskedArray(values, mask=mask) if any(mask) else values
+    return chunk
+
+
+def _fetch(monkeypatch, chunks) -> dict:
+    monkeypatch.setattr("ordercache.fetch_columns", lambda conn, query, params, chunk_size, on_chunk, *args: [on_chunk(chunk) for chunk in chunks])
+    return OrderCache(connect=None)._fetch(None, "true", ())
+
+
+def test_fetch_returns_plain_arrays(monkeypatch):
+    columns = _fetch(monkeypatch, [_chunk([1.5, 2.5]), _chunk([3.5])])
+    assert not any(isinstance(columns[name], np.ma.MaskedArray) for name in COLUMNS)
+    assert {name: str(columns[name].dtype) for name in COLUMNS} == COLUMNS
+    assert columns["sum"].tolist() == [1.5, 2.5, 3.5]
+
+
+def test_fetch_rejects_null_values(monkeypatch):
+    with pytest.raises(ValueError, match="tbl_order.sum"):
+        _fetch(monkeypatch, [_chunk([1.5, None])])
@@ -0,0 +1,49 @@
+from plans import compare, summarize
+
+
+def _plan(shape, cost=100.0, ms=10.0):
+    return {"fingerprint": str(hash(tuple(shape))), "shape": shape, "cost": cost, "ms": ms}
+
+
+def test_summarize_ignores_costs_in_the_fingerprint():
+    explained = {
+        "Plan": {
+            "Node Type": "Hash Join", "Join Type": "Inner", "Total Cost": 10.0, "Plan Rows": 5, "Actual Rows": 4,
+            "Plans": [{"Node Type": "Seq Scan", "Relation Name": "tbl_order", "Total Cost": 8.0}],
+        },
+        "Execution Time": 1.23456,
+    }
+    summary = summarize(explained)
+    assert summary["shape"] == ["Hash Join (Inner)", "  Seq Scan on tbl_order"]
+    assert summary["ms"] == 1.235
+    explained["Plan"]["Total Cost"] = 99.0
+    assert summarize(explained)["fingerprint"] == summary["fingerprint"]
+
+
+def test_compare_same_plan():
+    plan = _plan(["Seq Scan on tbl_order"])
+    assert compare({"report": plan}, {"report": dict(plan)}) == []
+
+
+def test_compare_new_plan():
+    plan = _plan(["Seq Scan on tbl_order"])
+    assert compare({}, {"report": plan}) == [("report", "new plan", "", plan["fingerprint"])]
+
+
+def test_compare_changed_nodes():
+    old = _plan(["Hash Join (Inner)", "  Index Scan using tbl_order_pkey on tbl_order"])
+    new = _plan(["Hash Join (Inner)", "  Seq Scan on tbl_order"])
+    assert compare({"report": old}, {"report": new}) == [
+        ("report", "plan", "Index Scan using tbl_order_pkey on tbl_order", "Seq Scan on tbl_order"),
+    ]
+
+
+def test_compare_cost_and_time():
+    old = _plan(["Seq Scan on tbl_order"], cost=100.0, ms=10.0)
+    assert compare({"report": old}, {"report": dict(old, cost=201.0)}) == [("report", "cost", "100.0", "201.0")]
+    assert compare({"report": old}, {"report": dict(old, ms=31.0)}) == [("report", "time", "10.0 ms", "31.0 ms")]
+
+
+def test_compare_ignores_small_time_growth():
+    old = _plan(["Seq Scan on tbl_order"], ms=1.0)
+    assert compare({"report": old}, {"report": dict(old, ms=4.0)}) == []
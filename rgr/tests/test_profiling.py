@@ -0,0 +1,117 @@
+import builtins
+import csv
+import os
+import pstats
+import time
+
+import pytest
+
+from profiling import PROFILE_MODES, ActionProfiler, StackSampler
+
+
+class FakeActivity:
+    # The profiler only reads the time the statements waited for the server
+    def __init__(self):
+        self.db_seconds = 0.0
+
+
+def _spin(seconds: float) -> int:
+    # Runs Python code, so the samples and the calls land in this function
+    end, count = time.perf_counter() + seconds, 0
+    while time.perf_counter() < end:
+        count += 1
+    return count
+
+
+@pytest.fixture
+def answers(monkeypatch):
+    # The user takes 0.2 seconds to answer every prompt
+    def slow_input(prompt=""):
+        time.sleep(0.2)
+        return "answer"
+
+    monkeypatch.setattr("builtins.input", slow_input)
+    return slow_input
+
+
+def test_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        ActionProfiler(str(tmp_path), FakeActivity(), mode="tracing")
+
+
+@pytest.mark.parametrize("mode", PROFILE_MODES)
+def test_action_splits_wall_cpu_and_database(tmp_path, answers, mode):
+    activity = FakeActivity()
+    profiler = ActionProfiler(str(tmp_path), activity, mode=mode, interval=0.001)
+    with profiler.action("report") as summary:
+        assert input("Enter left bound: ") == "answer"
+        _spin(0.1)
+        # A statement that waited 0.5 seconds for the server
+        activity.db_seconds += 0.5
+
+    # The prompt is not time of the action and the prompts are answered by the fake again
+    assert builtins.input is answers
+    assert 0.1 <= summary["wall"] < 0.3
+    assert 0 < summary["cpu"] <= summary["wall"] + 0.05
+    assert summary["database"] == 0.5
+    assert os.path.basename(summary["path"]).startswith("001-report.")
+    assert os.path.exists(summary["path"])
+
+
+def test_sampling_writes_collapsed_stacks(tmp_path, answers):
+    profiler = ActionProfiler(str(tmp_path), FakeActivity(), interval=0.001)
+    with profiler.action("find") as summary:
+        _spin(0.1)
+
+    assert summary["path"].endswith(".collapsed")
+    assert summary["hottest"].startswith("_spin (test_profiling.py:")
+    with open(summary["path"], encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    stacks = dict(line.rsplit(" ", 1) for line in lines)
+    assert all(int(samples) > 0 for samples in stacks.values())
+    # Every stack goes from the outermost frame to the innermost one
+    spinning = [stack.split(";") for stack in stacks if "_spin" in stack]
+    assert spinning and all(frames[-1].startswith("_spin (test_profiling.py:") for frames in spinning)
+    assert any("test_sampling_writes_collapsed_stacks" in frame for frame in spinning[0])
+
+
+def test_cprofile_writes_pstats(tmp_path, answers):
+    profiler = ActionProfiler(str(tmp_path), FakeActivity(), mode="cprofile")
+    with profiler.action("find") as summary:
+        _spin(0.05)
+
+    assert summary["path"].endswith(".prof")
+    assert summary["hottest"].startswith("_spin (test_profiling.py:")
+    functions = {function for _, _, function in pstats.Stats(summary["path"]).stats}
+    assert "_spin" in functions
+
+
+def test_sampler_leaves_out_idle_threads():
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    time.sleep(0.05)
+    stacks = sampler.stop()
+    # The main thread only sleeps in this test, the threads waiting on events or locks are not sampled
+    assert not any("threading.py" in stack.rsplit(";", 1)[-1] for stack in stacks)
+
+
+def test_summary_sums_the_actions_by_name(tmp_path, answers):
+    activity = FakeActivity()
+    profiler = ActionProfiler(str(tmp_path), activity, interval=0.001)
+    for name, seconds, database in (("report", 0.05, 0.02), ("find", 0.01, 0.0), ("report", 0.05, 0.03)):
+        with profiler.action(name):
+            _spin(seconds)
+            activity.db_seconds += database
+
+    rows = profiler.summary()
+    assert [row[:2] for row in rows] == [("report", 2), ("find", 1)]
+    report = rows[0]
+    assert report[2] == pytest.approx(sum(summary["wall"] for summary in profiler.summaries if summary["action"] == "report"), abs=0.002)
+    assert report[4] == 0.05
+    assert report[5] == round(report[4] / report[2], 3)
+
+    with open(tmp_path / "summary.csv", encoding="utf-8") as file:
+        written = list(csv.reader(file))
+    assert written[0] == ["action", "calls", "wall_s", "cpu_s", "database_s", "database_share"]
+    assert written[1:] == [[str(value) for value in row] for row in rows]
+    assert sorted(os.listdir(tmp_path)) == ["001-report.collapsed", "002-find.collapsed", "003-report.collapsed", "summary.csv"]
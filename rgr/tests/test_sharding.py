@@ -0,0 +1,22 @@
+from sharding import _merge_sums
+
+
+def test_merge_sums_adds_up_the_same_group():
+    results = [
+        [(1, "pay1", 2, 10.0), (2, "pay2", 1, 5.0)],
+        [(2, "pay2", 3, 7.5)],
+        [(1, "pay1", 1, 1.0), (3, "pay3", 4, 2.0)],
+    ]
+    assert _merge_sums(results) == [(1, "pay1", 3, 11.0), (2, "pay2", 4, 12.5), (3, "pay3", 4, 2.0)]
+
+
+def test_merge_sums_counts_only():
+    assert _merge_sums([[(2, "b", 1)], [(1, "a", 2), (2, "b", 5)]]) == [(1, "a", 2), (2, "b", 6)]
+
+
+def test_merge_sums_empty_shards():
+    assert _merge_sums([[], []]) == []
+
+
+def test_merge_sums_failed_shard():
+    assert _merge_sums([[(1, "a", 2)], None]) is None
@@ -0,0 +1,51 @@
+import csv
+import enum
+import io
+
+from common.upsert import NULL_MARKER, RowsReader, _csv_value
+
+
+class Gender(enum.Enum):
+    male = "Male"
+    female = "Female"
+
+
+def _read_all(reader: RowsReader, size: int) -> str:
+    data = ""
+    while True:
+        piece = reader.read(size)
+        if not piece:
+            return data
+        data += piece
+
+
+def test_null_is_unquoted():
+    assert _csv_value(None) == NULL_MARKER
+    # The string \N stays a string
+    assert _csv_value("\\N") == '"\\N"'
+
+
+def test_quotes_and_special_characters():
+    assert _csv_value('say "hi"') == '"say ""hi"""'
+    assert _csv_value("a,b\nc\td\\e") == '"a,b\nc\td\\e"'
+    assert _csv_value(3.5) == '"3.5"'
+
+
+def test_enums_by_name():
+    assert _csv_value(Gender.female) == '"female"'
+
+
+def test_arrays():
+    assert _csv_value(["a", None, 'q"b', "c,d"]) == '"{""a"",NULL,""q\\""b"",""c,d""}"'
+    assert _csv_value([[1, 2], [3, None]]) == '"{{""1"",""2""},{""3"",NULL}}"'
+    assert _csv_value([]) == '"{}"'
+
+
+def test_rows_reader_in_pieces():
+    rows = [(1, "x", None), (2, 'y "z"', Gender.male), (3, "multi\nline", ["t1", "t2"])]
+    reader = RowsReader(iter(rows))
+    data = _read_all(reader, 5)
+    assert reader.count == 3
+    assert data == _read_all(RowsReader(iter(rows)), -1)
+    parsed = list(csv.reader(io.StringIO(data)))
+    assert parsed == [["1", "x", "\\N"], ["2", 'y "z"', "male"], ["3", "multi\nline", '{"t1","t2"}']]
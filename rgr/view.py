@@ -1,5 +1,10 @@
 from tabulate import tabulate
 
+from common.filters import Comparison, Like, Range, check_identifier
+
+# The load pipelines of the random data generation, empty for none
+LOAD_PIPELINES = ("", "indexes", "staging")
+
 class View:
     def show_message(self, message):
         print(message)
@@ -84,33 +89,46 @@ class View:
         
         text_len = input("Enter length of text columns: ")
         text_len = int(text_len if text_len != "" else 0)
+
+        batch_size = input("Enter rows per batch (empty for one batch): ")
+        batch_size = int(batch_size) if batch_size != "" else None
+
+        # An unknown pipeline is asked again instead of ending the menu
+        pipeline = input("Enter load pipeline (empty for none, indexes, staging): ")
+        while pipeline not in LOAD_PIPELINES:
+            pipeline = input("Load pipeline must be empty, indexes or staging! Enter load pipeline: ")
         
-        return table, columns, data_types, parameters, rows_number, text_len
+        return table, columns, data_types, parameters, rows_number, text_len, batch_size, pipeline
     
     def get_find_input(self):
         table = input("Enter table name: ")
         
+        # A bad column name would fail the filter, so it is asked again
         column = input("Enter column name: ")
-        
-        condition = ""
+        while True:
+            try:
+                check_identifier(column)
+                break
+            except ValueError as e:
+                column = input(f"{e}. Enter column name: ")
+        
+        condition = None
         t = input("Enter search type (number, string, boolean, date): ")
         if t == "number":
             left = input("Enter left bound: ")
             right = input("Enter right bound: ")
-            condition = f"{column} BETWEEN {left} AND {right}"
+            condition = Range(column, left, right)
         elif t == "string":
             string = input("Enter regex string: ")
-            condition = f"{column} LIKE '%{string}%'"
+            condition = Like(column, f"%{string}%")
         elif t == "boolean":
             boolean = input("Enter boolean value (True, False): ")
-            condition = f"{column} = {boolean}"
+            condition = Comparison(column, "=", boolean)
         elif t == "date":
             left = input("Enter left bound (YYYY-MM-DD): ")
             right = input("Enter right bound (YYYY-MM-DD): ")
-            condition = f"{column} BETWEEN '{left}' AND '{right}'"
+            condition = Range(column, left, right)
         
-        if condition == "":
-            condition = None
         return table, column, condition
     
     def get_pay_systems_total_income_input(self):
@@ -118,6 +136,14 @@ class View:
         right = input("Enter right bound (last number): ")
         return left, right
     
+    def get_sample_input(self):
+        sample = input("Enter sample percent for an approximate answer ('auto' to fit 1 second). For exact answer leave empty: ")
+        if sample == "":
+            return None
+        if sample == "auto":
+            return sample
+        return float(sample)
+    
     def get_company_orders_thru_period_input(self):
         left = input("Enter left bound (starting date YYYY-MM-DD): ")
         right = input("Enter right bound (last date YYYY-MM-DD): ")
@@ -126,4 +152,82 @@ class View:
     def get_top_5_orders_total_price_input(self):
         company = input("Enter company name: ")
         return company
-    
\ No newline at end of file
+
+    def get_top_orders_per_company_input(self):
+        companies = input("Enter company names separated by comma. If all companies leave empty: ")
+        companies = [company.strip() for company in companies.split(",")] if companies != "" else None
+        
+        k = input("Enter number of orders per company (default 5): ")
+        k = int(k if k != "" else 5)
+        
+        order_by = input("Enter order column to rank by (default sum): ")
+        if order_by == "":
+            order_by = "sum"
+        return companies, k, order_by
+
+    def get_pay_systems_income_histogram_input(self):
+        ranges = input("Enter ranges as left,right separated by space. For equal-width buckets leave empty: ")
+        if ranges != "":
+            ranges = [tuple(float(bound) for bound in r.split(",")) for r in ranges.split()]
+            return ranges, None
+        
+        low = float(input("Enter low bound of buckets: "))
+        high = float(input("Enter high bound of buckets: "))
+        number = int(input("Enter number of buckets: "))
+        return None, (low, high, number)
+
+    def get_export_input(self):
+        table = input("Enter table name: ")
+        
+        columns = input("Enter columns separated by space. If all columns leave empty: ")
+        columns = columns.split() or None
+        
+        condition = input("Enter condition in postgres SQL (... WHERE [condition]). If not applicable leave empty: ")
+        if condition == "":
+            condition = None
+        
+        path = input("Enter file path: ")
+        
+        fmt = input("Enter file format (csv, parquet): ")
+        if fmt == "":
+            fmt = "csv"
+        
+        parallel = input("Enter number of parallel files (default 1): ")
+        parallel = int(parallel if parallel != "" else 1)
+        return table, columns, condition, path, fmt, parallel
+
+    def get_snapshot_input(self):
+        directory = input("Enter snapshot directory: ")
+        
+        workers = input("Enter number of workers (default 4): ")
+        workers = int(workers if workers != "" else 4)
+        return directory, workers
+
+    def get_purge_input(self):
+        table, condition = self.get_delete_input()
+        
+        batch_size = input("Enter batch size (default 10000): ")
+        batch_size = int(batch_size if batch_size != "" else 10000)
+        
+        archive_table = input("Enter archive table name. If not applicable leave empty: ")
+        if archive_table == "":
+            archive_table = None
+        
+        pause = input("Enter pause between batches in seconds (default 0): ")
+        pause = float(pause if pause != "" else 0)
+        return table, condition, batch_size, archive_table, pause
+
+    def get_table_sizes_input(self):
+        exact = input("Count rows exactly? (y/N): ")
+        return exact.strip().lower() == "y"
+
+    def get_top_statements_input(self):
+        limit = input("Enter number of statements (default 10): ")
+        return int(limit if limit != "" else 10)
+
+    def get_check_plans_input(self):
+        baseline = input("Enter baseline file path (default plans.json, created if missing): ")
+        if baseline == "":
+            baseline = "plans.json"
+        update = input("Replace the baseline with the current plans? (y/N): ").lower() == "y"
+        return baseline, update
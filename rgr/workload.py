@@ -0,0 +1,273 @@
+import argparse
+import datetime
+import decimal
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+# The modules shared by the apps are in the common package at the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from common.filters import Filter, from_dict
+
+# Model methods that are not recorded, they hand out connections or stop other calls
+SKIPPED_METHODS = ("connect", "cancel")
+
+
+def _encode(value):
+    # Values json can not write, arguments that can not be written make the record unreplayable
+    if isinstance(value, Filter):
+        return {"__filter__": value.to_dict()}
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"{type(value).__name__} can not be recorded")
+
+
+def _decode(data: dict):
+    if "__filter__" in data:
+        return from_dict(data["__filter__"])
+    if "__datetime__" in data:
+        return datetime.datetime.fromisoformat(data["__datetime__"])
+    if "__date__" in data:
+        return datetime.date.fromisoformat(data["__date__"])
+    if "__decimal__" in data:
+        return decimal.Decimal(data["__decimal__"])
+    return data
+
+
+def _size(result) -> Optional[int]:
+    # Rows of list results, 1 or 0 for True or False, None when the size is unknown
+    if isinstance(result, bool):
+        return int(result)
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class WorkloadRecorder:
+    """
+    This class is used to write the Model calls to a gzip-compressed log with one JSON record per line.
+
+    Every record holds the time of the call from the start of the recording, the method, its arguments,
+    its time in milliseconds, the size of its result and whether it succeeded. Filters, dates and decimals
+    are kept with their types. Calls with other arguments, e.g. iterators of rows, are written without
+    them and marked as not replayable. The log is flushed after every record, so it can be read while the
+    recording runs or after the program was stopped.
+    """
+
+    def __init__(self, path: str):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        path (str): The path of the log, new records are appended.
+        """
+        self.path = path
+        self.file = gzip.open(path, "ab")
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.records = 0
+
+    def record(self, method: str, args: tuple, kwargs: dict, start: float, seconds: float, result, ok: bool):
+        """
+        This method is used to write one call.
+
+        Parameters:
+        method (str): The name of the method.
+        args (tuple): The positional arguments of the call.
+        kwargs (dict): The keyword arguments of the call.
+        start (float): The time.perf_counter() value at the start of the call.
+        seconds (float): The time of the call.
+        result: The result of the call, only its size is written.
+        ok (bool): Whether the call succeeded.
+        """
+        entry = {
+            "at": round(start - self.started, 6),
+            "method": method,
+            "ms": round(seconds * 1000, 3),
+            "size": _size(result),
+            "ok": ok,
+        }
+        try:
+            line = json.dumps(dict(entry, args=list(args), kwargs=kwargs), default=_encode)
+        except (TypeError, ValueError):
+            line = json.dumps(dict(entry, replayable=False))
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line.encode("utf-8") + b"\n")
+            self.file.flush(zlib.Z_SYNC_FLUSH)
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingModel:
+    """
+    This class is a proxy of a Model that records every call of its public methods.
+
+    Attributes and the skipped methods are passed through unchanged. Calls the Model makes to itself are
+    not recorded, so the log holds what the callers asked for.
+    """
+
+    def __init__(self, model, recorder: WorkloadRecorder):
+        """
+        This is the constructor method for the class.
+
+        Parameters:
+        model (Model): The model whose calls are recorded.
+        recorder (WorkloadRecorder): The recorder the calls are written to.
+        """
+        self.model = model
+        self.recorder = recorder
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.model, name)
+        if name.startswith("_") or name in SKIPPED_METHODS or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            result, ok = None, False
+            try:
+                result = attribute(*args, **kwargs)
+                ok = result is not None and result is not False
+                return result
+            finally:
+                self.recorder.record(name, args, kwargs, start, time.perf_counter() - start, result, ok)
+
+        return call
+
+
+def read_workload(path: str) -> Iterator[dict]:
+    """
+    This function is used to read the records of a workload log.
+
+    A log whose recording was stopped without closing it is read up to its last complete record.
+
+    Parameters:
+    path (str): The path of the log.
+
+    Returns:
+    records (iterator): The records, with their filters, dates and decimals restored.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                if line.endswith("\n"):
+                    yield json.loads(line, object_hook=_decode)
+        except EOFError:
+            return
+
+
+def replay(model, path: str, speed: float = 1.0, workers: int = 4, methods: Optional[List[str]] = None) -> Dict[str, dict]:
+    """
+    This function is used to run the calls of a workload log again against a model.
+
+    Every call is started at its recorded time divided by speed, on one of the workers. A call whose worker
+    is not free yet starts late, the delay is reported as lag. Speed 0 starts every call as soon as a worker is free.
+
+    Parameters:
+    model (Model): The model the calls are run on, e.g. connected to a test database.
+    path (str): The path of the log.
+    speed (float, optional): How many times faster than recorded the calls are started. Defaults to 1.0.
+    workers (int, optional): The number of calls that run at once. Defaults to 4.
+    methods (list, optional): The methods that are replayed, all if None. Defaults to None.
+
+    Returns:
+    summary (dict): For every method the number of calls and failures, the calls per second and the p50,
+        p95, p99 and max latency and the p95 lag in milliseconds, with the totals under "total".
+    """
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = {}
+    lags: Dict[str, List[float]] = {}
+    failures: Dict[str, int] = {}
+    skipped = 0
+
+    def run(record: dict, due: float):
+        name = record["method"]
+        start = time.perf_counter()
+        try:
+            result = getattr(model, name)(*record["args"], **record["kwargs"])
+            ok = result is not None and result is not False
+        except Exception as e:
+            print(f"Error: Invalid {name} replay\n", e)
+            ok = False
+        seconds = time.perf_counter() - start
+        with lock:
+            latencies.setdefault(name, []).append(seconds)
+            lags.setdefault(name, []).append(max(0.0, start - due))
+            failures[name] = failures.get(name, 0) + (not ok)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for record in read_workload(path):
+            if not record.get("replayable", True) or (methods is not None and record["method"] not in methods):
+                skipped += 1
+                continue
+            due = started + (record["at"] / speed if speed > 0 else 0.0)
+            time.sleep(max(0.0, due - time.perf_counter()))
+            executor.submit(run, record, due)
+    elapsed = time.perf_counter() - started
+
+    summary = {}
+    latencies["total"] = [seconds for name in list(latencies) for seconds in latencies[name]]
+    lags["total"] = [seconds for name in list(lags) for seconds in lags[name]]
+    failures["total"] = sum(failures.values())
+    for name, values in latencies.items():
+        values.sort()
+        if not values:
+            continue
+        summary[name] = {
+            "calls": len(values),
+            "failed": failures[name],
+            "per_second": round(len(values) / elapsed, 2),
+            "p50_ms": round(_percentile(values, 0.5) * 1000, 2),
+            "p95_ms": round(_percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "lag_p95_ms": round(_percentile(sorted(lags[name]), 0.95) * 1000, 2),
+        }
+    if "total" in summary:
+        summary["total"]["skipped"] = skipped
+    return summary
+
+
+if __name__ == "__main__":
+    from main import DB_NAME, HOST, PASSWORD, USER
+    from model import Model
+
+    parser = argparse.ArgumentParser(description="Replay a workload log against a database")
+    parser.add_argument("path", help="the workload log")
+    parser.add_argument("--speed", type=float, default=1.0, help="how many times faster than recorded, 0 for no waits")
+    parser.add_argument("--workers", type=int, default=4, help="the number of calls that run at once")
+    parser.add_argument("--methods", nargs="*", help="the methods to replay, all if omitted")
+    parser.add_argument("--db", default=DB_NAME, help="the database to replay against")
+    parser.add_argument("--host", default=HOST, help="the host of the database, optionally host:port")
+    options = parser.parse_args()
+
+    summary = replay(Model(options.db, USER, PASSWORD, options.host), options.path, options.speed, options.workers, options.methods)
+    columns = ["calls", "failed", "per_second", "p50_ms", "p95_ms", "p99_ms", "max_ms", "lag_p95_ms"]
+    print(f"{'method':<32}" + "".join(f"{column:>12}" for column in columns))
+    for name, row in summary.items():
+        print(f"{name:<32}" + "".join(f"{row[column]:>12}" for column in columns))
+    if "total" in summary:
+        print(f"{summary['total']['skipped']} calls skipped")
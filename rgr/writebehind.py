@@ -0,0 +1,197 @@
+import atexit
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+# Markers put into the queue next to the rows
+_FLUSH = object()
+_STOP = object()
+# The time in seconds between two checks that the background thread is alive while waiting for it
+_POLL = 0.1
+
+
+class WriteBehindQueue:
+    """
+    This class is used to buffer single-row inserts and write them in the background as multi-row inserts.
+
+    Rows are grouped by table and columns. A group is written when it has batch_size rows or when its oldest
+    row has waited flush_interval seconds, which is checked after every row, so a busy table does not hold
+    back the rows of a quiet one. Every write is one INSERT ... VALUES statement and one commit on a
+    connection kept by the background thread. If the background thread dies, put() and flush() stop waiting
+    and fail, the exception is kept in error.
+    """
+
+    def __init__(self, connect: Callable, batch_size: int = 500, flush_interval: float = 1.0, max_pending: int = 10000,
+                 put_timeout: Optional[float] = None, on_error: Optional[Callable[[str, Tuple[str, ...], List[tuple], Exception], None]] = None):
+        """
+        This is the constructor method for the class. It starts the background thread and registers close() to run on exit.
+
+        Parameters:
+        connect (callable): The function returning a new (connection, cursor) pair, e.g. Model.connect.
+        batch_size (int, optional): The number of rows of one table written at once. Defaults to 500.
+        flush_interval (float, optional): The longest time in seconds a row waits in the buffer. Defaults to 1.0.
+        max_pending (int, optional): The number of rows the queue holds before put() blocks. Defaults to 10000.
+        put_timeout (float, optional): The time in seconds put() waits for space in a full queue. Defaults to None, which waits forever.
+        on_error (callable, optional): The function called with (table, columns, rows, exception) for rows that could not be written.
+            Defaults to None, which prints the error.
+        """
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.on_error = on_error
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.stats = {"queued": 0, "written": 0, "failed": 0, "flushes": 0}
+        self.lock = threading.Lock()
+        self.conn = None
+        self.closed = False
+        self.error: Optional[BaseException] = None
+
+        self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def put(self, table: str, columns: list, values: list) -> bool:
+        """
+        This method is used to add a row to the buffer.
+
+        Parameters:
+        table (str): The name of the table where the row will be inserted.
+        columns (list): The names of the columns.
+        values (list): The values of the columns.
+
+        Returns:
+        bool: True if the row was queued, False if the queue is closed, stayed full for put_timeout seconds
+            or its background thread died.
+        """
+        if self.closed:
+            return False
+        if not self._enqueue((table, tuple(columns), tuple(values)), self.put_timeout):
+            return False
+        self._count(queued=1)
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        This method is used to write every buffered row and wait until it is written.
+
+        Parameters:
+        timeout (float, optional): The time in seconds to wait. Defaults to None, which waits forever.
+
+        Returns:
+        bool: True if the buffer was written in time, False otherwise.
+        """
+        done = threading.Event()
+        end = None if timeout is None else time.monotonic() + timeout
+        if not self._enqueue((_FLUSH, done, None), timeout):
+            return False
+        while self.thread.is_alive():
+            if done.wait(_POLL if end is None else max(0.0, min(_POLL, end - time.monotonic()))):
+                return True
+            if end is not None and time.monotonic() >= end:
+                return False
+        return done.is_set()
+
+    def close(self):
+        """
+        This method is used to write every buffered row and stop the background thread.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.thread.is_alive():
+            self.queue.put((_STOP, None, None))
+            self.thread.join()
+        atexit.unregister(self.close)
+
+    def _enqueue(self, item: tuple, timeout: Optional[float]) -> bool:
+        # Only the background thread empties a full queue, so the wait ends when it dies
+        end = None if timeout is None else time.monotonic() + timeout
+        while self.thread.is_alive():
+            wait = _POLL if end is None else min(_POLL, end - time.monotonic())
+            if wait <= 0:
+                return False
+            try:
+                self.queue.put(item, timeout=wait)
+                return True
+            except queue.Full:
+                continue
+        print("Error: Invalid write-behind insert\n", f"The background thread stopped: {self.error!r}")
+        return False
+
+    def _count(self, **increments: int):
+        with self.lock:
+            for name, increment in increments.items():
+                self.stats[name] += increment
+
+    def _run(self):
+        try:
+            self._loop()
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            if self.conn is not None:
+                self.conn.close()
+
+    def _loop(self):
+        batches: Dict[Tuple[str, Tuple[str, ...]], List[tuple]] = {}
+        # The time every group has to be written by, set by its oldest row
+        deadlines: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+        while True:
+            timeout = max(0.0, min(deadlines.values()) - time.monotonic()) if deadlines else None
+            try:
+                table, columns, values = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                table = None
+
+            if table is _FLUSH or table is _STOP:
+                for key in list(batches):
+                    deadlines.pop(key)
+                    self._write(key, batches.pop(key))
+                if table is _FLUSH:
+                    columns.set()
+                    continue
+                break
+
+            if table is not None:
+                key = (table, columns)
+                if key not in batches:
+                    deadlines[key] = time.monotonic() + self.flush_interval
+                batch = batches.setdefault(key, [])
+                batch.append(values)
+                if len(batch) >= self.batch_size:
+                    deadlines.pop(key)
+                    self._write(key, batches.pop(key))
+
+            now = time.monotonic()
+            for key in [key for key, deadline in deadlines.items() if deadline <= now]:
+                deadlines.pop(key)
+                self._write(key, batches.pop(key))
+
+    def _write(self, key: Tuple[str, Tuple[str, ...]], rows: List[tuple]):
+        table, columns = key
+        try:
+            if self.conn is None or self.conn.closed:
+                self.conn, cur = self.connect()
+                if self.conn is None or cur is None:
+                    raise ConnectionError("Unable to connect to the database")
+                cur.close()
+            with self.conn.cursor() as cur:
+                execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows, page_size=len(rows))
+            self.conn.commit()
+            self._count(written=len(rows), flushes=1)
+        except Exception as e:
+            self._count(failed=len(rows))
+            if self.conn is not None and not self.conn.closed:
+                try:
+                    self.conn.rollback()
+                except Exception:
+                    self.conn.close()
+            if self.on_error is not None:
+                self.on_error(table, columns, rows, e)
+            else:
+                print(f"Error: Invalid write-behind insert of {len(rows)} rows into {table}\n", e)